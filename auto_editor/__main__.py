@@ -83,6 +83,13 @@ class Args:
     # Misc.
     config: bool = False
     no_cache: bool = False
+    cache_dir: str | None = None
+    cache_size: int = 1 << 30
+    cache_hash: bool = False
+    cache_audio: bool = False
+    analysis_workers: int = 1
+    render_workers: int = 1
+    smart_render: bool = False
     no_open: bool = False
     temp_dir: str | None = None
     player: str | None = None
@@ -112,6 +119,30 @@ def main_options(parser: ArgumentParser) -> ArgumentParser:
             raise CoerceError(f"'{val}': Resolution takes two numbers")
         return natural(vals[0]), natural(vals[1])
 
+    def workers(val: str) -> int:
+        num = natural(val)
+        if num < 1:
+            raise CoerceError(f"'{val}': Must be at least 1.")
+        return num
+
+    def cache_size(val: str) -> int:
+        num, unit = split_num_str(val)
+        shifts = {
+            "": 0,
+            "B": 0,
+            "K": 10,
+            "KiB": 10,
+            "M": 20,
+            "MiB": 20,
+            "G": 30,
+            "GiB": 30,
+        }
+        if unit not in shifts:
+            raise CoerceError(f"Unknown unit: '{unit}'")
+        if num < 0:
+            raise CoerceError(f"'{val}': Size cannot be negative.")
+        return int(num * (1 << shifts[unit]))
+
     def sample_rate(val: str) -> int:
         num, unit = split_num_str(val)
         if unit in {"kHz", "KHz"}:
@@ -328,6 +359,17 @@ def main_options(parser: ArgumentParser) -> ArgumentParser:
         flag=True,
         help="Disable file seeking when rendering video. Helpful for debugging desync issues",
     )
+    parser.add_argument(
+        "--smart-render",
+        flag=True,
+        help="Copy video between cuts instead of re-encoding it. Frames from a cut to the next keyframe are re-encoded with CRF 16. Only for timelines that just cut one H.264 input",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=workers,
+        metavar="NAT",
+        help="Split the video into NAT parts that are rendered in parallel, then joined",
+    )
     parser.add_text("Audio Rendering:")
     parser.add_argument(
         "--audio-codec",
@@ -364,6 +406,31 @@ def main_options(parser: ArgumentParser) -> ArgumentParser:
     parser.add_argument(
         "--no-cache", flag=True, help="Don't look for or write a cache file"
     )
+    parser.add_argument(
+        "--cache-dir", metavar="PATH", help="Set where analysis results are cached"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=cache_size,
+        metavar="BYTES",
+        help="Set how large the cache can grow before the least recently used entries are removed",
+    )
+    parser.add_argument(
+        "--cache-hash",
+        flag=True,
+        help="Identify inputs by a hash of their contents instead of their name and modification time",
+    )
+    parser.add_argument(
+        "--cache-audio",
+        flag=True,
+        help="Also cache the audio decoded during analysis, so rendering doesn't decode it again",
+    )
+    parser.add_argument(
+        "--analysis-workers",
+        type=workers,
+        metavar="NAT",
+        help="Split audio and motion analysis of each input across NAT processes",
+    )
     parser.add_argument(
         "--no-open", flag=True, help="Do not open the output file after editing is done"
     )
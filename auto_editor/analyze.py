@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import os
 import re
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from fractions import Fraction
 from hashlib import sha1
 from math import ceil
-from tempfile import gettempdir
+from shutil import copyfileobj
+from tempfile import TemporaryFile
 from typing import TYPE_CHECKING
 
 import av
@@ -14,20 +16,22 @@ import numpy as np
 from av.audio.fifo import AudioFifo
 from av.subtitles.subtitle import AssSubtitle
 
-from auto_editor import __version__
+from auto_editor.utils.runs import mut_fill_runs, run_lengths, run_starts
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator, Sequence
+    from collections.abc import Callable, Iterable, Iterator, Sequence
     from fractions import Fraction
+    from typing import IO, Any
 
     from numpy.typing import NDArray
 
     from auto_editor.ffwrapper import FileInfo
     from auto_editor.utils.bar import Bar
+    from auto_editor.utils.cache import Cache
     from auto_editor.utils.log import Log
 
 
-__all__ = ("LevelError", "initLevels", "iter_audio", "iter_motion")
+__all__ = ("LevelError", "initLevels", "iter_audio", "iter_audio_blocks", "iter_motion")
 
 
 class LevelError(Exception):
@@ -37,141 +41,634 @@ class LevelError(Exception):
 def mut_remove_small(
     arr: NDArray[np.bool_], lim: int, replace: int, with_: int
 ) -> None:
-    start_p = 0
-    active = False
-    for j, item in enumerate(arr):
-        if item == replace:
-            if not active:
-                start_p = j
-                active = True
-
-            if j == len(arr) - 1 and j - start_p < lim:
-                arr[start_p:] = with_
-        elif active:
-            if j - start_p < lim:
-                arr[start_p:j] = with_
-            active = False
+    starts = run_starts(arr)
+    if len(starts) == 0:
+        return
+
+    lengths = run_lengths(arr, starts)
+    mask = arr[starts] == replace
+    small = lengths < lim
+    # A trailing run is measured to its last index, not one past it.
+    small[-1] = lengths[-1] <= lim
+    mut_fill_runs(arr, lengths, mask & small, with_)
 
 
 def mut_remove_large(
     arr: NDArray[np.bool_], lim: int, replace: int, with_: int
 ) -> None:
-    start_p = 0
-    active = False
-    for j, item in enumerate(arr):
-        if item == replace:
-            if not active:
-                start_p = j
-                active = True
-
-            if j == len(arr) - 1 and j - start_p >= lim:
-                arr[start_p:] = with_
-        elif active:
-            if j - start_p > lim:
-                arr[start_p:j] = with_
-            active = False
+    starts = run_starts(arr)
+    if len(starts) == 0:
+        return
+
+    lengths = run_lengths(arr, starts)
+    mask = arr[starts] == replace
+    mut_fill_runs(arr, lengths, mask & (lengths > lim), with_)
+
+
+def tick_bounds(first: int, last: int, exact_size: Fraction) -> NDArray[np.int64]:
+    """
+    Return the sample index where each tick in `first..last` begins.
+
+    Tick `k` would be sized `round(exact_size + accumulated_error)`, which makes
+    its start the nearest integer to `k * exact_size`. Python's `round` breaks
+    ties to even, so a tie is settled by the size of the tick it finishes.
+    """
+    num, den = exact_size.numerator, exact_size.denominator
+    ks = np.arange(first, last + 1, dtype=np.int64)
+
+    twice = 2 * ks * num
+    bounds = (twice + den) // (2 * den)
+    ties = np.flatnonzero(twice % (2 * den) == den)
+    if len(ties):
+        k = ks[ties]
+        floor = k * num // den
+        # A tick right after a tie is never a tie itself.
+        prev = (2 * (k - 1) * num + den) // (2 * den)
+        bounds[ties] = floor + ((floor - prev) & 1)
+
+    return bounds
+
+
+class AudioReducer:
+    """Turn decoded frames of one audio stream into per-tick peak levels."""
+
+    __slots__ = (
+        "fifo",
+        "resampler",
+        "exact_size",
+        "min_size",
+        "block_size",
+        "tick",
+        "consumed",
+    )
+
+    def __init__(self, audio_stream: av.AudioStream, tb: Fraction):
+        sr = audio_stream.rate
+        self.fifo = AudioFifo()
+        # Resample so that audio data is between [-1, 1]
+        self.resampler = av.AudioResampler(
+            av.AudioFormat("flt"), audio_stream.layout, sr
+        )
+        self.exact_size = Fraction(sr) / tb
+        self.min_size = ceil(self.exact_size)
+        self.block_size = max(self.min_size, sr * 4)
+        self.tick = 0
+        self.consumed = 0
 
+    @property
+    def samples(self) -> int:
+        return self.consumed + self.fifo.samples
 
-def iter_audio(audio_stream: av.AudioStream, tb: Fraction) -> Iterator[np.float32]:
-    fifo = AudioFifo()
-    sr = audio_stream.rate
+    def push(self, frame: av.AudioFrame, skip: int = 0) -> NDArray[np.float32] | None:
+        frame.pts = None  # Skip time checks
+        for reframe in self.resampler.resample(frame):
+            if skip > 0:
+                # Drop the leading samples that come before `consumed`.
+                arr = reframe.to_ndarray()
+                channels = arr.shape[1] // reframe.samples
+                layout, trimmed = reframe.layout.name, min(skip, reframe.samples)
+                skip -= trimmed
+                if trimmed == reframe.samples:
+                    continue
+                reframe = av.AudioFrame.from_ndarray(
+                    arr[:, trimmed * channels :], format="flt", layout=layout
+                )
+                reframe.rate = self.resampler.rate
+            self.fifo.write(reframe)
 
-    exact_size = (1 / tb) * sr
-    accumulated_error = Fraction(0)
+        if self.fifo.samples >= self.block_size:
+            return self.read_block()
+        return None
 
-    # Resample so that audio data is between [-1, 1]
-    resampler = av.AudioResampler(av.AudioFormat("flt"), audio_stream.layout, sr)
+    def read_block(self) -> NDArray[np.float32] | None:
+        fifo, min_size, exact_size = self.fifo, self.min_size, self.exact_size
+        if fifo.samples < min_size:
+            return None
+
+        available = self.consumed + fifo.samples
+        # Ticks are emitted while a whole `min_size` remains past their start.
+        last = (available - min_size) * exact_size.denominator // exact_size.numerator
+        bounds = tick_bounds(self.tick, last + 2, exact_size)
+        count = int(np.count_nonzero(bounds[:-1] + min_size <= available))
+
+        audio_chunk = fifo.read(int(bounds[count] - self.consumed))
+        assert audio_chunk is not None
+        arr = np.abs(audio_chunk.to_ndarray().ravel())
+        channels = len(arr) // audio_chunk.samples
+
+        self.tick += count
+        self.consumed = int(bounds[count])
+        return np.maximum.reduceat(arr, (bounds[:count] - bounds[0]) * channels)
+
+
+def pcm_name(source: str, stream: int, rate: int) -> str:
+    """Name the cache entry that holds the decoded samples of an audio stream."""
+    key = f"{source}:{stream},{rate}"
+    return f"{sha1(key.encode()).hexdigest()[:16]}pcm"
+
+
+class PcmWriter:
+    """
+    Keep the samples of one audio stream the way the renderer reads them: 16-bit
+    stereo at `rate`, sample n at n / rate seconds. They are put in the cache as
+    a planar (2, samples) array that can be memory-mapped.
+
+    Each channel is spooled to its own temporary file, so long streams are never
+    held in memory.
+    """
+
+    __slots__ = ("resampler", "rate", "channels", "samples", "skip")
+
+    def __init__(self, rate: int):
+        self.resampler = av.AudioResampler(format="s16p", layout="stereo", rate=rate)
+        self.rate = rate
+        self.channels = [TemporaryFile(), TemporaryFile()]
+        self.samples = 0
+        # Samples to drop before the stream's time 0, found from the first frame.
+        self.skip: int | None = None
+
+    def push(self, frame: av.AudioFrame) -> None:
+        if self.skip is None:
+            start = round((frame.time or 0) * self.rate)
+            self.skip = max(-start, 0)
+            if start > 0:
+                self.write(np.zeros((2, start), dtype=np.int16))
+        for resampled in self.resampler.resample(frame):
+            self.write(resampled.to_ndarray())
+
+    def write(self, data: np.ndarray) -> None:
+        if self.skip:
+            trimmed = min(self.skip, data.shape[1])
+            self.skip -= trimmed
+            data = data[:, trimmed:]
+        for f, channel in zip(self.channels, data):
+            f.write(channel.tobytes())
+        self.samples += data.shape[1]
+
+    def close(self, cache: Cache, name: str) -> None:
+        if self.skip is not None:
+            for resampled in self.resampler.resample(None):
+                self.write(resampled.to_ndarray())
+
+        def write(f: IO) -> None:
+            header = {
+                "descr": np.dtype(np.int16).str,
+                "fortran_order": False,
+                "shape": (2, self.samples),
+            }
+            np.lib.format.write_array_header_1_0(f, header)
+            for channel in self.channels:
+                channel.seek(0)
+                copyfileobj(channel, f)
+
+        cache.put_file(name, write)
+        for channel in self.channels:
+            channel.close()
+
+
+def iter_audio_blocks(
+    audio_stream: av.AudioStream, tb: Fraction
+) -> Iterator[NDArray[np.float32]]:
+    reducer = AudioReducer(audio_stream, tb)
 
     container = audio_stream.container
     assert isinstance(container, av.container.InputContainer)
 
     for frame in container.decode(audio_stream):
-        frame.pts = None  # Skip time checks
+        if (block := reducer.push(frame)) is not None:
+            yield block
 
-        for reframe in resampler.resample(frame):
-            fifo.write(reframe)
+    if (block := reducer.read_block()) is not None:
+        yield block
 
-        while fifo.samples >= ceil(exact_size):
-            size_with_error = exact_size + accumulated_error
-            current_size = round(size_with_error)
-            accumulated_error = size_with_error - current_size
 
-            audio_chunk = fifo.read(current_size)
-            assert audio_chunk is not None
-            arr = audio_chunk.to_ndarray().flatten()
-            yield np.max(np.abs(arr))
+def iter_audio(audio_stream: av.AudioStream, tb: Fraction) -> Iterator[np.float32]:
+    for block in iter_audio_blocks(audio_stream, tb):
+        yield from block
+
+
+def iter_audio_multi(
+    container: av.container.InputContainer,
+    audio_streams: Sequence[av.AudioStream],
+    reducers: Sequence[AudioReducer],
+    writers: Sequence[PcmWriter | None] = (),
+) -> Iterator[tuple[int, NDArray[np.float32]]]:
+    """
+    Demux `container` once, feeding every stream in `audio_streams` to the
+    reducer, and writer if any, at the same position. Yields `(position, block)`
+    pairs.
+    """
+    positions = {stream.index: i for i, stream in enumerate(audio_streams)}
+
+    for packet in container.demux(*audio_streams):
+        i = positions[packet.stream.index]
+        writer = writers[i] if writers else None
+        for frame in packet.decode():
+            assert isinstance(frame, av.AudioFrame)
+            if writer is not None:
+                writer.push(frame)
+            if (block := reducers[i].push(frame)) is not None:
+                yield i, block
+
+    for i, reducer in enumerate(reducers):
+        if (block := reducer.read_block()) is not None:
+            yield i, block
+
+
+# Packets at each end of a stream that are decoded instead of trusting their
+# duration. Encoder priming and padding only touch the first and last few.
+EDGE_PACKETS = 32
+
+
+def decoded_samples(audio_stream: av.AudioStream) -> int:
+    container = audio_stream.container
+    assert isinstance(container, av.container.InputContainer)
+    container.seek(0)
+    return sum(frame.samples for frame in container.decode(audio_stream))
 
 
-def iter_motion(
-    video: av.VideoStream, tb: Fraction, blur: int, width: int
-) -> Iterator[np.float32]:
-    video.thread_type = "AUTO"
+def frame_samples(frames: Iterable[object]) -> int:
+    return sum(f.samples for f in frames if isinstance(f, av.AudioFrame))
 
-    prev_frame = None
-    current_frame = None
-    total_pixels = None
-    index = 0
-    prev_index = -1
-
-    graph = av.filter.Graph()
-    graph.link_nodes(
-        graph.add_buffer(template=video),
-        graph.add("scale", f"{width}:-1"),
-        graph.add("format", "gray"),
-        graph.add("gblur", f"sigma={blur}"),
-        graph.add("buffersink"),
-    ).configure()
 
-    container = video.container
+def audio_samples(audio_stream: av.AudioStream) -> int:
+    """
+    Count the samples `iter_audio_blocks` will read, mostly from packet durations.
+
+    Only the first and last `EDGE_PACKETS` are decoded. Falls back to decoding
+    everything when durations or timestamps are missing, or seeking misses.
+    """
+    container = audio_stream.container
     assert isinstance(container, av.container.InputContainer)
 
-    for unframe in container.decode(video):
-        if unframe.pts is None:
+    if audio_stream.time_base is None:
+        return decoded_samples(audio_stream)
+    scale = audio_stream.time_base * audio_stream.rate
+    container.seek(0)
+
+    head = 0
+    pts: list[int] = []
+    durations: list[int] = []
+    for packet in container.demux(audio_stream):
+        if packet.size == 0:
+            # Flush whatever the decoder still holds of the head.
+            if len(pts) <= EDGE_PACKETS:
+                head += frame_samples(packet.decode())
+            continue
+        if packet.pts is None or not packet.duration:
+            return decoded_samples(audio_stream)
+
+        if len(pts) < EDGE_PACKETS:
+            head += frame_samples(packet.decode())
+        elif len(pts) == EDGE_PACKETS:
+            head += frame_samples(audio_stream.codec_context.decode())
+        pts.append(packet.pts)
+        durations.append(packet.duration)
+
+    if len(pts) <= EDGE_PACKETS:
+        return head
+    if len(pts) < EDGE_PACKETS * 3:
+        return decoded_samples(audio_stream)
+
+    middle = sum(durations[EDGE_PACKETS:-EDGE_PACKETS]) * scale
+    if middle.denominator != 1:
+        return decoded_samples(audio_stream)
+
+    # The packets before the tail are decoded too, but only to warm up.
+    tail_start = pts[-EDGE_PACKETS]
+    container.seek(pts[-EDGE_PACKETS * 2], stream=audio_stream)
+    tail = 0
+    landed: int | None = None
+    for packet in container.demux(audio_stream):
+        if packet.size == 0:
+            tail += frame_samples(packet.decode())
             continue
+        if packet.pts is None:
+            return decoded_samples(audio_stream)
+        if landed is None:
+            landed = packet.pts
+            if landed >= tail_start:
+                # Seeking overshot, so nothing before the tail warmed up.
+                return decoded_samples(audio_stream)
+
+        frames = packet.decode()
+        if packet.pts >= tail_start:
+            tail += frame_samples(frames)
+
+    return head + int(middle) + tail
+
+
+def tick_count(samples: int, exact_size: Fraction) -> int:
+    """Return how many ticks `AudioReducer` emits for `samples` samples."""
+    min_size = ceil(exact_size)
+    if samples < min_size:
+        return 0
+
+    num, den = exact_size.numerator, exact_size.denominator
+    first = max((samples - min_size) * den // num - 1, 0)
+    bounds = tick_bounds(first, first + 3, exact_size)
+    return first + int(np.count_nonzero(bounds + min_size <= samples))
+
+
+# Audio levels are analyzed and cached once per millisecond, then pooled to
+# whatever timebase is asked for.
+ENVELOPE_TB = Fraction(1000)
+
+
+def pool_levels(
+    envelope: NDArray[np.float32], samples: int, rate: int, tb: Fraction
+) -> NDArray[np.float32]:
+    """
+    Turn levels at `ENVELOPE_TB` into levels at `tb`, where every tick takes
+    the loudest envelope tick it overlaps.
+    """
+    exact_size = Fraction(rate) / tb
+    count = tick_count(samples, exact_size)
+    if count == 0 or len(envelope) == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    ticks = tick_bounds(0, count, exact_size)
+    bounds = tick_bounds(0, len(envelope), Fraction(rate) / ENVELOPE_TB)
+    last_index = len(envelope) - 1
+
+    # The envelope ticks holding the first and the last sample of each tick.
+    first = np.minimum(np.searchsorted(bounds, ticks[:-1], "right") - 1, last_index)
+    last = np.minimum(np.searchsorted(bounds, ticks[1:], "left") - 1, last_index)
+
+    levels = np.maximum.reduceat(envelope[: last[-1] + 1], first)
+    # `reduceat` stops short of the envelope tick a boundary falls inside.
+    straddles = last[:-1] == first[1:]
+    levels[:-1][straddles] = np.maximum(
+        levels[:-1][straddles], envelope[first[1:][straddles]]
+    )
+    return levels
+
+
+class MotionReducer:
+    """Turn decoded frames of one video stream into per-tick motion levels."""
+
+    __slots__ = ("graph", "tb", "prev_frame", "prev_index", "total_pixels")
+
+    def __init__(self, video: av.VideoStream, tb: Fraction, blur: int, width: int):
+        self.graph = av.filter.Graph()
+        self.graph.link_nodes(
+            self.graph.add_buffer(template=video),
+            self.graph.add("scale", f"{width}:-1"),
+            self.graph.add("format", "gray"),
+            self.graph.add("gblur", f"sigma={blur}"),
+            self.graph.add("buffersink"),
+        ).configure()
+        self.tb = tb
+        self.prev_frame: np.ndarray | None = None
+        self.prev_index = -1
+        self.total_pixels: int | None = None
+
+    def push(self, unframe: av.VideoFrame) -> NDArray[np.float32] | None:
+        if unframe.pts is None:
+            return None
 
-        graph.push(unframe)
-        frame = graph.vpull()
+        self.graph.push(unframe)
+        frame = self.graph.vpull()
         assert frame.time is not None
-        index = round(frame.time * tb)
+        index = round(frame.time * self.tb)
 
-        if total_pixels is None:
-            total_pixels = frame.width * frame.height
+        if self.total_pixels is None:
+            self.total_pixels = frame.width * frame.height
 
         current_frame = frame.to_ndarray()
-        if prev_frame is None:
+        if self.prev_frame is None:
             value = np.float32(0.0)
         else:
             # Use `int16` to avoid underflow with `uint8` datatype
-            diff = np.abs(prev_frame.astype(np.int16) - current_frame.astype(np.int16))
-            value = np.float32(np.count_nonzero(diff) / total_pixels)
+            diff = np.abs(
+                self.prev_frame.astype(np.int16) - current_frame.astype(np.int16)
+            )
+            value = np.float32(np.count_nonzero(diff) / self.total_pixels)
+
+        count = max(index - self.prev_index, 0)
+        self.prev_frame = current_frame
+        self.prev_index = index
+        return np.full(count, value, dtype=np.float32)
+
+
+def iter_motion(
+    video: av.VideoStream, tb: Fraction, blur: int, width: int
+) -> Iterator[np.float32]:
+    video.thread_type = "AUTO"
+    reducer = MotionReducer(video, tb, blur, width)
+
+    container = video.container
+    assert isinstance(container, av.container.InputContainer)
+
+    for unframe in container.decode(video):
+        if (values := reducer.push(unframe)) is not None:
+            yield from values
+
+
+# Seconds decoded and thrown away before a segment so decoders have warmed up.
+PREROLL = 2
+
+
+def audio_segment(
+    path: str, streams: list[int], tb: Fraction, start: int, end: int | None
+) -> list[NDArray[np.float32]] | None:
+    """
+    Compute the audio levels of ticks `start..end`, or to the end of the media
+    if `end` is None. Returns None when the segment can't be lined up with what
+    a sequential pass would have produced.
+    """
+    with av.open(path) as container:
+        audios = [container.streams.audio[s] for s in streams]
+        reducers: dict[int, AudioReducer] = {}
+        first_pts: dict[int, int] = {}
+        expected: dict[int, int | None] = {}
+        stop_at: dict[int, int | None] = {}
+        blocks: dict[int, list[NDArray[np.float32]]] = {}
+
+        # Sample positions are counted from the first decoded frame. It's decoded
+        # apart, since flushing doesn't fully reset every decoder's state.
+        with av.open(path) as probe:
+            for s in streams:
+                for frame in probe.decode(audio=s):
+                    if frame.pts is not None:
+                        first_pts[probe.streams.audio[s].index] = frame.pts
+                    break
+                probe.seek(0)
+
+        for audio in audios:
+            if audio.time_base is None or audio.index not in first_pts:
+                return None
+
+            reducer = AudioReducer(audio, tb)
+            reducer.tick = start
+            reducer.consumed = int(tick_bounds(start, start, reducer.exact_size)[0])
+            reducers[audio.index] = reducer
+            expected[audio.index] = None
+            stop_at[audio.index] = (
+                None
+                if end is None
+                else int(tick_bounds(end, end, reducer.exact_size)[0])
+                + reducer.min_size
+            )
+            blocks[audio.index] = []
+
+        seconds = min(reducers[a.index].consumed / a.rate for a in audios)
+        container.seek(max(int((seconds - PREROLL) * av.time_base), 0))
+
+        def is_done(index: int) -> bool:
+            reducer, last = reducers[index], stop_at[index]
+            return last is not None and reducer.consumed + reducer.fifo.samples >= last
+
+        for packet in container.demux(*audios):
+            index = packet.stream.index
+            if is_done(index):
+                continue
+
+            stream, reducer = packet.stream, reducers[index]
+            assert isinstance(stream, av.AudioStream) and stream.time_base is not None
+            for decoded in packet.decode():
+                assert isinstance(decoded, av.AudioFrame)
+                if decoded.pts is None:
+                    return None
+                pos = (decoded.pts - first_pts[index]) * stream.time_base * stream.rate
+                if pos.denominator != 1 or expected[index] not in (None, pos):
+                    return None  # Timestamps don't follow the sample count.
+
+                frame_end = int(pos) + decoded.samples
+                expected[index] = frame_end
+                if frame_end <= reducer.consumed:
+                    continue  # Pre-roll, decoded only to warm up the decoder.
+
+                skip = reducer.consumed + reducer.fifo.samples - int(pos)
+                if skip < 0:
+                    return None  # Seeked past the start of the segment.
+                if (block := reducer.push(decoded, skip)) is not None:
+                    blocks[index].append(block)
+
+            if all(is_done(a.index) for a in audios):
+                break
+
+        results = []
+        for audio in audios:
+            arrs = blocks[audio.index]
+            if (block := reducers[audio.index].read_block()) is not None:
+                arrs.append(block)
+            arr = np.concatenate(arrs) if arrs else np.zeros(0, dtype=np.float32)
+            results.append(arr if end is None else arr[: end - start])
+
+    return results
+
+
+def motion_segment(
+    path: str,
+    stream: int,
+    tb: Fraction,
+    blur: int,
+    width: int,
+    start: int,
+    end: int | None,
+) -> NDArray[np.float32] | None:
+    """The motion counterpart of `audio_segment`."""
+    with av.open(path) as container:
+        video = container.streams.video[stream]
+        video.thread_type = "AUTO"
+        if video.time_base is None:
+            return None
+
+        if start > 0:
+            seconds = start / tb - PREROLL
+            if seconds > 0:
+                container.seek(int(seconds / video.time_base), stream=video)
+
+        reducer = MotionReducer(video, tb, blur, width)
+        values: list[NDArray[np.float32]] = []
+        first_tick: int | None = None
+
+        for unframe in container.decode(video):
+            if (arr := reducer.push(unframe)) is None:
+                continue
+
+            if first_tick is None:
+                if start == 0:
+                    first_tick = 0
+                    values.append(arr)
+                else:
+                    # The first frame has nothing to diff against, drop it.
+                    first_tick = reducer.prev_index + 1
+                    if first_tick > start:
+                        return None
+            else:
+                values.append(arr)
+
+            if end is not None and reducer.prev_index >= end - 1:
+                break
+
+    if first_tick is None:
+        return np.zeros(0, dtype=np.float32)
+
+    result = np.concatenate(values) if values else np.zeros(0, dtype=np.float32)
+    return result[start - first_tick : None if end is None else end - first_tick]
+
+
+def stitch(
+    segments: list[tuple[int, int | None]],
+    results: list[NDArray[np.float32] | None],
+    overlap: int,
+) -> NDArray[np.float32] | None:
+    """
+    Join segment results. Every segment after the first starts `overlap` ticks
+    early, and those ticks must equal the end of the previous segment.
+    """
+    arrs: list[NDArray[np.float32]] = []
+    length = 0
+    ended = False
+
+    for (start, end), arr in zip(segments, results):
+        if arr is None:
+            return None
+
+        lead = min(overlap, start)
+        if start > 0:
+            if ended:
+                if len(arr) > lead:
+                    return None
+                continue
+
+            tail = np.concatenate(arrs)[length - lead :] if arrs else arr[:0]
+            if not np.array_equal(tail, arr[:lead]):
+                return None
+            arr = arr[lead:]
 
-        for _ in range(index - prev_index):
-            yield value
+        arrs.append(arr)
+        length += len(arr)
+        if end is not None and length < end:
+            ended = True
 
-        prev_frame = current_frame
-        prev_index = index
+    return np.concatenate(arrs) if arrs else np.zeros(0, dtype=np.float32)
 
 
 @dataclass(slots=True)
 class Levels:
     container: av.container.InputContainer
-    name: str
-    mod_time: int
+    source: str
     tb: Fraction
     bar: Bar
-    no_cache: bool
+    disk_cache: Cache | None
     log: Log
+    workers: int = 1
+    # Also cache the decoded samples of each audio stream at this rate.
+    pcm_rate: int | None = None
+    # Arrays already computed or loaded by this object, keyed by (kind, obj).
+    memo: dict[tuple[str, tuple[object, ...]], np.ndarray] = field(default_factory=dict)
+    # Streams whose samples were found too big to cache.
+    oversized: set[int] = field(default_factory=set)
 
     @property
     def media_length(self) -> int:
         container = self.container
         if container.streams.audio:
-            if (arr := self.read_cache("audio", (0,))) is not None:
-                return len(arr)
-
-            audio_stream = container.streams.audio[0]
-            result = sum(1 for _ in iter_audio(audio_stream, self.tb))
-            container.seek(0)
+            exact_size = Fraction(container.streams.audio[0].rate) / self.tb
+            result = tick_count(self.samples(0), exact_size)
             self.log.debug(f"Audio Length: {result}")
             return result
 
@@ -189,106 +686,357 @@ class Levels:
 
         return dur
 
+    def samples(self, stream: int) -> int:
+        if (arr := self.read_cache("samples", (stream,))) is not None:
+            return int(arr[0])
+
+        result = audio_samples(self.container.streams.audio[stream])
+        self.container.seek(0)
+        self.cache(np.array([result], dtype=np.int64), "samples", (stream,))
+        return result
+
     def obj_tag(self, kind: str, obj: Sequence[object]) -> str:
-        mod_time = self.mod_time
-        key = f"{self.name}:{mod_time:x}:{self.tb}:" + ",".join(f"{v}" for v in obj)
+        key = f"{self.source}:" + ",".join(f"{v}" for v in obj)
         return f"{sha1(key.encode()).hexdigest()[:16]}{kind}"
 
+    def wants_pcm(self, stream: int) -> bool:
+        cache = self.disk_cache
+        if self.pcm_rate is None or cache is None or stream in self.oversized:
+            return False
+
+        # Decoding samples that can't be kept would only be repeated every run.
+        audio = self.container.streams.audio[stream]
+        size = self.inaccurate_dur(audio, Fraction(self.pcm_rate)) * 4
+        if size > cache.budget:
+            self.oversized.add(stream)
+            self.log.warning(
+                f"Not caching the samples of audio stream {stream}: about "
+                f"{size} bytes is over the cache size"
+            )
+            return False
+
+        name = pcm_name(self.source, stream, self.pcm_rate)
+        return name not in cache.read_index() or not os.path.exists(
+            cache.entry_path(name)
+        )
+
+    def pcm_writers(self, streams: Sequence[int]) -> list[PcmWriter | None]:
+        """Make writers for the streams whose samples should be cached."""
+        return [
+            PcmWriter(self.pcm_rate)
+            if self.pcm_rate is not None and self.wants_pcm(stream)
+            else None
+            for stream in streams
+        ]
+
+    def close_writers(
+        self, streams: Sequence[int], writers: Sequence[PcmWriter | None]
+    ) -> None:
+        for stream, writer in zip(streams, writers):
+            if writer is not None:
+                assert self.disk_cache is not None and self.pcm_rate is not None
+                writer.close(
+                    self.disk_cache, pcm_name(self.source, stream, self.pcm_rate)
+                )
+
     def none(self) -> NDArray[np.bool_]:
         return np.ones(self.media_length, dtype=np.bool_)
 
     def all(self) -> NDArray[np.bool_]:
         return np.zeros(self.media_length, dtype=np.bool_)
 
+    def remember(self, arr: np.ndarray, kind: str, obj: Sequence[object]) -> np.ndarray:
+        # Every caller gets the same array, so none of them may change it.
+        arr.flags.writeable = False
+        self.memo[(kind, tuple(obj))] = arr
+        return arr
+
     def read_cache(self, kind: str, obj: Sequence[object]) -> None | np.ndarray:
-        if self.no_cache:
+        if (arr := self.memo.get((kind, tuple(obj)))) is not None:
+            return arr
+        if self.disk_cache is None:
+            return None
+        if (arr := self.disk_cache.get(self.obj_tag(kind, obj))) is None:
             return None
+        return self.remember(arr, kind, obj)
 
-        key = self.obj_tag(kind, obj)
-        cache_file = os.path.join(gettempdir(), f"ae-{__version__}", f"{key}.npz")
+    def cache(self, arr: np.ndarray, kind: str, obj: Sequence[object]) -> np.ndarray:
+        if self.disk_cache is not None:
+            self.disk_cache.put(self.obj_tag(kind, obj), arr)
+        return self.remember(arr, kind, obj)
+
+    def segments(self, dur: int, tb: Fraction) -> list[tuple[int, int | None]]:
+        # Segments shorter than a minute aren't worth starting a process for.
+        count = min(self.workers, max(dur // max(int(tb * 60), 1), 1))
+        size = dur // count
+        return [
+            (i * size, None if i == count - 1 else (i + 1) * size) for i in range(count)
+        ]
+
+    def run_segments(
+        self,
+        title: str,
+        func: Callable[..., Any],
+        segments: list[tuple[int, int | None]],
+        overlap: int,
+        *args: object,
+    ) -> list[Any] | None:
+        bar = self.bar
+        bar.start(len(segments), title)
+        results: list[Any] = [None] * len(segments)
 
         try:
-            with np.load(cache_file, allow_pickle=False) as npzfile:
-                return npzfile["data"]
+            with ProcessPoolExecutor(max_workers=len(segments)) as pool:
+                futures = {
+                    pool.submit(func, *args, start - min(overlap, start), end): i
+                    for i, (start, end) in enumerate(segments)
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    results[futures[future]] = future.result()
+                    bar.tick(done)
         except Exception as e:
-            self.log.debug(e)
+            self.log.debug(f"Parallel analysis failed: {e}")
             return None
+        finally:
+            bar.end()
 
-    def cache(self, arr: np.ndarray, kind: str, obj: Sequence[object]) -> np.ndarray:
-        if self.no_cache:
-            return arr
+        return results
 
-        workdir = os.path.join(gettempdir(), f"ae-{__version__}")
-        os.makedirs(workdir, exist_ok=True)
-        cache_file = os.path.join(workdir, f"{self.obj_tag(kind, obj)}.npz")
+    def parallel_audio(
+        self, streams: list[int], dur: int
+    ) -> list[NDArray[np.float32]] | None:
+        segments = self.segments(dur, ENVELOPE_TB)
+        if len(segments) < 2:
+            return None
 
-        try:
-            np.savez(cache_file, data=arr)
-        except Exception as e:
-            self.log.warning(f"Cache write failed: {e}")
-
-        cache_entries = []
-        with os.scandir(workdir) as entries:
-            for entry in entries:
-                if entry.name.endswith(".npz"):
-                    cache_entries.append((entry.path, entry.stat().st_mtime))
-
-        if len(cache_entries) > 10:
-            # Sort by modification time, oldest first
-            cache_entries.sort(key=lambda x: x[1])
-            # Remove oldest files until we're back to 10
-            for filepath, _ in cache_entries[:-10]:
-                try:
-                    os.remove(filepath)
-                except OSError:
-                    pass
+        overlap = ceil(ENVELOPE_TB)
+        results = self.run_segments(
+            "Analyzing audio volume",
+            audio_segment,
+            segments,
+            overlap,
+            self.container.name,
+            streams,
+            ENVELOPE_TB,
+        )
+        if results is None:
+            return None
 
-        return arr
+        arrs = []
+        for i in range(len(streams)):
+            parts = [None if r is None else r[i] for r in results]
+            if (arr := stitch(segments, parts, overlap)) is None:
+                self.log.debug("Audio segments don't line up, analyzing sequentially")
+                return None
+            arrs.append(arr)
+        return arrs
+
+    def parallel_motion(
+        self, stream: int, blur: int, width: int, dur: int
+    ) -> NDArray[np.float32] | None:
+        segments = self.segments(dur, self.tb)
+        if len(segments) < 2:
+            return None
 
-    def audio(self, stream: int) -> NDArray[np.float32]:
-        container = self.container
-        if stream >= len(container.streams.audio):
-            raise LevelError(f"audio: audio stream '{stream}' does not exist.")
+        overlap = max(ceil(self.tb), 1)
+        results = self.run_segments(
+            "Analyzing motion",
+            motion_segment,
+            segments,
+            overlap,
+            self.container.name,
+            stream,
+            self.tb,
+            blur,
+            width,
+        )
+        if results is None:
+            return None
 
-        if (arr := self.read_cache("audio", (stream,))) is not None:
-            return arr
+        if (arr := stitch(segments, results, overlap)) is None:
+            self.log.debug("Motion segments don't line up, analyzing sequentially")
+        return arr
 
-        audio = container.streams.audio[stream]
+    def audio(self, stream: int) -> NDArray[np.float32]:
+        return self.audio_streams((stream,))[0]
 
+    def audio_streams(self, streams: Sequence[int]) -> list[NDArray[np.float32]]:
+        """Get the levels of each stream, decoding all uncached ones in one pass."""
+        container = self.container
+        for stream in streams:
+            if stream >= len(container.streams.audio):
+                raise LevelError(f"audio: audio stream '{stream}' does not exist.")
+
+        pooled = [self.memo.get(("audio-pooled", (self.tb, s))) for s in streams]
+        if all(arr is not None for arr in pooled):
+            return pooled  # type: ignore
+
+        envelopes = {stream: self.read_cache("audio", (stream,)) for stream in streams}
+        if missing := [
+            stream
+            for stream, arr in envelopes.items()
+            if arr is None or self.wants_pcm(stream)
+        ]:
+            envelopes.update(zip(missing, self.envelopes(missing)))
+
+        return [
+            self.remember(
+                pool_levels(
+                    envelopes[stream],  # type: ignore
+                    self.samples(stream),
+                    container.streams.audio[stream].rate,
+                    self.tb,
+                ),
+                "audio-pooled",
+                (self.tb, stream),
+            )
+            for stream in streams
+        ]
+
+    def inaccurate_dur(self, audio: av.AudioStream, tb: Fraction) -> int:
         if audio.duration is not None and audio.time_base is not None:
-            inaccurate_dur = int(audio.duration * audio.time_base * self.tb)
-        elif container.duration is not None:
-            inaccurate_dur = int(container.duration / av.time_base * self.tb)
-        else:
-            inaccurate_dur = 1024
+            return int(audio.duration * audio.time_base * tb)
+        if self.container.duration is not None:
+            return int(self.container.duration / av.time_base * tb)
+        return 1024
+
+    def envelopes(self, streams: list[int]) -> list[NDArray[np.float32]]:
+        container = self.container
+        audios = [container.streams.audio[stream] for stream in streams]
+        inaccurate_dur = self.inaccurate_dur(audios[0], ENVELOPE_TB)
+
+        # Samples to cache have to be decoded in order, so only one process can.
+        if (
+            self.workers > 1
+            and not any(self.wants_pcm(stream) for stream in streams)
+            and (arrs := self.parallel_audio(streams, inaccurate_dur)) is not None
+        ):
+            return [
+                self.cache(arr, "audio", (stream,))
+                for stream, arr in zip(streams, arrs)
+            ]
 
         bar = self.bar
         bar.start(inaccurate_dur, "Analyzing audio volume")
 
-        result: NDArray[np.float32] = np.zeros(inaccurate_dur, dtype=np.float32)
+        reducers = [AudioReducer(audio, ENVELOPE_TB) for audio in audios]
+        writers = self.pcm_writers(streams)
+        blocks: list[list[NDArray[np.float32]]] = [[] for _ in audios]
         index = 0
 
-        for value in iter_audio(audio, self.tb):
-            if index > len(result) - 1:
-                result = np.concatenate(
-                    (result, np.zeros(len(result), dtype=np.float32))
-                )
+        for i, block in iter_audio_multi(container, audios, reducers, writers):
+            blocks[i].append(block)
+            if i == 0:
+                index += len(block)
+                bar.tick(index)
 
-            result[index] = value
-            bar.tick(index)
-            index += 1
+        bar.end()
+        container.seek(0)
+        self.close_writers(streams, writers)
+
+        results = []
+        for stream, reducer, arrs in zip(streams, reducers, blocks):
+            self.cache(
+                np.array([reducer.samples], dtype=np.int64), "samples", (stream,)
+            )
+            result = np.concatenate(arrs) if arrs else np.zeros(0, dtype=np.float32)
+            results.append(self.cache(result, "audio", (stream,)))
+        return results
+
+    def analyze(
+        self, streams: Sequence[int], mobjs: Sequence[tuple[int, int, int]]
+    ) -> None:
+        """
+        Cache the audio levels of `streams` and the motion levels of `mobjs`
+        (stream, width, blur), demuxing the container only once.
+        """
+        container = self.container
+        streams = [
+            s
+            for s in dict.fromkeys(streams)
+            if s < len(container.streams.audio)
+            and (self.read_cache("audio", (s,)) is None or self.wants_pcm(s))
+        ]
+        mobjs = [
+            m
+            for m in dict.fromkeys(mobjs)
+            if m[0] < len(container.streams.video)
+            and self.read_cache("motion", (self.tb, *m)) is None
+        ]
+        if not streams or not mobjs or self.workers > 1:
+            return  # Nothing to fuse, let each kind decode on its own.
+
+        audios = [container.streams.audio[s] for s in streams]
+        audio_reducers = {
+            audio.index: (i, AudioReducer(audio, ENVELOPE_TB))
+            for i, audio in enumerate(audios)
+        }
+        writers = self.pcm_writers(streams)
+        audio_blocks: list[list[NDArray[np.float32]]] = [[] for _ in audios]
+
+        motion_reducers: dict[int, list[tuple[int, MotionReducer]]] = {}
+        videos: list[av.VideoStream] = []
+        for i, (stream, width, blur) in enumerate(mobjs):
+            video = container.streams.video[stream]
+            if video.index not in motion_reducers:
+                video.thread_type = "AUTO"
+                videos.append(video)
+                motion_reducers[video.index] = []
+            reducer = MotionReducer(video, self.tb, blur, width)
+            motion_reducers[video.index].append((i, reducer))
+        motion_blocks: list[list[NDArray[np.float32]]] = [[] for _ in mobjs]
+
+        inaccurate_dur = self.inaccurate_dur(audios[0], ENVELOPE_TB)
+        bar = self.bar
+        bar.start(inaccurate_dur, "Analyzing audio and motion")
+        index = 0
+
+        for packet in container.demux(*audios, *videos):
+            stream_index = packet.stream.index
+            if stream_index in audio_reducers:
+                i, audio_reducer = audio_reducers[stream_index]
+                for frame in packet.decode():
+                    assert isinstance(frame, av.AudioFrame)
+                    if (writer := writers[i]) is not None:
+                        writer.push(frame)
+                    if (block := audio_reducer.push(frame)) is not None:
+                        audio_blocks[i].append(block)
+                        if i == 0:
+                            index += len(block)
+                            bar.tick(index)
+            else:
+                for frame in packet.decode():
+                    assert isinstance(frame, av.VideoFrame)
+                    for i, motion_reducer in motion_reducers[stream_index]:
+                        if (values := motion_reducer.push(frame)) is not None:
+                            motion_blocks[i].append(values)
+
+        for i, audio_reducer in audio_reducers.values():
+            if (block := audio_reducer.read_block()) is not None:
+                audio_blocks[i].append(block)
 
         bar.end()
         container.seek(0)
-        assert len(result) > 0
-        return self.cache(result[:index], "audio", (stream,))
+        self.close_writers(streams, writers)
+
+        empty = np.zeros(0, dtype=np.float32)
+        for stream, (_, audio_reducer), arrs in zip(
+            streams, audio_reducers.values(), audio_blocks
+        ):
+            samples = np.array([audio_reducer.samples], dtype=np.int64)
+            self.cache(samples, "samples", (stream,))
+            self.cache(np.concatenate(arrs) if arrs else empty, "audio", (stream,))
+        for mobj, arrs in zip(mobjs, motion_blocks):
+            self.cache(
+                np.concatenate(arrs) if arrs else empty, "motion", (self.tb, *mobj)
+            )
 
     def motion(self, stream: int, blur: int, width: int) -> NDArray[np.float32]:
         container = self.container
         if stream >= len(container.streams.video):
             raise LevelError(f"motion: video stream '{stream}' does not exist.")
 
-        mobj = (stream, width, blur)
+        mobj = (self.tb, stream, width, blur)
         if (arr := self.read_cache("motion", mobj)) is not None:
             return arr
 
@@ -298,6 +1046,13 @@ class Levels:
             if video.duration is None or video.time_base is None
             else int(video.duration * video.time_base * self.tb)
         )
+        if (
+            self.workers > 1
+            and (arr := self.parallel_motion(stream, blur, width, inaccurate_dur))
+            is not None
+        ):
+            return self.cache(arr, "motion", mobj)
+
         bar = self.bar
         bar.start(inaccurate_dur, "Analyzing motion")
 
@@ -382,12 +1137,18 @@ class Levels:
 
 
 def initLevels(
-    src: FileInfo, tb: Fraction, bar: Bar, no_cache: bool, log: Log
+    src: FileInfo,
+    tb: Fraction,
+    bar: Bar,
+    cache: Cache | None,
+    log: Log,
+    workers: int = 1,
+    pcm_rate: int | None = None,
 ) -> Levels:
     try:
         container = av.open(src.path)
     except av.FFmpegError as e:
         log.error(e)
 
-    mod_time = int(src.path.stat().st_mtime)
-    return Levels(container, src.path.name, mod_time, tb, bar, no_cache, log)
+    source = "" if cache is None else cache.source_key(src.path)
+    return Levels(container, source, tb, bar, cache, log, workers, pcm_rate)
@@ -1,27 +1,18 @@
-import glob
-import os
 import sys
-from shutil import rmtree
-from tempfile import gettempdir
 
-import numpy as np
-
-from auto_editor import __version__
+from auto_editor.utils.cache import DEFAULT_SIZE, Cache, default_dir
+from auto_editor.utils.log import Log
 
 
 def main(sys_args: list[str] = sys.argv[1:]) -> None:
-    cache_dir = os.path.join(gettempdir(), f"ae-{__version__}")
+    cache = Cache(default_dir(), DEFAULT_SIZE, False, Log())
 
     if sys_args and sys_args[0] in {"clean", "clear"}:
-        rmtree(cache_dir, ignore_errors=True)
-        return
-
-    if not os.path.exists(cache_dir):
-        print("Empty cache")
+        cache.clear()
         return
 
-    cache_files = glob.glob(os.path.join(cache_dir, "*.npz"))
-    if not cache_files:
+    index = cache.read_index()
+    if not index:
         print("Empty cache")
         return
 
@@ -39,26 +30,19 @@ def main(sys_args: list[str] = sys.argv[1:]) -> None:
     RESET = "\033[0m"
 
     total_size = 0
-    for cache_file in cache_files:
-        try:
-            with np.load(cache_file, allow_pickle=False) as npzfile:
-                array = npzfile["data"]
-                key = os.path.basename(cache_file)[:-4]  # Remove .npz extension
-
-                hash_part = key[:16]
-                rest_part = key[16:]
-
-                size = array.nbytes
-                total_size += size
-                size_str = format_bytes(size)
-                size_num, size_unit = size_str.rsplit(" ", 1)
-
-                print(
-                    f"{YELLOW}entry: {GRAY}{hash_part}{RESET}{rest_part}  "
-                    f"{YELLOW}size: {GREEN}{size_num} {BLUE}{size_unit}{RESET}"
-                )
-        except Exception as e:
-            print(f"Error reading {cache_file}: {e}")
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["atime"]):
+        hash_part = key[:16]
+        rest_part = key[16:]
+
+        size = int(entry["size"])
+        total_size += size
+        size_str = format_bytes(size)
+        size_num, size_unit = size_str.rsplit(" ", 1)
+
+        print(
+            f"{YELLOW}entry: {GRAY}{hash_part}{RESET}{rest_part}  "
+            f"{YELLOW}size: {GREEN}{size_num} {BLUE}{size_unit}{RESET}"
+        )
 
     total_str = format_bytes(total_size)
     total_num, total_unit = total_str.rsplit(" ", 1)
@@ -13,6 +13,7 @@ from auto_editor.ffwrapper import FileInfo
 from auto_editor.lang.palet import env
 from auto_editor.lib.contracts import is_bool, is_nat, is_nat1, is_str, is_void, orc
 from auto_editor.utils.bar import initBar
+from auto_editor.utils.cache import DEFAULT_SIZE, Cache, default_dir
 from auto_editor.utils.cmdkw import (
     ParserError,
     Required,
@@ -127,35 +128,15 @@ def main(sys_args: list[str] = sys.argv[1:]) -> None:
             except ParserError as e:
                 log.error(e)
 
-        levels = initLevels(src, tb, bar, False, log)
+        cache = (
+            None if args.no_cache else Cache(default_dir(), DEFAULT_SIZE, False, log)
+        )
+        levels = initLevels(src, tb, bar, cache, log)
         try:
             if method == "audio":
-                if (
-                    not args.no_cache
-                    and (arr := levels.read_cache("audio", (obj["stream"],)))
-                    is not None
-                ):
-                    print_arr(arr)
-                else:
-                    container = av.open(src.path, "r")
-                    audio_stream = container.streams.audio[obj["stream"]]
-
-                    values = []
-
-                    def value_storing_generator() -> Iterator[np.float32]:
-                        for value in iter_audio(audio_stream, tb):
-                            values.append(value)
-                            yield value
-
-                    print_arr_gen(value_storing_generator())
-                    container.close()
-
-                    cache_array = np.array(values, dtype=np.float32)
-                    if not args.no_cache:
-                        levels.cache(cache_array, "audio", (obj["stream"],))
-
+                print_arr(levels.audio(obj["stream"]))
             elif method == "motion":
-                mobj = (obj["stream"], obj["width"], obj["blur"])
+                mobj = (tb, obj["stream"], obj["width"], obj["blur"])
                 if (
                     not args.no_cache
                     and (arr := levels.read_cache("motion", mobj)) is not None
@@ -13,6 +13,7 @@ from auto_editor.lang.stdenv import make_standard_env
 from auto_editor.lib.data_structs import print_str
 from auto_editor.lib.err import MyError
 from auto_editor.utils.bar import initBar
+from auto_editor.utils.cache import DEFAULT_SIZE, Cache, default_dir
 from auto_editor.utils.log import Log
 from auto_editor.utils.types import frame_rate
 from auto_editor.vanparse import ArgumentParser
@@ -60,7 +61,8 @@ def main(sys_args: list[str] = sys.argv[1:]) -> None:
         src = sources[0]
         tb = src.get_fps() if args.timebase is None else args.timebase
         env["timebase"] = tb
-        env["@levels"] = initLevels(src, tb, initBar("modern"), False, log)
+        cache = Cache(default_dir(), DEFAULT_SIZE, False, log)
+        env["@levels"] = initLevels(src, tb, initBar("modern"), cache, log)
 
     env.update(make_standard_env())
     print(f"Auto-Editor {auto_editor.__version__}")
@@ -4,10 +4,11 @@ import os
 import shutil
 import subprocess
 import sys
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
 from dataclasses import dataclass, field
 from fractions import Fraction
 from hashlib import sha256
+from math import ceil
 from tempfile import mkdtemp
 from time import perf_counter
 
@@ -15,11 +16,33 @@ import av
 import numpy as np
 from av import AudioStream, VideoStream
 
+from auto_editor.analyze import (
+    ENVELOPE_TB,
+    Levels,
+    audio_samples,
+    frame_samples,
+    initLevels,
+    iter_audio_blocks,
+    pool_levels,
+    tick_bounds,
+    tick_count,
+)
 from auto_editor.ffwrapper import FileInfo
-from auto_editor.lang.palet import Lexer, Parser, env, interpret
+from auto_editor.json import load
+from auto_editor.lang.palet import (
+    Lexer,
+    Parser,
+    compile_node,
+    env,
+    eval_nodes,
+    interpret,
+    iter_nodes,
+)
 from auto_editor.lang.stdenv import make_standard_env
-from auto_editor.lib.data_structs import Char
+from auto_editor.lib.data_structs import Char, Sym
 from auto_editor.lib.err import MyError
+from auto_editor.utils.bar import initBar
+from auto_editor.utils.cache import ATIME_RESOLUTION, DEFAULT_SIZE, Cache
 from auto_editor.utils.log import Log
 from auto_editor.vanparse import ArgumentParser
 
@@ -38,7 +61,7 @@ def test_options(parser: ArgumentParser) -> ArgumentParser:
     parser.add_required(
         "category",
         nargs=1,
-        choices=("palet", "cli", "sub", "all"),
+        choices=("palet", "cli", "sub", "bench", "all"),
         metavar="category [options]",
     )
     return parser
@@ -66,6 +89,36 @@ def fileinfo(path: str) -> FileInfo:
     return FileInfo.init(path, log)
 
 
+def repeat_media(path: str, copies: int, output: str) -> str:
+    """Write `copies` copies of `path` back to back, without re-encoding."""
+    with av.open(output, "w") as out:
+        shift: dict[int, int] = {}
+        for i in range(copies):
+            with av.open(path) as container:
+                inputs: list[VideoStream | AudioStream] = [
+                    *container.streams.video,
+                    *container.streams.audio,
+                ]
+                if i == 0:
+                    streams = {s.index: out.add_stream_from_template(s) for s in inputs}
+                ends: dict[int, int] = {}
+                for packet in container.demux(*inputs):
+                    if packet.pts is None or packet.dts is None:
+                        continue
+                    index, duration = packet.stream.index, packet.duration or 0
+                    if isinstance(packet.stream, AudioStream):
+                        # The last packet can decode to more than its duration.
+                        duration = max(duration, frame_samples(packet.decode()))
+                    ends[index] = max(ends.get(index, 0), packet.pts + duration)
+                    packet.pts += shift.get(index, 0)
+                    packet.dts += shift.get(index, 0)
+                    packet.stream = streams[index]
+                    out.mux(packet)
+                for index, end in ends.items():
+                    shift[index] = shift.get(index, 0) + end
+    return output
+
+
 def calculate_sha256(filename: str) -> str:
     sha256_hash = hashlib.sha256()
     with open(filename, "rb") as f:
@@ -78,6 +131,22 @@ class SkipTest(Exception):
     pass
 
 
+def bench(name: str, old: Callable[[], object], new: Callable[[], object]) -> None:
+    start = perf_counter()
+    old()
+    old_time = perf_counter() - start
+
+    start = perf_counter()
+    new()
+    new_time = perf_counter() - start
+
+    print(
+        f"{name}: {old_time:.3f} -> {new_time:.3f} secs "
+        f"({old_time / max(new_time, 1e-9):.1f}x)",
+        flush=True,
+    )
+
+
 class Runner:
     def __init__(self) -> None:
         self.program = [sys.executable, "-m", "auto_editor"]
@@ -299,6 +368,154 @@ class Runner:
         self.main(["example.mp4"], ["-m", "0.1 seconds"])
         self.main(["example.mp4"], ["-m", "6,-3secs"])
 
+    def test_mut_margin(self):
+        from auto_editor.utils.func import mut_margin
+
+        def bools(s: str) -> np.ndarray:
+            return np.array([c == "1" for c in s])
+
+        for before, start_m, end_m, after in (
+            ("0001100001", 2, 1, "0111110111"),
+            ("0011100", 5, 5, "1111111"),  # Clipped at both ends.
+            ("0011111000", -2, -1, "0000110000"),
+            ("0110", -5, 0, "0000"),
+            ("0001110", 0, -5, "0000000"),
+            ("1100011", 1, 1, "1110111"),  # Index 0 is not an edge.
+            ("1111", 3, -3, "1111"),
+        ):
+            arr = bools(before)
+            mut_margin(arr, start_m, end_m)
+            assert np.array_equal(arr, bools(after)), (before, start_m, end_m)
+
+    def test_make_clips(self):
+        from auto_editor.make_layers import VirClip, make_clips
+
+        # A clip per run of one speed, with offsets counted from its own source.
+        # Cut runs and runs too short for their speed make no clip.
+        sources = ["a.mp4", "b.mp4"]
+        src_index = np.array([0] * 10 + [1] * 10, dtype=np.int32)
+        arr = np.array(
+            [1, 1, 1, 2, 0, 2, 2, 2, 2, 1] + [1, 1, 2, 2, 2, 2, 2, 0, 0, 0],
+            dtype=np.uint,
+        )
+        assert make_clips(arr, src_index, sources, [99999, 1, 2]) == [
+            VirClip(0, 3, 0, 1, "a.mp4"),
+            VirClip(3, 2, 3, 2, "a.mp4"),
+            VirClip(5, 1, 9, 1, "a.mp4"),
+            VirClip(6, 2, 0, 1, "b.mp4"),
+            VirClip(8, 2, 1, 2, "b.mp4"),
+        ]
+
+        # A source boundary ends a clip even when the speed stays the same.
+        sources = [f"{i}.mp4" for i in range(200)]
+        src_index = np.repeat(np.arange(200, dtype=np.int32), 3000)
+        arr = np.ones(len(src_index), dtype=np.uint)
+        arr[-1] = 0
+        clips = make_clips(arr, src_index, sources, [99999, 1])
+        assert clips[:-1] == [
+            VirClip(i * 3000, 3000, 0, 1, src) for i, src in enumerate(sources[:-1])
+        ]
+        assert clips[-1] == VirClip(199 * 3000, 2999, 0, 1, "199.mp4")
+
+    def test_iter_objects(self):
+        from auto_editor.render.video import VideoFrame, iter_objects
+        from auto_editor.timeline import Clip, TlRect
+
+        rect = TlRect(2, 4, 0, 0, 10, 10, "#000")
+        layers = [
+            # The second clip starts on the frame the first one ends.
+            [Clip(0, 4, "a.mp4", 10, 0, 2), Clip(4, 3, "b.mp4", 0, 0)],
+            [rect, TlRect(5, 0, 0, 0, 10, 10, "#fff")],
+            [Clip(1, 2, "c.mp4", 2, 0, 0.5)],
+        ]
+        # Objects stay in layer order, not in the order they started.
+        expected = [
+            [VideoFrame(20, "a.mp4")],
+            [VideoFrame(22, "a.mp4"), VideoFrame(1, "c.mp4")],
+            [VideoFrame(24, "a.mp4"), rect, VideoFrame(2, "c.mp4")],
+            [VideoFrame(26, "a.mp4"), rect],
+            [VideoFrame(0, "b.mp4"), rect],
+            [VideoFrame(1, "b.mp4"), rect],
+            [VideoFrame(2, "b.mp4")],
+            [],
+        ]
+        assert list(iter_objects(layers, 8)) == expected
+        assert list(iter_objects(layers, 8, 5)) == expected[5:]
+
+    def test_filter_graphs(self):
+        from auto_editor.render.video import make_graph
+
+        filter_sets = (
+            (
+                ("scale", "1280:720:force_original_aspect_ratio=decrease:eval=frame"),
+                ("pad", "1280:720:-1:-1:color=#000000"),
+            ),
+            (("drawbox", "x=-20:y=40:w=300:h=90:color=#33aa66:t=fill"),),
+        )
+        # The graphs read the stream's time base, which is freed with the container.
+        with av.open("resources/testsrc.mp4") as container:
+            stream = container.streams.video[0]
+            frames = [f for _, f in zip(range(30), container.decode(stream))]
+
+            for filters in filter_sets:
+                graph = make_graph(stream, frames[0], *filters)
+                for frame in frames:
+                    graph.vpush(frame)
+                    reused = graph.vpull().to_ndarray()
+
+                    fresh = make_graph(stream, frame, *filters)
+                    fresh.vpush(frame)
+                    assert np.array_equal(reused, fresh.vpull().to_ndarray()), filters
+
+    def test_overlays(self):
+        from auto_editor.render.video import (
+            copy_frame,
+            image_blend,
+            make_graph,
+            plane_arrays,
+            rect_blend,
+        )
+        from auto_editor.timeline import TlImage, TlRect
+
+        # Rectangles are filled with the same values drawbox uses. The graphs read
+        # the stream's time base, which is freed with the container.
+        with av.open("resources/testsrc.mp4") as container:
+            stream = container.streams.video[0]
+            frame = next(container.decode(stream))
+
+            for x, y, w, h, fill in (
+                (-20, 40, 300, 90, "#33aa66"),
+                (13, 7, 51, 33, "#ff0000"),
+                (600, 300, 100, 100, "#123456"),
+            ):
+                out = copy_frame(frame)
+                rect_blend(TlRect(0, 1, x, y, w, h, fill), frame).apply(out)
+                box = f"x={x}:y={y}:w={w}:h={h}:color={fill}:t=fill"
+                graph = make_graph(stream, frame, ("drawbox", box))
+                graph.vpush(frame)
+                expected = graph.vpull()
+                for a, b in zip(plane_arrays(out), plane_arrays(expected)):
+                    assert np.array_equal(a, b), box
+
+        # Images stay close to blending in rgb24, and leave the rest untouched.
+        img = np.random.default_rng(0).integers(0, 256, (120, 200, 3), np.uint8)
+        obj = TlImage(0, 1, None, 400, 200, 0, 0.6)
+        out = copy_frame(frame)
+        image_blend(img, obj, frame).apply(out)
+
+        array = frame.to_ndarray(format="rgb24")
+        roi = array[200:320, 400:600]
+        array[200:320, 400:600] = (1 - obj.opacity) * roi + obj.opacity * img
+        expected = av.VideoFrame.from_ndarray(array, format="rgb24")
+        expected = expected.reformat(format="yuv420p")
+
+        luma, old_luma = plane_arrays(out)[0], plane_arrays(frame)[0]
+        new = luma[200:320, 400:600].astype(int)
+        old = plane_arrays(expected)[0][200:320, 400:600].astype(int)
+        assert np.abs(old - new).mean() < 1
+        assert np.array_equal(luma[:200], old_luma[:200])
+        assert np.array_equal(luma[:, :400], old_luma[:, :400])
+
     def test_input_extension(self):
         """Input file must have an extension. Throw error if none is given."""
         path = os.path.join(self.temp_dir, "example")
@@ -445,6 +662,22 @@ class Runner:
         out = self.main(inputs, [], "out.mov")
         assert len(fileinfo(out).audios) == 2
 
+    def test_render_workers(self):
+        out = self.main(
+            ["example.mp4"], ["--edit", "none", "--render-workers", "3"], "workers.mp4"
+        )
+        with av.open(out) as container:
+            assert sum(1 for _ in container.decode(video=0)) == 1272
+        assert len(fileinfo(out).audios) == 1
+
+    def test_smart_render(self):
+        out = self.main(["example.mp4"], ["--smart-render"], "smart.mp4")
+        with av.open(out) as container:
+            stream = container.streams.video[0]
+            assert stream.codec_context.name == "h264"
+            assert sum(1 for _ in container.decode(stream)) == 522
+        assert len(fileinfo(out).audios) == 1
+
     def test_frame_rate(self):
         cn = fileinfo(self.main(["example.mp4"], ["-r", "15", "--no-seek"], "fr.mp4"))
         video = cn.videos[0]
@@ -506,6 +739,343 @@ class Runner:
             ["--edit", "(or (not audio:threshold=4%) (not audio:stream=1))"],
         )
 
+    def test_media_length(self):
+        for path in (
+            "example.mp4",
+            "resources/new-commentary.mp3",
+            "resources/aac.m4a",
+        ):
+            for tb in (Fraction(30), Fraction(30000, 1001), Fraction(25)):
+                with av.open(path) as container:
+                    stream = container.streams.audio[0]
+                    length = tick_count(
+                        audio_samples(stream), Fraction(stream.rate) / tb
+                    )
+                    container.seek(0)
+                    expected = sum(len(b) for b in iter_audio_blocks(stream, tb))
+                assert length == expected, f"{path} {tb}: {length} != {expected}"
+
+    def test_audio_envelope(self):
+        def levels(tb: Fraction) -> np.ndarray:
+            with av.open("example.mp4") as container:
+                blocks = list(iter_audio_blocks(container.streams.audio[0], tb))
+            return np.concatenate(blocks)
+
+        envelope = levels(ENVELOPE_TB)
+        with av.open("example.mp4") as container:
+            stream = container.streams.audio[0]
+            samples, rate = audio_samples(stream), stream.rate
+
+        for tb in (Fraction(30), Fraction(30000, 1001), Fraction(60)):
+            exact = levels(tb)
+            pooled = pool_levels(envelope, samples, rate, tb)
+            assert len(pooled) == len(exact)
+            assert (pooled >= exact).all()
+
+    def test_audio_blocks(self):
+        from av.audio.fifo import AudioFifo
+
+        def tick_sizes(exact_size: Fraction) -> Iterator[int]:
+            error = Fraction(0)
+            while True:
+                size = round(exact_size + error)
+                error += exact_size - size
+                yield size
+
+        # 220.5 and 1470.5 samples per tick make every other boundary a tie.
+        for exact_size in (Fraction(1470), Fraction(441, 2), Fraction(2941, 2)):
+            sizes = tick_sizes(exact_size)
+            expected = np.cumsum([0] + [next(sizes) for _ in range(500)])
+            assert np.array_equal(tick_bounds(0, 500, exact_size), expected)
+            assert np.array_equal(tick_bounds(123, 500, exact_size), expected[123:])
+
+        for tb in (Fraction(30), Fraction(30000, 1001), ENVELOPE_TB):
+            with av.open("example.mp4") as container:
+                blocks = list(iter_audio_blocks(container.streams.audio[0], tb))
+
+            # Read every tick from the fifo on its own.
+            with av.open("example.mp4") as container:
+                stream = container.streams.audio[0]
+                fifo = AudioFifo()
+                resampler = av.AudioResampler("flt", stream.layout, stream.rate)
+                sizes = tick_sizes(Fraction(stream.rate) / tb)
+                expected = []
+                for frame in container.decode(stream):
+                    frame.pts = None
+                    for reframe in resampler.resample(frame):
+                        fifo.write(reframe)
+                    while fifo.samples >= ceil(Fraction(stream.rate) / tb):
+                        chunk = fifo.read(next(sizes))
+                        assert chunk is not None
+                        expected.append(np.abs(chunk.to_ndarray()).max())
+
+            assert len(blocks) > 1
+            assert np.array_equal(np.concatenate(blocks), expected), tb
+
+    def test_audio_streams(self):
+        path = os.path.join(self.temp_dir, "two-audio.mkv")
+        sources = [av.open(f) for f in ("example.mp4", "resources/new-commentary.mp3")]
+        with av.open(path, "w") as output:
+            streams = [
+                output.add_stream_from_template(s.streams.audio[0]) for s in sources
+            ]
+            for source, stream in zip(sources, streams):
+                for packet in source.demux(source.streams.audio[0]):
+                    if packet.dts is not None:
+                        packet.stream = stream
+                        output.mux(packet)
+                source.close()
+
+        bar = initBar("none")
+        levels = initLevels(fileinfo(path), Fraction(30), bar, None, log)
+        both = levels.audio_streams((0, 1))
+        for stream in (0, 1):
+            with av.open(path) as container:
+                audio = container.streams.audio[stream]
+                envelope = np.concatenate(list(iter_audio_blocks(audio, ENVELOPE_TB)))
+            assert np.array_equal(levels.memo[("audio", (stream,))], envelope)
+
+            alone = initLevels(fileinfo(path), Fraction(30), bar, None, log)
+            assert np.array_equal(both[stream], alone.audio(stream))
+
+    def test_levels_memo(self):
+        levels = initLevels(
+            fileinfo("example.mp4"), Fraction(30), initBar("none"), None, log
+        )
+        audio, motion = levels.audio(0), levels.motion(0, 9, 400)
+
+        assert levels.audio(0) is audio
+        assert levels.motion(0, 9, 400) is motion
+        assert levels.media_length == len(audio)
+        assert not audio.flags.writeable
+
+    def test_plan_levels(self):
+        from auto_editor.lang.palet import iter_nodes, plan_levels
+
+        bar = initBar("none")
+        code = "(or audio:0.05 motion:0.02 (not motion:width=200,blur=3))"
+        fused = initLevels(fileinfo("example.mp4"), Fraction(30), bar, None, log)
+        plan_levels(fused, list(iter_nodes(Parser(Lexer("test", code)))))
+        assert {key for key in fused.memo if key[0] != "samples"} == {
+            ("audio", (0,)),
+            ("motion", (Fraction(30), 0, 400, 9)),
+            ("motion", (Fraction(30), 0, 200, 3)),
+        }
+
+        def separate() -> Levels:
+            return initLevels(fileinfo("example.mp4"), Fraction(30), bar, None, log)
+
+        assert np.array_equal(fused.audio(0), separate().audio(0))
+        for blur, width in ((9, 400), (3, 200)):
+            motion = separate().motion(0, blur, width)
+            assert np.array_equal(fused.motion(0, blur, width), motion)
+
+    def test_keyframes(self):
+        from auto_editor.render.video import find_keyframes, plan_seek
+
+        keyframes = find_keyframes(fileinfo("example.mp4"), Fraction(30), None)
+        assert (keyframes[1] == np.arange(0, 1272, 60)).all()
+
+        assert plan_seek(keyframes, 10, 59) is None
+        assert plan_seek(keyframes, 59, 61) is None
+        assert plan_seek(keyframes, 10, 61) == 1
+        assert plan_seek(keyframes, 10, 1000) == 16
+        assert plan_seek(keyframes, 500, 130) == 2
+        assert plan_seek((keyframes[0][1:], keyframes[1][1:]), 500, 30) == -1
+
+        # What seeking saved is reported when the render finishes.
+        out = os.path.join(self.temp_dir, "seek_stats.mp4")
+        cmd = ["example.mp4", "--edit", "none", "--cut-out", "2sec,30sec"]
+        stdout = self.raw(cmd + ["--no-open", "-o", out])
+        assert "Seeks: 1\nFrames skipped by seeking: 840\n" in stdout
+
+    def test_prefetcher(self):
+        from itertools import islice
+
+        from auto_editor.render.video import Prefetcher
+
+        with av.open("example.mp4") as cn:
+            stream = cn.streams.video[0]
+            decoder = Prefetcher(cn, stream, size=4)
+            times = [next(decoder).time for _ in range(10)]
+            assert times == sorted(times), times
+
+            # Seek while the decoding thread is waiting on a full queue.
+            decoder.seek(None)
+            assert next(decoder).time == times[0]
+            assert sum(1 for _ in decoder) == 1271
+            decoder.seek(None)
+            assert next(decoder).time == times[0]
+            decoder.close()
+
+        class Failing(Prefetcher):
+            def decode(self) -> Iterator[av.VideoFrame]:
+                yield from islice(super().decode(), 3)
+                raise ValueError("bad packet")
+
+        with av.open("example.mp4") as cn:
+            # The thread only starts when a frame or a seek is asked for.
+            decoder = Failing(cn, cn.streams.video[0])
+            assert decoder.thread is None
+            assert len([next(decoder) for _ in range(3)]) == 3
+            decoder.start().join(5)
+
+            # A seek that drains the error raises it, and so does every call after.
+            for call in (lambda: decoder.seek(None), lambda: next(decoder)):
+                try:
+                    call()
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("Expected the decoding error")
+            decoder.close()
+
+    def test_skip_frames(self):
+        from auto_editor.render.video import Prefetcher, SkipPlan, find_keyframes
+
+        tb = Fraction(30)
+        keyframes = find_keyframes(fileinfo("example.mp4"), tb, None)[1]
+        # What --video-speed 8 takes from each second of the source.
+        needed = np.arange(0, 1272, 8)
+
+        def pick(frames: Iterator[av.VideoFrame]) -> list[np.ndarray]:
+            return [f.to_ndarray() for f in frames if round(f.time * tb) in needed]
+
+        with av.open("example.mp4") as cn:
+            expected = pick(cn.decode(cn.streams.video[0]))
+        assert len(expected) == len(needed)
+
+        for kf in (keyframes, None):
+            with av.open("example.mp4") as cn:
+                stream = cn.streams.video[0]
+                assert stream.time_base is not None
+                plan = SkipPlan(needed, kf, 1, stream.time_base, tb)
+                decoder = Prefetcher(cn, stream, plan)
+                picked = pick(decoder)
+                decoder.close()
+            assert all(
+                np.array_equal(a, b) for a, b in zip(picked, expected, strict=True)
+            )
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.temp_dir, "cache")
+        opts = ["--cache-dir", cache_dir, "--cache-hash", "--export", "v1"]
+        self.main(["example.mp4"], opts)
+        self.main(["example.mp4"], opts + ["--edit", "motion"])
+        with open(os.path.join(cache_dir, "index.json")) as f:
+            assert len(load("index.json", f)) == 3  # audio, samples and motion
+
+        # A new entry is written and only it fits in the budget.
+        self.main(
+            ["example.mp4"], opts + ["--edit", "motion:width=200", "--cache-size", "8K"]
+        )
+        with open(os.path.join(cache_dir, "index.json")) as f:
+            assert len(load("index.json", f)) == 1
+        self.check(["example.mp4", "--cache-size", "4X"], "Unknown unit")
+
+        cache = Cache(cache_dir, DEFAULT_SIZE, False, log)
+        with open(cache.index_path) as f:
+            (name,) = load("index.json", f)
+        assert isinstance(cache.get(name), np.memmap)
+
+        # A hit only rewrites the index once the entry's access time is old.
+        index = cache.read_index()
+        mtime = os.stat(cache.index_path).st_mtime_ns
+        assert cache.get(name) is not None
+        assert os.stat(cache.index_path).st_mtime_ns == mtime
+        index[name]["atime"] -= ATIME_RESOLUTION
+        cache.write_index(index)
+        assert cache.get(name) is not None
+        assert cache.read_index()[name]["atime"] > index[name]["atime"]
+        for path in (cache.index_path, cache.entry_path(name)):
+            assert os.stat(path).st_mode & 0o777 == 0o644
+
+        # Files left by older versions are counted, so that they get evicted.
+        np.savez(cache.entry_path("old", ".npz"), data=np.arange(4))
+        os.remove(cache.index_path)
+        assert "old" in cache.read_index() and cache.get("old") is None
+
+    def test_cache_audio(self):
+        cache_dir = os.path.join(self.temp_dir, "audio-cache")
+        opts = ["--cache-dir", cache_dir, "--cache-audio", "--silent-speed", "2"]
+
+        def read(path: str) -> np.ndarray:
+            with av.open(path) as container:
+                frames = [frame.to_ndarray() for frame in container.decode(audio=0)]
+            return np.concatenate(frames, axis=1)
+
+        decoded = read(self.main(["example.mp4"], ["--no-cache", *opts[3:]], "a.wav"))
+        assert np.array_equal(decoded, read(self.main(["example.mp4"], opts, "b.wav")))
+        with open(os.path.join(cache_dir, "index.json")) as f:
+            assert [name for name in load("index.json", f) if name.endswith("pcm")]
+        assert np.array_equal(decoded, read(self.main(["example.mp4"], opts, "c.wav")))
+
+    def test_cache_audio_size(self):
+        def run(cache_dir: str, size: str) -> str:
+            cmd = ["example.mp4", "--cache-dir", cache_dir, "--cache-size", size]
+            cmd += ["--cache-audio", "--silent-speed", "2", "--debug", "--no-open"]
+            cmd += ["--progress", "none", "-o", os.path.join(self.temp_dir, "a.wav")]
+            returncode, stdout, stderr = pipe_to_console(self.program + cmd)
+            assert returncode == 0, stderr
+            return stderr
+
+        # The samples take 8142976 bytes, and the envelopes push the total over.
+        cache_dir = os.path.join(self.temp_dir, "audio-cache-size")
+        run(cache_dir, "8100K")
+        cache = Cache(cache_dir, DEFAULT_SIZE, False, log)
+        (name,) = (name for name in cache.read_index() if name.endswith("pcm"))
+        mtime = os.stat(cache.entry_path(name)).st_mtime_ns
+
+        # The second run neither decodes the samples again nor while rendering.
+        assert "Cached audio for example.mp4: True" in run(cache_dir, "8100K")
+        assert os.stat(cache.entry_path(name)).st_mtime_ns == mtime
+
+        # Samples bigger than the whole cache aren't decoded for it.
+        cache_dir = os.path.join(self.temp_dir, "audio-cache-small")
+        assert "Not caching the samples" in run(cache_dir, "5M")
+        cache = Cache(cache_dir, DEFAULT_SIZE, False, log)
+        assert not [name for name in cache.read_index() if name.endswith("pcm")]
+
+    def test_cache_shared(self):
+        cache_dir = os.path.join(self.temp_dir, "shared-cache")
+        edits = ("audio", "motion", "motion:width=200", "audio:threshold=0.1")
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for _ in executor.map(
+                lambda edit: self.main(
+                    ["example.mp4"],
+                    ["--cache-dir", cache_dir, "--edit", edit, "--export", "v1"],
+                ),
+                edits * 2,
+            ):
+                pass
+
+        cache = Cache(cache_dir, DEFAULT_SIZE, False, log)
+        index = cache.read_index()
+        assert len(index) == 4, index
+        for name in index:
+            assert cache.get(name) is not None
+        assert not [f for f in os.listdir(cache_dir) if f.endswith(".tmp")]
+
+    def test_analysis_workers(self):
+        # Segments are at least a minute long, so two need over two minutes.
+        path = repeat_media("example.mp4", 3, os.path.join(self.temp_dir, "long.mp4"))
+        bar = initBar("none")
+        sequential = initLevels(fileinfo(path), Fraction(30), bar, None, log)
+        parallel = initLevels(fileinfo(path), Fraction(30), bar, None, log, 2)
+
+        sequential.audio(0)
+        envelope = sequential.memo[("audio", (0,))]
+        assert len(parallel.segments(len(envelope), ENVELOPE_TB)) == 2
+        arrs = parallel.parallel_audio([0], len(envelope))
+        assert arrs is not None and np.array_equal(arrs[0], envelope)
+
+        motion = sequential.motion(0, 9, 400)
+        arr = parallel.parallel_motion(0, 9, 400, len(motion))
+        assert arr is not None and np.array_equal(arr, motion)
+
+        self.main(["example.mp4"], ["--analysis-workers", "2", "--no-cache"])
+        self.check(["example.mp4", "--analysis-workers", "0"], "at least 1")
+
     def test_edit_negative(self):
         self.check(
             ["resources/wav/example-cut-s16le.wav", "--edit", "motion"],
@@ -551,6 +1121,81 @@ class Runner:
             ["example.mp4"], ["--audio-normalize", "ebu:i=-5,lra=20,gain=5,tp=-1"]
         )
 
+    def test_audio_getter(self):
+        from pathlib import Path
+
+        from auto_editor.render.audio import Getter
+
+        resampler = av.AudioResampler(format="s16p", layout="stereo", rate=48000)
+        with av.open("example.mp4") as container:
+            whole = np.concatenate(
+                [
+                    resampled.to_ndarray()
+                    for frame in container.decode(audio=0)
+                    for resampled in resampler.resample(frame)
+                ],
+                axis=1,
+            )
+
+        # Reads match decoding the whole stream, even going back or skipping ahead.
+        getter = Getter(Path("example.mp4"), 0, 48000)
+        for start, end in [
+            (0, 1000),
+            (500, 30000),
+            (1_500_000, 1_600_000),
+            (900, 40000),
+        ]:
+            assert np.array_equal(getter.get(start, end), whole[:, start:end])
+
+    def test_audio_clips(self) -> None:
+        from auto_editor.render.audio import make_clip_graph, process_audio_clip
+        from auto_editor.timeline import Clip
+
+        sr = 48000
+        tone = np.sin(2 * np.pi * 440 * np.arange(96001) / sr) * 20000
+        loud = np.tile(tone.astype(np.int16), (2, 1))
+        lengths = [1000, 3, 12000, 96001, 0]
+        graphs: dict = {}
+
+        def flushed(speed: float, data: np.ndarray) -> np.ndarray:
+            graph = make_clip_graph(speed, 1, sr)
+            frames: list[np.ndarray] = [np.zeros((2, 0), np.int16)]
+            for i in [*range(0, data.shape[1], 4096), None]:
+                if i is None:
+                    graph.push(None)
+                else:
+                    chunk = np.ascontiguousarray(data[:, i : i + 4096])
+                    frame = av.AudioFrame.from_ndarray(chunk, "s16p", "stereo")
+                    frame.sample_rate = sr
+                    graph.push(frame)
+                while True:
+                    try:
+                        pulled = graph.pull()
+                    except (av.BlockingIOError, av.EOFError):
+                        break
+                    assert isinstance(pulled, av.AudioFrame)
+                    frames.append(pulled.to_ndarray())
+            length = round(data.shape[1] / speed)
+            out = np.concatenate(frames, axis=1)[:, :length]
+            return np.pad(out, ((0, 0), (0, length - out.shape[1])))
+
+        # A graph used again for later clips still changes just the volume.
+        quieter = Clip(0, 1, None, 0, 0, 1, 0.5)  # type: ignore
+        for length in lengths:
+            data = loud[:, :length]
+            out = process_audio_clip(quieter, data, sr, log, graphs)
+            assert np.array_equal(out, np.round(data * 0.5).astype(np.int16))
+
+        # Each speed clip sounds as if it went through a graph of its own.
+        for speed in (8, 1.5, 0.4, 150):
+            clip = Clip(0, 1, None, 0, 0, speed)  # type: ignore
+            for length in lengths:
+                data = loud[:, :length]
+                out = process_audio_clip(clip, data, sr, log, graphs)
+                assert out.shape == (2, round(length / speed))
+                if out.shape[1]:
+                    assert np.array_equal(out, flushed(speed, data))
+
     def palet_python_bridge(self):
         env.update(make_standard_env())
 
@@ -640,6 +1285,18 @@ class Runner:
                 "(margin (bool-array 0 0 1 1 0 0 0) -2 2)",
                 np.array([0, 0, 0, 0, 1, 1, 0], dtype=np.bool_),
             ),
+            (
+                "(minclip (bool-array 1 1 0 1 0 0 1 1 1 1) 3)",
+                np.array([0, 0, 0, 0, 0, 0, 1, 1, 1, 1], dtype=np.bool_),
+            ),
+            (
+                "(mincut (bool-array 1 0 0 1 0 0 0 1 1 0) 3)",
+                np.array([1, 1, 1, 1, 0, 0, 0, 1, 1, 1], dtype=np.bool_),
+            ),
+            (
+                "(maxclip (bool-array 1 1 1 0 1 0 1 1 1 1) 3)",
+                np.array([1, 1, 1, 0, 1, 0, 0, 0, 0, 0], dtype=np.bool_),
+            ),
             ("(equal? 3 3)", True),
             ("(equal? 3 3.0)", False),
             ('(equal? 16.3 "Editor")', False),
@@ -696,8 +1353,370 @@ class Runner:
             ("(define v #(2 0 3 -4 -2 5 1 4)) v.sort", [-4, -2, 0, 1, 2, 3, 4, 5]),
             ("(define v #(2 0 3 -4 -2 5 1 4)) v.sort! v", [-4, -2, 0, 1, 2, 3, 4, 5]),
             ('#(#("sym" "symbol?") "bool?")', [["sym", "symbol?"], "bool?"]),
+            ("(cond [(= 1 2) 1] [(= 1 1)] [else 3])", True),
+            ("(case 3 [(1 2) 'low] [else 'high])", Sym("high")),
+            ("(let* ([a 2] [b (* a 3)]) (let ([a b]) (+ a b)))", 12),
+            ('(define s "a") (for ([i 3]) (&= s "b")) s', "abbb"),
+            ("(define n 0) (for-items (k v (hash 1 2 3 4)) (incf n v)) n", 6),
+            ("(and #t (or #f #t) (> 2 1))", True),
+            ("(define/c (half [x int?]) (/ x 2)) (half 8)", 4),
+            ("(define add (λ (a b) (+ a b))) (add 2 3)", 5),
+            # Malformed forms are only an error when they run.
+            ("(if #f (cond 5) 1)", 1),
+        )
+
+        # Compiled nodes can run again, the way --edit runs for every source.
+        code = "(define x 0) (for ([i 4]) (incf x i)) x"
+        nodes = [compile_node(node) for node in iter_nodes(Parser(Lexer("t", code)))]
+        assert eval_nodes(env, nodes)[-1] == 6
+        assert eval_nodes(env, nodes)[-1] == 6
+
+    def bench_remove_small(self) -> None:
+        from auto_editor.analyze import mut_remove_large, mut_remove_small
+
+        def loop_remove(arr: np.ndarray, lim: int, replace: int, large: bool) -> None:
+            start_p = 0
+            active = False
+            for j, item in enumerate(arr):
+                if item == replace:
+                    if not active:
+                        start_p = j
+                        active = True
+
+                    if j == len(arr) - 1:
+                        if (j - start_p >= lim) if large else (j - start_p < lim):
+                            arr[start_p:] = 1 - replace
+                elif active:
+                    if (j - start_p > lim) if large else (j - start_p < lim):
+                        arr[start_p:j] = 1 - replace
+                    active = False
+
+        # Six hours at 60 fps.
+        rng = np.random.default_rng(0)
+        arr = rng.random(6 * 60 * 60 * 60) < 0.6
+        for lim, replace, large in ((3, 1, False), (6, 0, False), (10, 0, True)):
+            old, new = arr.copy(), arr.copy()
+            func = mut_remove_large if large else mut_remove_small
+            bench(
+                f"{func.__name__}({lim}, {replace})",
+                lambda: loop_remove(old, lim, replace, large),
+                lambda: func(new, lim, replace, 1 - replace),
+            )
+            assert np.array_equal(old, new)
+
+    def bench_margin(self) -> None:
+        from auto_editor.utils.func import mut_margin
+
+        def loop_margin(arr: np.ndarray, start_m: int, end_m: int) -> None:
+            starts: list[int] = []
+            ends: list[int] = []
+            for j in range(1, len(arr)):
+                if arr[j] != arr[j - 1]:
+                    (starts if arr[j] else ends).append(j)
+
+            if start_m > 0:
+                for i in starts:
+                    arr[max(i - start_m, 0) : i] = True
+            if start_m < 0:
+                for i in starts:
+                    arr[i : min(i - start_m, len(arr))] = False
+            if end_m > 0:
+                for i in ends:
+                    arr[i : min(i + end_m, len(arr))] = True
+            if end_m < 0:
+                for i in ends:
+                    arr[max(i + end_m, 0) : i] = False
+
+        # Six hours at 30 fps.
+        rng = np.random.default_rng(0)
+        arr = rng.random(6 * 60 * 60 * 30) < 0.6
+        for start_m, end_m in ((6, 6), (-3, 9), (4, -12)):
+            old, new = arr.copy(), arr.copy()
+            bench(
+                f"mut_margin({start_m}, {end_m})",
+                lambda: loop_margin(old, start_m, end_m),
+                lambda: mut_margin(new, start_m, end_m),
+            )
+
+    def bench_make_clips(self) -> None:
+        from auto_editor.make_layers import make_clips
+
+        def loop_clips(
+            arr: np.ndarray, src_index: np.ndarray, sources: list, speed_map: list
+        ) -> list[tuple]:
+            chunks = []
+            start = doi = j = 0
+            for j in range(1, len(arr)):
+                if arr[j] != arr[j - 1] or src_index[j] != src_index[j - 1]:
+                    src = sources[src_index[j - 1]]
+                    chunks.append((src, start, j - doi, speed_map[arr[j - 1]]))
+                    start = j - doi
+                    if src_index[j] != src_index[j - 1]:
+                        start, doi = 0, j
+            chunks.append((sources[src_index[j]], start, len(arr), speed_map[arr[j]]))
+
+            clips = []
+            start = 0
+            for src, offset, end, speed in chunks:
+                if speed != 99999 and (dur := int((end - offset) / speed)) != 0:
+                    clips.append((start, dur, ceil(offset / speed), speed, src))
+                    start += dur
+            return clips
+
+        # 150 sources, ten minutes each at 30 fps.
+        rng = np.random.default_rng(0)
+        sources = [f"{i}.mp4" for i in range(150)]
+        src_index = np.repeat(np.arange(150, dtype=np.int32), 10 * 60 * 30)
+        # Loud and quiet parts last about a second.
+        runs = rng.integers(1, 60, len(src_index) // 20)
+        arr = np.repeat(rng.integers(0, 3, len(runs)), runs)[: len(src_index)]
+        arr = arr.astype(np.uint)
+        speed_map = [99999.0, 1.0, 1.5]
+
+        bench(
+            "make_clips",
+            lambda: loop_clips(arr, src_index, sources, speed_map),
+            lambda: make_clips(arr, src_index, sources, speed_map),  # type: ignore
         )
 
+    def bench_filter_graphs(self) -> None:
+        from auto_editor.render.video import make_graph
+
+        with av.open("resources/testsrc.mp4") as container:
+            stream = container.streams.video[0]
+            frame = next(container.decode(stream))
+            filters = (
+                ("scale", "1280:720:force_original_aspect_ratio=decrease:eval=frame"),
+                ("pad", "1280:720:-1:-1:color=#000000"),
+            )
+
+            def per_frame() -> None:
+                for _ in range(500):
+                    graph = make_graph(stream, frame, *filters)
+                    graph.vpush(frame)
+                    graph.vpull()
+
+            def reused() -> None:
+                graph = make_graph(stream, frame, *filters)
+                for _ in range(500):
+                    graph.vpush(frame)
+                    graph.vpull()
+
+            bench("scale and pad graphs (500 frames)", per_frame, reused)
+
+    def bench_overlays(self) -> None:
+        from auto_editor.render.video import copy_frame, image_blend
+        from auto_editor.timeline import TlImage
+
+        with av.open("resources/testsrc.mp4") as container:
+            frame = next(container.decode(container.streams.video[0]))
+        frame = frame.reformat(1280, 720)
+        img = np.random.default_rng(0).integers(0, 256, (120, 200, 3), np.uint8)
+        obj = TlImage(0, 1, None, 1000, 600, 0, 0.6)  # type: ignore
+
+        def rgb24() -> None:
+            for _ in range(300):
+                array = frame.to_ndarray(format="rgb24")
+                roi = array[600:720, 1000:1200]
+                blended = (1 - obj.opacity) * roi + obj.opacity * img
+                array[600:720, 1000:1200] = blended
+                array = np.clip(array, 0, 255).astype(np.uint8)
+                out = av.VideoFrame.from_ndarray(array, format="rgb24")
+                out.reformat(format="yuv420p")
+
+        def native() -> None:
+            blend = image_blend(img, obj, frame)
+            for _ in range(300):
+                blend.apply(copy_frame(frame))
+
+        bench("image overlay (300 frames)", rgb24, native)
+
+    def bench_skip_frames(self) -> None:
+        from auto_editor.render.video import Prefetcher, SkipPlan, find_keyframes
+
+        tb = Fraction(30)
+        keyframes = find_keyframes(fileinfo("example.mp4"), tb, None)[1]
+        # What --video-speed 8 takes from each second of the source.
+        needed = np.arange(0, 1272, 8)
+
+        def pick(frames: Iterator[av.VideoFrame]) -> None:
+            for frame in frames:
+                if round(frame.time * tb) in needed:
+                    frame.to_ndarray()
+
+        def decode_all() -> None:
+            with av.open("example.mp4") as cn:
+                pick(cn.decode(cn.streams.video[0]))
+
+        def decode_needed() -> None:
+            with av.open("example.mp4") as cn:
+                stream = cn.streams.video[0]
+                assert stream.time_base is not None
+                plan = SkipPlan(needed, keyframes, 1, stream.time_base, tb)
+                decoder = Prefetcher(cn, stream, plan)
+                pick(decoder)
+                decoder.close()
+
+        bench("decode every 8th frame", decode_all, decode_needed)
+
+    def bench_audio_getter(self) -> None:
+        from pathlib import Path
+
+        from auto_editor.render.audio import Getter
+
+        # Many short clips with short gaps, as a jumpy silence edit makes.
+        clips = [(i, i + 2400) for i in range(0, 2_000_000, 4800)]
+
+        def seek_each() -> None:
+            with av.open("example.mp4") as container:
+                stream = container.streams.audio[0]
+                assert stream.time_base is not None
+                for start, end in clips:
+                    resampler = av.AudioResampler(
+                        format="s16p", layout="stereo", rate=48000
+                    )
+                    container.seek(int(start / 48000 / stream.time_base), stream=stream)
+                    total = 0
+                    for frame in container.decode(stream):
+                        for resampled in resampler.resample(frame):
+                            total += resampled.samples
+                        if total >= end - start:
+                            break
+
+        def cursor() -> None:
+            getter = Getter(Path("example.mp4"), 0, 48000)
+            for start, end in clips:
+                getter.get(start, end)
+
+        bench(f"audio getter ({len(clips)} clips)", seek_each, cursor)
+
+    def bench_audio_clips(self) -> None:
+        from io import BytesIO
+
+        from auto_editor.render.audio import process_audio_clip
+        from auto_editor.timeline import Clip
+
+        sr = 48000
+        rng = np.random.default_rng(0)
+        datas = [rng.integers(-3000, 3000, (2, 12000), np.int16) for _ in range(200)]
+        # What --silent-speed 8 and a quieter --video-speed make.
+        clips = [Clip(0, 1, None, 0, 0, 8), Clip(0, 1, None, 0, 0, 1, 0.5)]  # type: ignore
+
+        def through_wav() -> None:
+            for clip in clips:
+                for data in datas:
+                    buffer = BytesIO()
+                    with av.open(buffer, "w", format="wav") as output:
+                        stream = output.add_stream(
+                            "pcm_s16le", sample_rate=sr, format="s16", layout="stereo"
+                        )
+                        frame = av.AudioFrame.from_ndarray(
+                            data, format="s16p", layout="stereo"
+                        )
+                        frame.rate = sr
+                        to_s16 = av.AudioResampler("s16", "stereo", sr)
+                        for reframe in to_s16.resample(frame):
+                            output.mux(stream.encode(reframe))
+                        output.mux(stream.encode(None))
+
+                    buffer.seek(0)
+                    with av.open(buffer) as container:
+                        assert isinstance(container, av.container.InputContainer)
+                        graph = av.filter.Graph()
+                        nodes = [graph.add_abuffer(template=container.streams.audio[0])]
+                        if clip.speed != 1:
+                            nodes.append(graph.add("atempo", f"{clip.speed}"))
+                        if clip.volume != 1:
+                            nodes.append(graph.add("volume", f"{clip.volume}"))
+                        nodes.append(graph.add("abuffersink"))
+                        graph.link_nodes(*nodes).configure()
+
+                        to_s16p = av.AudioResampler("s16p", "stereo", sr)
+                        out = []
+                        for frame in container.decode(audio=0):
+                            graph.push(frame)
+                            while True:
+                                try:
+                                    pulled = graph.pull()
+                                except (av.BlockingIOError, av.EOFError):
+                                    break
+                                assert isinstance(pulled, av.AudioFrame)
+                                out += [
+                                    f.to_ndarray() for f in to_s16p.resample(pulled)
+                                ]
+
+        def direct() -> None:
+            graphs: dict = {}
+            for clip in clips:
+                for data in datas:
+                    process_audio_clip(clip, data, sr, log, graphs)
+
+        bench(
+            f"audio clip effects ({len(clips) * len(datas)} clips)", through_wav, direct
+        )
+
+    def bench_iter_objects(self) -> None:
+        from itertools import islice
+
+        from auto_editor.render.video import VideoFrame, iter_objects
+        from auto_editor.timeline import Clip, TlRect
+
+        def loop_objects(layers: list[list], end: int) -> Iterator[list[object]]:
+            for index in range(end):
+                obj_list: list[object] = []
+                for layer in layers:
+                    for lobj in layer:
+                        if index >= lobj.start and index < lobj.start + lobj.dur:
+                            if isinstance(lobj, Clip):
+                                _i = round(
+                                    (lobj.offset + index - lobj.start) * lobj.speed
+                                )
+                                obj_list.append(VideoFrame(_i, lobj.src))
+                            else:
+                                obj_list.append(lobj)
+                yield obj_list
+
+        # 20k clips of about two seconds, with boxes on top of some of them.
+        layers: list[list] = [
+            [Clip(i * 60, 60, "a.mp4", i * 90, 0, 1.5) for i in range(20_000)],  # type: ignore
+            [TlRect(i * 600, 300, 0, 0, 10, 10, "#000") for i in range(2_000)],
+        ]
+        end = 20_000 * 60
+        frames = 3_000  # The old loop is too slow to go any further.
+
+        bench(
+            f"iter_objects ({frames} frames)",
+            lambda: list(islice(loop_objects(layers, end), frames)),
+            lambda: list(islice(iter_objects(layers, end), frames)),
+        )
+
+        start = perf_counter()
+        assert sum(1 for _ in iter_objects(layers, end)) == end
+        print(f"iter_objects (all {end} frames): {perf_counter() - start:.3f} secs")
+
+    def bench_palet_loops(self) -> None:
+        # The sort of loops a config.pal runs over every frame.
+        code = """
+        (define (collatz n)
+          (define steps 0)
+          (while (> n 1)
+            (if (even? n) (set! n (div n 2)) (set! n (+ (* 3 n) 1)))
+            (incf steps))
+          steps)
+        (define total 0)
+        (for ([i (range 1 3000)]) (incf total (collatz i)))
+        (define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+        (define loud 0)
+        (for ([x (bool-array 1 0 1 1 0 1 0 0 1 1)])
+          (when (= x 1) (incf loud)))
+        #(total (fib 18) loud)
+        """
+        env.update(make_standard_env())
+        start = perf_counter()
+        results = interpret(env, Parser(Lexer("bench", code)))
+        print(f"palet loops: {perf_counter() - start:.3f} secs", flush=True)
+        assert results[-1] == [215015, 2584, 6]
+
     def palet_scripts(self) -> None:
         self.raw(["palet", "resources/scripts/scope.pal"])
         self.raw(["palet", "resources/scripts/maxcut.pal"])
@@ -795,6 +1814,15 @@ def main(sys_args: list[str] | None = None) -> None:
             [test_methods[name] for name in ["info", "levels", "subdump", "desc"]]
         )
 
+    if args.category == "bench":
+        tests.extend(
+            [
+                getattr(run, name)
+                for name in dir(Runner)
+                if callable(getattr(Runner, name)) and name.startswith("bench_")
+            ]
+        )
+
     if args.category in {"cli", "all"}:
         tests.extend(
             [
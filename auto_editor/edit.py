@@ -16,16 +16,20 @@ from auto_editor.ffwrapper import FileInfo
 from auto_editor.lib.contracts import is_int, is_str
 from auto_editor.make_layers import clipify, make_av, make_timeline
 from auto_editor.render.audio import make_new_audio
+from auto_editor.render.smart import copyable_clips, smart_render
 from auto_editor.render.subtitle import make_new_subtitles
-from auto_editor.render.video import render_av
+from auto_editor.render.video import render_av, render_parallel
 from auto_editor.timeline import set_stream_to_0, v1, v3
 from auto_editor.utils.bar import initBar
+from auto_editor.utils.cache import Cache, default_dir
 from auto_editor.utils.chunks import Chunk, Chunks
 from auto_editor.utils.cmdkw import ParserError, parse_with_palet, pAttr, pAttrs
 from auto_editor.utils.container import Container, container_constructor
 from auto_editor.utils.log import Log
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     from auto_editor.__main__ import Args
 
 
@@ -211,8 +215,14 @@ def edit_media(paths: list[str], args: Args, log: Log) -> None:
     else:
         samplerate = args.sample_rate
 
+    if args.no_cache:
+        cache = None
+    else:
+        cache_dir = default_dir() if args.cache_dir is None else args.cache_dir
+        cache = Cache(cache_dir, args.cache_size, args.cache_hash, log)
+
     if tl is None:
-        tl = make_timeline(sources, args, samplerate, bar, log)
+        tl = make_timeline(sources, args, samplerate, cache, bar, log)
     else:
         if args.resolution is not None:
             tl.T.res = args.resolution
@@ -226,7 +236,7 @@ def edit_media(paths: list[str], args: Args, log: Log) -> None:
     if args.preview:
         from auto_editor.preview import preview
 
-        preview(tl, log)
+        preview(tl, cache, log)
         return
 
     if export in {"v1", "v3"}:
@@ -292,7 +302,17 @@ def edit_media(paths: list[str], args: Args, log: Log) -> None:
 
         # Setup video
         if ctr.default_vid not in ("none", "png") and tl.v:
-            vframes = render_av(output, tl, args, log)
+            clips = copyable_clips(tl, args) if args.smart_render else None
+            if args.smart_render and clips is None:
+                log.warning("Can't copy video from this timeline, rendering it instead")
+
+            vframes: Iterator[tuple[int, av.VideoFrame | av.Packet]]
+            if clips is not None:
+                vframes = smart_render(output, tl, clips, args, cache, log)
+            elif args.render_workers > 1:
+                vframes = render_parallel(output, tl, args, cache, log)
+            else:
+                vframes = render_av(output, tl, args, cache, log)
             output_stream: av.VideoStream | None
             output_stream = next(vframes)  # type: ignore
         else:
@@ -319,7 +339,9 @@ def edit_media(paths: list[str], args: Args, log: Log) -> None:
                 tl.a.pop()
 
         if len(tl.a) > 0:
-            audio_streams, audio_gen_frames = make_new_audio(output, fmt, tl, args, log)
+            audio_streams, audio_gen_frames = make_new_audio(
+                output, fmt, tl, args, cache, log
+            )
         else:
             audio_streams, audio_gen_frames = [], [iter([])]
 
@@ -455,7 +477,11 @@ def edit_media(paths: list[str], args: Args, log: Log) -> None:
                 frame_type = item.frame_type
                 bar_index = None
                 try:
-                    if frame_type in {"video", "audio"}:
+                    if isinstance(item.frame, av.Packet):
+                        # Video already encoded by a render worker.
+                        bar_index = item.index
+                        output.mux(item.frame)
+                    elif frame_type in {"video", "audio"}:
                         if item.frame.time is not None:
                             bar_index = round(item.frame.time * tl.tb)
                         output.mux(item.stream.encode(item.frame))
@@ -475,7 +501,7 @@ def edit_media(paths: list[str], args: Args, log: Log) -> None:
                     bar.tick(bar_index)
 
         # Flush streams
-        if output_stream is not None:
+        if output_stream is not None and output_stream.codec_context.is_open:
             output.mux(output_stream.encode(None))
         for audio_stream in audio_streams:
             output.mux(audio_stream.encode(None))
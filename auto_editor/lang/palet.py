@@ -20,12 +20,13 @@ from auto_editor.lib.err import MyError
 from auto_editor.utils.func import boolop
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Iterable, Iterator
     from typing import Any, NoReturn, TypeGuard
 
     from numpy.typing import NDArray
 
     Node = tuple
+    Compiled = Callable[[Env], Any]
 
 
 class ClosingError(MyError):
@@ -436,10 +437,18 @@ class Parser:
 
 
 class Syntax:
-    __slots__ = "syn"
-
-    def __init__(self, syn: Callable[[Env, Node], Any]):
+    __slots__ = ("syn", "comp")
+
+    def __init__(
+        self,
+        syn: Callable[[Env, Node], Any],
+        comp: Callable[[Node], Compiled | None] | None = None,
+    ):
+        # `comp` may expand a well-formed node ahead of time. Anything it
+        # returns None or raises MyError for is left to `syn`, which reports the
+        # error when the node runs.
         self.syn = syn
+        self.comp = comp
 
     def __call__(self, env: Env, node: Node) -> Any:
         return self.syn(env, node)
@@ -541,8 +550,8 @@ def edit_audio(
         stream_range = range(stream, stream + 1)
 
     try:
-        for s in stream_range:
-            audio_list = levels.audio(s) >= threshold
+        for levels_arr in levels.audio_streams(stream_range):
+            audio_list = levels_arr >= threshold
             if stream_data is None:
                 stream_data = audio_list
             else:
@@ -591,6 +600,71 @@ def edit_subtitle(pattern, stream=0, **kwargs):
         return np.array([], dtype=np.bool_)
 
 
+def plan_levels(levels: Levels, nodes: list[Any]) -> None:
+    """
+    Find every `audio` and `motion` call whose arguments are literals, and have
+    `levels` analyze them together so the media is only demuxed once.
+    """
+    streams: list[int] = []
+    mobjs: list[tuple[int, int, int]] = []
+    parms = {
+        "audio": ("threshold", "stream", "mincut", "minclip"),
+        "audio-levels": ("stream",),
+        "motion": ("threshold", "stream", "blur", "width"),
+        "motion-levels": ("stream", "blur", "width"),
+    }
+
+    def get_args(node: Node, names: tuple[str, ...]) -> dict[str, Any] | None:
+        args: dict[str, Any] = {}
+        i = 1
+        while i < len(node):
+            if type(node[i]) is Keyword:
+                if i + 1 >= len(node):
+                    return None
+                args[node[i].val] = node[i + 1]
+                i += 2
+            else:
+                if i > len(names):
+                    return None
+                args[names[i - 1]] = node[i]
+                i += 1
+        return args
+
+    def add_call(node: Node) -> None:
+        name = node[0].val
+        if (args := get_args(node, parms[name])) is None:
+            return
+
+        if name.startswith("audio"):
+            stream = args.get("stream", Sym("all") if name == "audio" else None)
+            if stream == Sym("all"):
+                streams.extend(range(len(levels.container.streams.audio)))
+            elif type(stream) is int:
+                streams.append(stream)
+        else:
+            mobj = (args.get("stream", 0), args.get("width", 400), args.get("blur", 9))
+            if all(type(v) is int for v in mobj):
+                mobjs.append(mobj)
+
+    def walk(node: object) -> None:
+        if type(node) is list:
+            for item in node:
+                walk(item)
+        elif type(node) is tuple and node:
+            if type(node[0]) is Sym and node[0].val in parms:
+                add_call(node)
+            for item in node:
+                walk(item)
+
+    for node in nodes:
+        if type(node) is Sym and node.val in parms:
+            add_call((node,))  # A bare proc is called with its defaults.
+        walk(node)
+
+    if streams and mobjs:
+        levels.analyze(streams, mobjs)
+
+
 class StackTraceManager:
     __slots__ = ("stack",)
 
@@ -608,35 +682,68 @@ class StackTraceManager:
 stack_trace_manager = StackTraceManager()
 
 
-def my_eval(env: Env, node: object) -> Any:
-    def make_trace(sym: object) -> str:
-        return f"  at {sym.val} ({sym.lineno}:{sym.column})" if type(sym) is Sym else ""
+def make_trace(sym: object) -> str:
+    return f"  at {sym.val} ({sym.lineno}:{sym.column})" if type(sym) is Sym else ""
 
-    if type(node) is Sym:
-        val = env.get(node.val)
-        if type(val) is NotFound:
-            stacktrace = make_trace(node)
-            if mat := get_close_matches(node.val, env.data):
-                raise MyError(
-                    f"variable `{node.val}` not found. Did you mean: {mat[0]}\n{stacktrace}"
-                )
-            raise MyError(
-                f"variable `{node.val}` not found. Did you mean a string literal.\n{stacktrace}"
-            )
-        return val
 
-    if type(node) is list:
-        return [my_eval(env, item) for item in node]
+def not_found(env: Env, sym: Sym) -> MyError:
+    stacktrace = make_trace(sym)
+    if mat := get_close_matches(sym.val, env.data):
+        return MyError(
+            f"variable `{sym.val}` not found. Did you mean: {mat[0]}\n{stacktrace}"
+        )
+    return MyError(
+        f"variable `{sym.val}` not found. Did you mean a string literal.\n{stacktrace}"
+    )
 
-    if type(node) is tuple:
-        if not node:
-            raise MyError("Illegal () expression")
 
-        oper = my_eval(env, node[0])
-        if isinstance(node[0], Sym):
-            stack_trace_manager.push(node[0])
+def compile_sym(sym: Sym) -> Compiled:
+    name = sym.val
+
+    def lookup(env: Env) -> Any:
+        scope: Env | None = env
+        while scope is not None:
+            if name in scope.data:
+                return scope.data[name]
+            scope = scope.outer
+        raise not_found(env, sym)
+
+    return lookup
+
+
+def compile_call(node: Node) -> Compiled:
+    head = node[0]
+    get_oper = compile_node(head)
+    arg_fns = tuple(compile_node(item) for item in node[1:])
+    trace = make_trace(head)
+    has_sym = isinstance(head, Sym)
+
+    def add_trace(e: MyError) -> MyError:
+        error_msg = str(e)
+        if not error_msg.endswith(trace):
+            error_msg += f"\n{trace}"
+        return MyError(error_msg)
+
+    expanded: tuple[Syntax, Compiled | None] | None = None
+    stack = stack_trace_manager.stack
+
+    def call(env: Env) -> Any:
+        nonlocal expanded
+
+        oper = get_oper(env)
+        if has_sym:
+            stack.append(head)
 
         try:
+            if type(oper) is Syntax:
+                # Names can be redefined at any time, so an expansion is only
+                # used while the head still refers to the form it came from.
+                if expanded is None or expanded[0] is not oper:
+                    expanded = (oper, expand(oper, node))
+                if expanded[1] is not None:
+                    return expanded[1](env)
+                return oper(env, node)
+
             if not callable(oper):
                 """
                 ...No one wants to write (aref a x y) when they could write a[x,y].
@@ -645,44 +752,92 @@ def my_eval(env: Env, node: object) -> Any:
                 we could write (a x y) instead, which is even shorter than the Perl form.
                 """
                 if is_iterable(oper):
-                    length = len(node[1:])
+                    length = len(arg_fns)
                     if length > 3:
-                        raise MyError(f"{print_str(node[0])}: slice expects 1 argument")
+                        raise MyError(f"{print_str(head)}: slice expects 1 argument")
                     if length in {2, 3}:
-                        return p_slice(oper, *(my_eval(env, c) for c in node[1:]))
+                        return p_slice(oper, *(f(env) for f in arg_fns))
                     if length == 1:
-                        return ref(oper, my_eval(env, node[1]))
+                        return ref(oper, arg_fns[0](env))
 
                 raise MyError(
                     f"{print_str(oper)} is not a function. Tried to run with args: {print_str(node[1:])}"
                 )
 
-            if type(oper) is Syntax:
-                return oper(env, node)
-
-            i = 1
-            args: list[Any] = []
-            kwargs: dict[str, Any] = {}
-            while i < len(node):
-                result = my_eval(env, node[i])
-                if type(result) is Keyword:
-                    i += 1
-                    if i >= len(node):
-                        raise MyError("Keyword need argument")
-                    kwargs[result.val] = my_eval(env, node[i])
-                else:
-                    args.append(result)
-                i += 1
-
-            return oper(*args, **kwargs)
+            args = [f(env) for f in arg_fns]
+            for arg in args:
+                if type(arg) is Keyword:
+                    pos, kwargs = split_kwargs(args)
+                    return oper(*pos, **kwargs)
+            return oper(*args)
         except MyError as e:
-            error_msg = str(e)
-            if not error_msg.endswith(make_trace(node[0])):
-                error_msg += f"\n{make_trace(node[0])}"
-            raise MyError(error_msg)
+            raise add_trace(e)
         finally:
-            if isinstance(node[0], Sym):
-                stack_trace_manager.pop()
+            if has_sym and stack:
+                stack.pop()
+
+    return call
+
+
+def expand(oper: Syntax, node: Node) -> Compiled | None:
+    if oper.comp is None:
+        return None
+    try:
+        return oper.comp(node)
+    except MyError:
+        return None
+
+
+def split_kwargs(args: list[Any]) -> tuple[list[Any], dict[str, Any]]:
+    """Pair each keyword argument with the value that follows it."""
+    i = 0
+    pos: list[Any] = []
+    kwargs: dict[str, Any] = {}
+    while i < len(args):
+        if type(args[i]) is Keyword:
+            i += 1
+            if i >= len(args):
+                raise MyError("Keyword need argument")
+            kwargs[args[i - 1].val] = args[i]
+        else:
+            pos.append(args[i])
+        i += 1
+    return pos, kwargs
+
+
+def compile_node(node: object) -> Compiled:
+    """
+    Turn `node` into a closure that evaluates it. Symbol names, argument lists and
+    stack trace text are worked out once here instead of on every evaluation.
+    """
+    if type(node) is Sym:
+        return compile_sym(node)
+    if type(node) is tuple:
+        return compile_call(node) if node else empty_call
+    if type(node) is list:
+        item_fns = tuple(compile_node(item) for item in node)
+
+        def make_list(env: Env) -> Any:
+            return [f(env) for f in item_fns]
+
+        return make_list
+
+    return lambda env: node
+
+
+def empty_call(_: Env) -> Any:
+    raise MyError("Illegal () expression")
+
+
+def my_eval(env: Env, node: object) -> Any:
+    if type(node) is Sym:
+        val = env.get(node.val)
+        if type(val) is NotFound:
+            raise not_found(env, node)
+        return val
+
+    if type(node) is list or type(node) is tuple:
+        return compile_node(node)(env)
 
     return node
 
@@ -710,12 +865,24 @@ env.update({
 # fmt: on
 
 
+def iter_nodes(parser: Parser) -> Iterator[object]:
+    while parser.current_token.type != EOF:
+        yield parser.expr()
+
+
 def interpret(env: Env, parser: Parser) -> list[object]:
-    result = []
+    return eval_nodes(env, map(compile_node, iter_nodes(parser)))
 
+
+def eval_nodes(env: Env, nodes: Iterable[Compiled]) -> list[object]:
+    """
+    Evaluate compiled nodes in order. A node is compiled once by `compile_node`,
+    and can be evaluated any number of times after that.
+    """
+    result = []
     try:
-        while parser.current_token.type != EOF:
-            result.append(my_eval(env, parser.expr()))
+        for node in nodes:
+            result.append(node(env))
 
             if type(result[-1]) is Keyword:
                 raise MyError(f"Keyword misused in expression. `{result[-1]}`")
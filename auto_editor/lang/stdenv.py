@@ -8,7 +8,17 @@ from auto_editor.lib.contracts import *
 from auto_editor.lib.data_structs import *
 from auto_editor.lib.err import MyError
 
-from .palet import Syntax, env, is_boolarr, is_iterable, my_eval, p_slice, raise_, ref
+from .palet import (
+    Syntax,
+    compile_node,
+    env,
+    is_boolarr,
+    is_iterable,
+    my_eval,
+    p_slice,
+    raise_,
+    ref,
+)
 
 if TYPE_CHECKING:
     from fractions import Fraction
@@ -17,6 +27,8 @@ if TYPE_CHECKING:
     import numpy as np
     from numpy.typing import NDArray
 
+    from .palet import Compiled
+
     Number = int | float | Fraction
     BoolList = NDArray[np.bool_]
     Node = tuple
@@ -46,7 +58,7 @@ def make_standard_env() -> dict[str, Any]:
             name: str,
             parms: list[str],
             contracts: tuple[Any, ...],
-            body: Node,
+            body: list[Compiled],
         ):
             self.env = env
             self.name = name
@@ -71,9 +83,9 @@ def make_standard_env() -> dict[str, Any]:
             inner_env = Env(dict(zip(self.parms, args)), self.env)
 
             for item in self.body[0:-1]:
-                my_eval(inner_env, item)
+                item(inner_env)
 
-            return my_eval(inner_env, self.body[-1])
+            return self.body[-1](inner_env)
 
     @dataclass(slots=True)
     class KeywordUserProc:
@@ -81,7 +93,7 @@ def make_standard_env() -> dict[str, Any]:
         name: str
         parms: list[str]
         kw_parms: list[str]
-        body: Node
+        body: list[Compiled]
         arity: tuple[int, None]
         contracts: list[Any] | None = None
 
@@ -104,9 +116,9 @@ def make_standard_env() -> dict[str, Any]:
             inner_env = Env(env, self.env)
 
             for item in self.body[0:-1]:
-                my_eval(inner_env, item)
+                item(inner_env)
 
-            return my_eval(inner_env, self.body[-1])
+            return self.body[-1](inner_env)
 
         def __str__(self) -> str:
             return self.name
@@ -191,7 +203,7 @@ def make_standard_env() -> dict[str, Any]:
         return type(a) == type(b) and a == b
 
     # Syntax definitions
-    def check_for_syntax(env: Env, node: Node) -> tuple[Sym, Any]:
+    def check_for_syntax(node: Node) -> tuple[Sym, Compiled]:
         name = node[0]
         if len(node) < 2:
             raise MyError(f"{name}: bad syntax")
@@ -199,22 +211,21 @@ def make_standard_env() -> dict[str, Any]:
         if len(node) == 2:
             raise MyError(f"{name}: missing body")
 
-        assert isinstance(node[1], tuple)
-        assert isinstance(node[1][0], tuple)
+        if type(node[1]) is not tuple or not node[1] or type(node[1][0]) is not tuple:
+            raise MyError(f"{name}: bad syntax")
 
         var = node[1][0][0]
         if type(var) is not Sym:
             raise MyError(f"{name}: binding must be an identifier")
-        my_iter = my_eval(env, node[1][0][1])
-
-        if not is_iterable(my_iter):
-            if type(my_iter) is int:
-                return var, range(my_iter)
-            raise MyError(f"{name}: got non-iterable in iter slot")
+        return var, compile_node(node[1][0][1])
 
-        return var, my_iter
+    def compile_body(nodes: Node) -> list[Compiled]:
+        return [compile_node(item) for item in nodes]
 
     def syn_lambda(env: Env, node: Node) -> UserProc:
+        return comp_lambda(node)(env)
+
+    def comp_lambda(node: Node) -> Compiled:
         if len(node) < 3:
             raise MyError(f"{node[0]}: too few terms")
 
@@ -228,9 +239,13 @@ def make_standard_env() -> dict[str, Any]:
 
             parms.append(f"{item}")
 
-        return UserProc(env, "", parms, (), node[2:])
+        body = compile_body(node[2:])
+        return lambda env: UserProc(env, "", parms.copy(), (), body)
 
     def syn_define(env: Env, node: Node) -> None:
+        return comp_define(node)(env)
+
+    def comp_define(node: Node) -> Compiled:
         if len(node) < 2:
             raise MyError(f"{node[0]}: too few terms")
         if len(node) < 3:
@@ -242,7 +257,7 @@ def make_standard_env() -> dict[str, Any]:
 
         if type(node[1]) is tuple:
             term = node[1]
-            body = node[2:]
+            body = compile_body(node[2:])
 
             if not term or type(term[0]) is not Sym:
                 raise MyError(f"{node[0]}: proc-binding must be an identifier")
@@ -268,11 +283,14 @@ def make_standard_env() -> dict[str, Any]:
                     else:
                         raise MyError(f"{node[0]}: must be an identifier")
 
-            if kw_only:
-                env[n] = KeywordUserProc(env, n, parms, kparms, body, (len(parms), None))
-            else:
-                env[n] = UserProc(env, n, parms, (), body)
-            return None
+            def define_proc(env: Env) -> None:
+                if kw_only:
+                    arity = (len(parms), None)
+                    env[n] = KeywordUserProc(env, n, parms, kparms, body, arity)
+                else:
+                    env[n] = UserProc(env, n, parms.copy(), (), body)
+
+            return define_proc
 
         elif type(node[1]) is not Sym:
             raise MyError(f"{node[0]}: must be an identifier")
@@ -289,7 +307,7 @@ def make_standard_env() -> dict[str, Any]:
             and node[2][0].val in {"lambda", "λ"}
         ):
             terms = node[2][1]
-            body = node[2][2:]
+            body = compile_body(node[2][2:])
 
             parms = []
             for item in terms:
@@ -298,14 +316,22 @@ def make_standard_env() -> dict[str, Any]:
 
                 parms.append(f"{item}")
 
-            env[n] = UserProc(env, n, parms, (), body)
+            def define_lambda(env: Env) -> None:
+                env[n] = UserProc(env, n, parms.copy(), (), body)
 
-        else:
-            for item in node[2:-1]:
-                my_eval(env, item)
-            env[n] = my_eval(env, node[-1])
+            return define_lambda
+
+        value = compile_node(node[2])
+
+        def define_value(env: Env) -> None:
+            env[n] = value(env)
+
+        return define_value
 
     def syn_definec(env: Env, node: Node) -> None:
+        return comp_definec(node)(env)
+
+    def comp_definec(node: Node) -> Compiled:
         if len(node) < 3:
             raise MyError(f"{node[0]}: too few terms")
 
@@ -317,7 +343,7 @@ def make_standard_env() -> dict[str, Any]:
 
         n = node[1][0].val
 
-        contracts: list[Any] = []
+        contract_fns: list[Compiled] = []
         parms: list[str] = []
         for item in node[1][1:]:
             if item == Sym("->"):
@@ -327,15 +353,22 @@ def make_standard_env() -> dict[str, Any]:
             if type(item[0]) is not Sym:
                 raise MyError(f"{node[0]}: binding must be identifier")
 
-            con = my_eval(env, item[1])
-            if not is_cont(con):
-                raise MyError(f"{node[0]}: {print_str(con)} is not a valid contract")
-
             parms.append(f"{item[0]}")
-            contracts.append(con)
+            contract_fns.append(compile_node(item[1]))
+
+        body = compile_body(node[2:])
+
+        def fn(env: Env) -> None:
+            contracts: list[Any] = []
+            for con_fn in contract_fns:
+                con = con_fn(env)
+                if not is_cont(con):
+                    raise MyError(f"{node[0]}: {print_str(con)} is not a valid contract")
+                contracts.append(con)
 
-        env[n] = UserProc(env, n, parms, tuple(contracts), node[2:])
-        return None
+            env[n] = UserProc(env, n, parms.copy(), tuple(contracts), body)
+
+        return fn
 
     def guard_term(node: Node, n: int, u: int) -> None:
         if n == u:
@@ -352,12 +385,8 @@ def make_standard_env() -> dict[str, Any]:
     def syn_set(env: Env, node: Node) -> None:
         guard_term(node, 3, 3)
 
-        if type(node[1]) is Sym:
-            name = node[1].val
-            if name not in env:
-                raise MyError(f"{node[0]}: Can't set variable `{name}` before definition")
-            env[name] = my_eval(env, node[2])
-            return None
+        if (fn := comp_set(node)) is not None:
+            return fn(env)
 
         if type(node[1]) is tuple and len(node[1]) == 3 and node[1][0] == Sym("@r"):
             base = my_eval(env, node[1][1])
@@ -373,24 +402,31 @@ def make_standard_env() -> dict[str, Any]:
 
         raise MyError(f"{node[0]}: Expected identifier, got {print_str(node[1])}")
 
-    def syn_incf(env: Env, node: Node) -> None:
+    def comp_set(node: Node) -> Compiled | None:
+        if len(node) != 3 or type(node[1]) is not Sym:
+            return None
+        name = node[1].val
+        value = compile_node(node[2])
+
+        def fn(env: Env) -> None:
+            if name not in env:
+                raise MyError(f"{node[0]}: Can't set variable `{name}` before definition")
+            env[name] = value(env)
+
+        return fn
+
+    def syn_incf(env: Env, node: Node, sign: int = 1) -> None:
         guard_term(node, 2, 3)
 
+        if (fn := comp_incf(node, sign)) is not None:
+            return fn(env)
+
         incre_by = 1
         if len(node) == 3:
             incre_by = my_eval(env, node[2])
             if not is_num(incre_by):
                 raise MyError(f"{node[0]}: Expected number? got: {print_str(incre_by)}")
-
-        if type(node[1]) is Sym:
-            name = node[1].val
-
-            if type(env[name]) is NotFound:
-                raise MyError(f"{node[0]}: `{name}` is not defined")
-            if not is_num(env[name]):
-                raise MyError(f"{node[0]}: `{name}` is not a number?")
-            env[name] += incre_by
-            return None
+        incre_by *= sign
 
         if type(node[1]) is tuple and len(node[1]) == 3 and node[1][0] == Sym("@r"):
             base = my_eval(env, node[1][1])
@@ -413,101 +449,127 @@ def make_standard_env() -> dict[str, Any]:
 
         raise MyError(f"{node[0]}: Expected identifier, got {print_str(node[1])}")
 
-    def syn_decf(env: Env, node: Node) -> None:
-        guard_term(node, 2, 3)
-
-        incre_by = 1
-        if len(node) == 3:
-            incre_by = my_eval(env, node[2])
-            if not is_num(incre_by):
-                raise MyError(f"{node[0]}: Expected number? got: {print_str(incre_by)}")
-
-        if type(node[1]) is Sym:
-            name = node[1].val
-
-            if type(env[name]) is NotFound:
-                raise MyError(f"{node[0]}: `{name}` is not defined")
-            if not is_num(env[name]):
-                raise MyError(f"{node[0]}: `{name}` is not a number?")
-            env[name] -= incre_by
+    def comp_incf(node: Node, sign: int = 1) -> Compiled | None:
+        if len(node) not in {2, 3} or type(node[1]) is not Sym:
             return None
+        name = node[1].val
+        by = None if len(node) == 2 else compile_node(node[2])
+
+        def fn(env: Env) -> None:
+            incre_by = 1
+            if by is not None:
+                incre_by = by(env)
+                if not is_num(incre_by):
+                    raise MyError(f"{node[0]}: Expected number? got: {print_str(incre_by)}")
+
+            val = env[name]
+            if not is_num(val):
+                if name not in env:
+                    raise MyError(f"{node[0]}: `{name}` is not defined")
+                raise MyError(f"{node[0]}: `{name}` is not a number?")
+            env[name] = val + incre_by if sign > 0 else val - incre_by
 
-        if type(node[1]) is tuple and len(node[1]) == 3 and node[1][0] == Sym("@r"):
-            base = my_eval(env, node[1][1])
-            if type(base) is not PaletClass:
-                raise MyError(f"{node[0]}: must be a class instance")
-            if type(node[1][2]) is not Sym:
-                raise MyError(f"{node[0]}: class attribute must be an identifier")
-            name = node[1][2].val
-            for i, item in enumerate(base.attrs[0::2]):
-                if name == item:
-                    if not is_num(base.values[i]):
-                        raise MyError(f"{node[0]}: `{name}` is not a number?")
+        return fn
 
-                    check_args(
-                        name, (base.values[i] - incre_by,), (1, 1), (base.attrs[i * 2 + 1],)
-                    )
-                    base.values[i] -= incre_by
-                    return None
-            raise MyError(f"{node[0]}: {base.name} has no attribute `{name}`")
+    def syn_decf(env: Env, node: Node) -> None:
+        return syn_incf(env, node, -1)
 
-        raise MyError(f"{node[0]}: Expected identifier, got {print_str(node[1])}")
+    def comp_decf(node: Node) -> Compiled | None:
+        return comp_incf(node, -1)
 
     def syn_strappend(env: Env, node: Node) -> None:
+        return comp_strappend(node)(env)
+
+    def comp_strappend(node: Node) -> Compiled:
         guard_term(node, 3, 3)
 
         if type(node[1]) is not Sym:
             raise MyError(f"{node[0]}: Expected identifier, got {print_str(node[1])}")
         name = node[1].val
+        value = compile_node(node[2])
 
-        if type(env[name]) is NotFound:
-            raise MyError(f"{node[0]}: `{name}` is not defined")
-        if not is_str(env[name]):
-            raise MyError(f"{node[0]}: `{name}` is not a string?")
+        def fn(env: Env) -> None:
+            if type(env[name]) is NotFound:
+                raise MyError(f"{node[0]}: `{name}` is not defined")
+            if not is_str(env[name]):
+                raise MyError(f"{node[0]}: `{name}` is not a string?")
 
-        if not is_str(num := my_eval(env, node[2])):
-            raise MyError(f"{node[0]}: Expected string? got: {print_str(num)}")
-        env[name] += num
+            if not is_str(num := value(env)):
+                raise MyError(f"{node[0]}: Expected string? got: {print_str(num)}")
+            env[name] += num
+
+        return fn
 
     def syn_while(env: Env, node: Node) -> None:
-        while my_eval(env, node[1]) == True:
-            for c in node[2:]:
-                my_eval(env, c)
+        if (fn := comp_while(node)) is None:
+            raise MyError(f"{node[0]}: Expected at least 1 term")
+        return fn(env)
+
+    def comp_while(node: Node) -> Compiled | None:
+        if len(node) < 2:
+            return None
+        test = compile_node(node[1])
+        body = [compile_node(c) for c in node[2:]]
+
+        def fn(env: Env) -> None:
+            while test(env) == True:
+                for c in body:
+                    c(env)
+
+        return fn
 
     def syn_for(env: Env, node: Node) -> None:
-        var, my_iter = check_for_syntax(env, node)
+        return comp_for(node)(env)
+
+    def comp_for(node: Node) -> Compiled:
+        var, get_iter = check_for_syntax(node)
+        body = compile_body(node[2:])
+
+        def fn(env: Env) -> None:
+            my_iter = get_iter(env)
+            if not is_iterable(my_iter):
+                if type(my_iter) is not int:
+                    raise MyError(f"{node[0]}: got non-iterable in iter slot")
+                my_iter = range(my_iter)
+            if isinstance(my_iter, np.ndarray) and my_iter.dtype == np.bool_:
+                my_iter = map(int, my_iter)
 
-        if isinstance(my_iter, np.ndarray) and my_iter.dtype == np.bool_:
-            for item in my_iter:
-                env[var.val] = int(item)
-                for c in node[2:]:
-                    my_eval(env, c)
-        else:
             for item in my_iter:
                 env[var.val] = item
-                for c in node[2:]:
-                    my_eval(env, c)
+                for c in body:
+                    c(env)
+
+        return fn
 
     def syn_for_items(env: Env, node: Node) -> None:
+        return comp_for_items(node)(env)
+
+    def comp_for_items(node: Node) -> Compiled:
         if len(node) < 2:
             raise MyError(f"{node[0]}: bad syntax")
 
         if type(node[1]) is not tuple or len(node[1]) != 3:
             raise MyError(f"{node[0]}: Invalid id body")
 
-        key, val, dic = node[1]
+        key, val, get_dic = node[1]
         if type(key) is not Sym or type(val) is not Sym:
             raise MyError(f"{node[0]}: key and val must be identifiers")
 
-        dic = my_eval(env, dic)
-        if type(dic) is not dict:
-            raise MyError(f"{node[0]}: dict must be a hash?")
+        get_dic = compile_node(get_dic)
+        body = compile_body(node[2:])
 
-        for k, v in dic.items():
-            env[key.val] = k
-            env[val.val] = v
-            for c in node[2:]:
-                my_eval(env, c)
+        def fn(env: Env) -> None:
+            dic = get_dic(env)
+            if type(dic) is not dict:
+                raise MyError(f"{node[0]}: dict must be a hash?")
+
+            for k, v in dic.items():
+                env[key.val] = k
+                env[val.val] = v
+                for c in body:
+                    c(env)
+
+        return fn
 
     def syn_quote(_: Env, node: Node) -> Any:
         guard_term(node, 2, 2)
@@ -519,76 +581,114 @@ def make_standard_env() -> dict[str, Any]:
 
     def syn_if(env: Env, node: Node) -> Any:
         guard_term(node, 4, 4)
-        test_expr = my_eval(env, node[1])
+        fn = comp_if(node)
+        assert fn is not None
+        return fn(env)
 
-        if type(test_expr) is not bool:
-            raise MyError(
-                f"{node[0]} test-expr: expected bool?, got {print_str(test_expr)}"
-            )
+    def comp_if(node: Node) -> Compiled | None:
+        if len(node) != 4:
+            return None
+        test, then, else_ = (compile_node(n) for n in node[1:])
 
-        return my_eval(env, node[2] if test_expr else node[3])
+        def fn(env: Env) -> Any:
+            test_expr = test(env)
+            if type(test_expr) is not bool:
+                raise MyError(
+                    f"{node[0]} test-expr: expected bool?, got {print_str(test_expr)}"
+                )
+            return then(env) if test_expr else else_(env)
+
+        return fn
 
     def syn_when(env: Env, node: Node) -> Any:
-        if len(node) < 3:
+        if (fn := comp_when(node)) is None:
             raise MyError(f"{node[0]}: Expected at least 2 terms")
-        test_expr = my_eval(env, node[1])
+        return fn(env)
 
-        if type(test_expr) is not bool:
-            raise MyError(
-                f"{node[0]} test-expr: expected bool?, got {print_str(test_expr)}"
-            )
+    def comp_when(node: Node) -> Compiled | None:
+        if len(node) < 3:
+            return None
+        test = compile_node(node[1])
+        body = [compile_node(n) for n in node[2:]]
 
-        if test_expr:
-            for item in node[2:-1]:
-                my_eval(env, item)
-            return my_eval(env, node[-1])
-        return None
+        def fn(env: Env) -> Any:
+            test_expr = test(env)
+            if type(test_expr) is not bool:
+                raise MyError(
+                    f"{node[0]} test-expr: expected bool?, got {print_str(test_expr)}"
+                )
+
+            result = None
+            if test_expr:
+                for item in body:
+                    result = item(env)
+            return result
+
+        return fn
 
     def syn_and(env: Env, node: Node) -> Any:
+        return comp_and(node)(env)
+
+    def comp_and(node: Node) -> Compiled:
         if len(node) == 1:
             raise MyError(f"{node[0]}: Expected at least 1 term")
 
-        first = my_eval(env, node[1])
-        if first is False:
-            return False
-        if first is True:
-            for n in node[2:]:
-                val = my_eval(env, n)
-                if val is False:
-                    return False
-                if val is not True:
-                    raise MyError(f"{node[0]} args must be bool?")
-            return True
-
-        if is_boolarr(first):
-            vals = [first] + [my_eval(env, n) for n in node[2:]]
-            check_args(node[0], vals, (2, None), (is_boolarr,))
-            return reduce(lambda a, b: boolop(a, b, logical_and), vals)
-
-        raise MyError(f"{node[0]} expects (or/c bool? bool-array?)")
+        get_first = compile_node(node[1])
+        rest = compile_body(node[2:])
+
+        def fn(env: Env) -> Any:
+            first = get_first(env)
+            if first is False:
+                return False
+            if first is True:
+                for n in rest:
+                    val = n(env)
+                    if val is False:
+                        return False
+                    if val is not True:
+                        raise MyError(f"{node[0]} args must be bool?")
+                return True
+
+            if is_boolarr(first):
+                vals = [first] + [n(env) for n in rest]
+                check_args(node[0], vals, (2, None), (is_boolarr,))
+                return reduce(lambda a, b: boolop(a, b, logical_and), vals)
+
+            raise MyError(f"{node[0]} expects (or/c bool? bool-array?)")
+
+        return fn
 
     def syn_or(env: Env, node: Node) -> Any:
+        return comp_or(node)(env)
+
+    def comp_or(node: Node) -> Compiled:
         if len(node) == 1:
             raise MyError(f"{node[0]}: Expected at least 1 term")
 
-        first = my_eval(env, node[1])
-        if first is True:
-            return True
-        if first is False:
-            for n in node[2:]:
-                val = my_eval(env, n)
-                if val is True:
-                    return True
-                if val is not False:
-                    raise MyError(f"{node[0]} args must be bool?")
-            return False
+        get_first = compile_node(node[1])
+        rest = compile_body(node[2:])
 
-        if is_boolarr(first):
-            vals = [first] + [my_eval(env, n) for n in node[2:]]
-            check_args(node[0], vals, (2, None), (is_boolarr,))
-            return reduce(lambda a, b: boolop(a, b, logical_or), vals)
+        def fn(env: Env) -> Any:
+            first = get_first(env)
+            if first is True:
+                return True
+            if first is False:
+                for n in rest:
+                    val = n(env)
+                    if val is True:
+                        return True
+                    if val is not False:
+                        raise MyError(f"{node[0]} args must be bool?")
+                return False
 
-        raise MyError(f"{node[0]} expects (or/c bool? bool-array?)")
+            if is_boolarr(first):
+                vals = [first] + [n(env) for n in rest]
+                check_args(node[0], vals, (2, None), (is_boolarr,))
+                return reduce(lambda a, b: boolop(a, b, logical_or), vals)
+
+            raise MyError(f"{node[0]} expects (or/c bool? bool-array?)")
+
+        return fn
 
     def syn_delete(env: Env, node: Node) -> None:
         guard_term(node, 2, 2)
@@ -615,6 +715,11 @@ def make_standard_env() -> dict[str, Any]:
         del env[first.val]
 
     def syn_cond(env: Env, node: Node) -> Any:
+        return comp_cond(node)(env)
+
+    def comp_cond(node: Node) -> Compiled:
+        # A test that is None stands for `else`.
+        clauses: list[tuple[Compiled | None, list[Compiled]]] = []
         for test_expr in node[1:]:
             if type(test_expr) is not tuple or not test_expr:
                 raise MyError(f"{node[0]}: bad syntax, clause is not a test-value pair")
@@ -622,40 +727,63 @@ def make_standard_env() -> dict[str, Any]:
             if test_expr[0] == Sym("else"):
                 if len(test_expr) == 1:
                     raise MyError(f"{node[0]}: missing expression in else clause")
-                test_clause = True
+                clauses.append((None, compile_body(test_expr[1:])))
             else:
-                test_clause = my_eval(env, test_expr[0])
-                if type(test_clause) is not bool:
-                    raise MyError(
-                        f"{node[0]} test-expr: expected bool?, got {print_str(test_clause)}"
-                    )
+                clauses.append(
+                    (compile_node(test_expr[0]), compile_body(test_expr[1:]))
+                )
 
-            if test_clause:
-                if len(test_expr) == 1:
+        def fn(env: Env) -> Any:
+            for test, body in clauses:
+                if test is not None:
+                    test_clause = test(env)
+                    if type(test_clause) is not bool:
+                        raise MyError(
+                            f"{node[0]} test-expr: expected bool?, got {print_str(test_clause)}"
+                        )
+                    if not test_clause:
+                        continue
+
+                if not body:
                     return True
+                for rest_clause in body[:-1]:
+                    rest_clause(env)
+                return body[-1](env)
 
-                for rest_clause in test_expr[1:-1]:
-                    my_eval(env, rest_clause)
-                return my_eval(env, test_expr[-1])
+            return None
 
-        return None
+        return fn
 
     def syn_case(env: Env, node: Node) -> Any:
-        val_expr = my_eval(env, node[1])
+        return comp_case(node)(env)
+
+    def comp_case(node: Node) -> Compiled:
+        if len(node) < 2:
+            raise MyError("case: bad syntax")
+
+        get_val = compile_node(node[1])
+        # Cases that are None stand for `else`.
+        clauses: list[tuple[Node | None, Compiled]] = []
         for case_clause in node[2:]:
             if type(case_clause) is not tuple or len(case_clause) != 2:
                 raise MyError("case: bad syntax")
             if type(case_clause[0]) is tuple:
-                for case in case_clause[0]:
-                    if is_equal(case, val_expr):
-                        return my_eval(env, case_clause[1])
+                clauses.append((case_clause[0], compile_node(case_clause[1])))
             elif type(case_clause[0]) is Sym and case_clause[0].val == "else":
-                return my_eval(env, case_clause[1])
+                clauses.append((None, compile_node(case_clause[1])))
             else:
                 raise MyError("case: bad syntax")
-        return None
 
-    def syn_let(env: Env, node: Node) -> Any:
+        def fn(env: Env) -> Any:
+            val_expr = get_val(env)
+            for cases, result in clauses:
+                if cases is None or any(is_equal(case, val_expr) for case in cases):
+                    return result(env)
+            return None
+
+        return fn
+
+    def let_bindings(node: Node) -> list[tuple[str, Compiled]]:
         if len(node) < 2:
             raise MyError(f"{node[0]}: Expected at least 1 term")
 
@@ -666,35 +794,45 @@ def make_standard_env() -> dict[str, Any]:
             if type(var_ids) is not tuple or len(var_ids) != 2:
                 raise MyError(f"{node[0]}: Expected two terms: `id` and `val-expr`")
 
-        new_maps: dict[str, Any] = {}
+        bindings: list[tuple[str, Compiled]] = []
         for var, val in node[1]:
             if type(var) is not Sym:
                 raise MyError(f"{node[0]}: Expected symbol for `id` term")
-            new_maps[var.val] = my_eval(env, val)
+            bindings.append((var.val, compile_node(val)))
+        return bindings
+
+    def syn_let(env: Env, node: Node) -> Any:
+        return comp_let(node)(env)
 
-        inner_env = Env(new_maps, env)
-        for item in node[2:-1]:
-            my_eval(inner_env, item)
-        return my_eval(inner_env, node[-1])
+    def comp_let(node: Node) -> Compiled:
+        bindings = let_bindings(node)
+        body = compile_body(node[2:])
+
+        def fn(env: Env) -> Any:
+            inner_env = Env({var: val(env) for var, val in bindings}, env)
+            for item in body[:-1]:
+                item(inner_env)
+            return body[-1](inner_env)
+
+        return fn
 
     def syn_let_star(env: Env, node: Node) -> Any:
-        if len(node) < 2:
-            raise MyError(f"{node[0]}: Expected at least 1 term")
+        return comp_let_star(node)(env)
 
-        for var_ids in node[1]:
-            if len(var_ids) != 2:
-                raise MyError(f"{node[0]}: Expected two terms: `id` and `val-expr`")
+    def comp_let_star(node: Node) -> Compiled:
+        bindings = let_bindings(node)
+        body = compile_body(node[2:])
 
-        inner_env = Env({}, env)
+        def fn(env: Env) -> Any:
+            inner_env = Env({}, env)
+            for var, val in bindings:
+                inner_env[var] = val(inner_env)
 
-        for var, val in node[1]:
-            if type(var) is not Sym:
-                raise MyError(f"{node[0]}: Expected symbol for `id` term")
-            inner_env[var.val] = my_eval(inner_env, val)
+            for item in body[:-1]:
+                item(inner_env)
+            return body[-1](inner_env)
 
-        for item in node[2:-1]:
-            my_eval(inner_env, item)
-        return my_eval(inner_env, node[-1])
+        return fn
 
     def syn_import(env: Env, node: Node) -> None:
         guard_term(node, 2, 2)
@@ -746,28 +884,36 @@ def make_standard_env() -> dict[str, Any]:
         )
 
     def attr(env: Env, node: Node) -> Any:
+        return comp_attr(node)(env)
+
+    def comp_attr(node: Node) -> Compiled:
         guard_term(node, 3, 3)
 
         if type(node[2]) is not Sym:
             raise MyError("@r: attribute must be an identifier")
 
-        base = my_eval(env, node[1])
+        name = node[2].val
+        get_base = compile_node(node[1])
+        # Anything else is called with the base: (@r x f) is (f x).
+        call = compile_node((node[2], node[1]))
 
-        if hasattr(base, "__pyx_vtable__"):
-            try:
-                return getattr(base, node[2].val)
-            except AttributeError as e:
-                raise MyError(e)
+        def fn(env: Env) -> Any:
+            base = get_base(env)
 
-        if type(base) is PaletClass:
-            if type(name := node[2]) is not Sym:
-                raise MyError("@r: class attribute must be an identifier")
+            if hasattr(base, "__pyx_vtable__"):
+                try:
+                    return getattr(base, name)
+                except AttributeError as e:
+                    raise MyError(e)
 
-            for i, item in enumerate(base.attrs[0::2]):
-                if name.val == item:
-                    return base.values[i]
+            if type(base) is PaletClass:
+                for i, item in enumerate(base.attrs[0::2]):
+                    if name == item:
+                        return base.values[i]
+
+            return call(env)
 
-        return my_eval(env, (node[2], node[1]))
+        return fn
 
     # Procedure definitions
     def minclip(oarr: BoolList, _min: int, /) -> BoolList:
@@ -955,29 +1101,29 @@ def make_standard_env() -> dict[str, Any]:
         "false": False,
         "all": Sym("all"),
         # syntax
-        "lambda": Syntax(syn_lambda),
-        "λ": Syntax(syn_lambda),
-        "defn": Syntax(syn_define),
-        "define": Syntax(syn_define),
-        "define/c": Syntax(syn_definec),
-        "set!": Syntax(syn_set),
-        "incf": Syntax(syn_incf),
-        "decf": Syntax(syn_decf),
-        "&=": Syntax(syn_strappend),
+        "lambda": Syntax(syn_lambda, comp_lambda),
+        "λ": Syntax(syn_lambda, comp_lambda),
+        "defn": Syntax(syn_define, comp_define),
+        "define": Syntax(syn_define, comp_define),
+        "define/c": Syntax(syn_definec, comp_definec),
+        "set!": Syntax(syn_set, comp_set),
+        "incf": Syntax(syn_incf, comp_incf),
+        "decf": Syntax(syn_decf, comp_decf),
+        "&=": Syntax(syn_strappend, comp_strappend),
         "quote": Syntax(syn_quote),
-        "if": Syntax(syn_if),
-        "when": Syntax(syn_when),
-        "cond": Syntax(syn_cond),
-        "case": Syntax(syn_case),
-        "let": Syntax(syn_let),
-        "let*": Syntax(syn_let_star),
+        "if": Syntax(syn_if, comp_if),
+        "when": Syntax(syn_when, comp_when),
+        "cond": Syntax(syn_cond, comp_cond),
+        "case": Syntax(syn_case, comp_case),
+        "let": Syntax(syn_let, comp_let),
+        "let*": Syntax(syn_let_star, comp_let_star),
         "import": Syntax(syn_import),
         "class": Syntax(syn_class),
-        "@r": Syntax(attr),
+        "@r": Syntax(attr, comp_attr),
         # loops
-        "for": Syntax(syn_for),
-        "for-items": Syntax(syn_for_items),
-        "while": Syntax(syn_while),
+        "for": Syntax(syn_for, comp_for),
+        "for-items": Syntax(syn_for_items, comp_for_items),
+        "while": Syntax(syn_while, comp_while),
         # contracts
         "number?": is_num,
         "real?": is_real,
@@ -1007,8 +1153,8 @@ def make_standard_env() -> dict[str, Any]:
         "void": Proc("void", lambda *v: None, (0, 0)),
         # control / b-arrays
         "not": Proc("not", lambda v: not v if type(v) is bool else logical_not(v), (1, 1), bool_or_barr),
-        "and": Syntax(syn_and),
-        "or": Syntax(syn_or),
+        "and": Syntax(syn_and, comp_and),
+        "or": Syntax(syn_or, comp_or),
         "xor": Proc("xor", _xor, (2, None), bool_or_barr),
         # booleans
         ">": Proc(">", gt, (2, 2), is_real),
@@ -1018,13 +1164,18 @@ def make_standard_env() -> dict[str, Any]:
         "=": Proc("=", equal_num, (1, None), is_num),
         "eq?": Proc("eq?", is_, (2, 2)),
         "equal?": Proc("equal?", is_equal, (2, 2)),
-        "zero?": UserProc(env, "zero?", ["z"], (is_num,), ((Sym("="), Sym("z"), 0),)),
-        "positive?": UserProc(env, "positive?", ["x"], (is_real,), ((Sym(">"), Sym("x"), 0),)),
-        "negative?": UserProc(env, "negative?", ["x"], (is_real,), ((Sym("<"), Sym("x"), 0),)),
+        "zero?": UserProc(
+            env, "zero?", ["z"], (is_num,), compile_body(((Sym("="), Sym("z"), 0),))),
+        "positive?": UserProc(
+            env, "positive?", ["x"], (is_real,), compile_body(((Sym(">"), Sym("x"), 0),))),
+        "negative?": UserProc(
+            env, "negative?", ["x"], (is_real,), compile_body(((Sym("<"), Sym("x"), 0),))),
         "even?": UserProc(
-            env, "even?", ["n"], (is_int,), ((Sym("zero?"), (Sym("mod"), Sym("n"), 2)),)),
+            env, "even?", ["n"], (is_int,),
+            compile_body(((Sym("zero?"), (Sym("mod"), Sym("n"), 2)),))),
         "odd?": UserProc(
-            env, "odd?", ["n"], (is_int,), ((Sym("not"), (Sym("even?"), Sym("n"))),)),
+            env, "odd?", ["n"], (is_int,),
+            compile_body(((Sym("not"), (Sym("even?"), Sym("n"))),))),
         ">=/c": Proc(">=/c", gte_c, (1, 1), is_real),
         ">/c": Proc(">/c", gt_c, (1, 1), is_real),
         "<=/c": Proc("<=/c", lte_c, (1, 1), is_real),
@@ -1128,9 +1279,9 @@ def make_standard_env() -> dict[str, Any]:
         "has-key?": Proc("has-key?", lambda h, k: k in h, (2, 2), is_hash, any_p),
         "hash-remove!": Proc("hash-remove!", hash_remove, (2, 2), is_hash, any_p),
         "hash-update!": UserProc(env, "hash-update!", ["h", "v", "up"], (is_hash, any_p),
-            (
+            compile_body((
                 (Sym("hash-set!"), Sym("h"), Sym("v"), (Sym("up"), (Sym("h"), Sym("v"))),),
-            ),
+            )),
         ),
         # i/o
         "file-exists?": Proc("file-exists", os.path.isfile, (1, 1), is_str),
@@ -35,7 +35,7 @@ class Contract:
 
 def check_contract(c: object, val: object) -> bool:
     if type(c) is Contract:
-        return c(val)
+        return c.c(val)
     if (
         isinstance(c, Proc)
         and c.arity[0] < 2
@@ -60,14 +60,14 @@ def check_args(
     lower, upper = arity
     amount = len(values)
 
-    assert not (upper is not None and lower > upper)
-    base = f"`{name}` has an arity mismatch. Expected "
+    if amount < lower or (upper is not None and amount > upper):
+        assert not (upper is not None and lower > upper)
+        base = f"`{name}` has an arity mismatch. Expected "
 
-    if lower == upper and len(values) != lower:
-        raise MyError(f"{base}{lower}, got {amount}")
-    if upper is None and amount < lower:
-        raise MyError(f"{base}at least {lower}, got {amount}")
-    if upper is not None and (amount > upper or amount < lower):
+        if lower == upper:
+            raise MyError(f"{base}{lower}, got {amount}")
+        if upper is None:
+            raise MyError(f"{base}at least {lower}, got {amount}")
         raise MyError(f"{base}between {lower} and {upper}, got {amount}")
 
     if not cont:
@@ -103,14 +103,14 @@ class Proc:
         cont = self.contracts
         kws = self.kw_contracts
 
-        assert not (upper is not None and lower > upper)
-        base = f"`{self.name}` has an arity mismatch. Expected "
+        if amount < lower or (upper is not None and amount > upper):
+            assert not (upper is not None and lower > upper)
+            base = f"`{self.name}` has an arity mismatch. Expected "
 
-        if lower == upper and len(args) != lower:
-            raise MyError(f"{base}{lower}, got {amount}")
-        if upper is None and amount < lower:
-            raise MyError(f"{base}at least {lower}, got {amount}")
-        if upper is not None and (amount > upper or amount < lower):
+            if lower == upper:
+                raise MyError(f"{base}{lower}, got {amount}")
+            if upper is None:
+                raise MyError(f"{base}at least {lower}, got {amount}")
             raise MyError(f"{base}between {lower} and {upper}, got {amount}")
 
         if not cont:
@@ -1,18 +1,28 @@
 from __future__ import annotations
 
 from fractions import Fraction
-from math import ceil
 from typing import TYPE_CHECKING, NamedTuple
 
 import numpy as np
 
 from auto_editor.analyze import initLevels
 from auto_editor.ffwrapper import FileInfo
-from auto_editor.lang.palet import Lexer, Parser, env, interpret, is_boolean_array
+from auto_editor.lang.palet import (
+    Lexer,
+    Parser,
+    compile_node,
+    env,
+    eval_nodes,
+    interpret,
+    is_boolean_array,
+    iter_nodes,
+    plan_levels,
+)
 from auto_editor.lib.data_structs import print_str
 from auto_editor.lib.err import MyError
 from auto_editor.timeline import ASpace, Clip, Template, VSpace, v1, v3
 from auto_editor.utils.func import mut_margin
+from auto_editor.utils.runs import run_starts
 from auto_editor.utils.types import CoerceError, time
 
 if TYPE_CHECKING:
@@ -20,6 +30,7 @@ if TYPE_CHECKING:
 
     from auto_editor.__main__ import Args
     from auto_editor.utils.bar import Bar
+    from auto_editor.utils.cache import Cache
     from auto_editor.utils.chunks import Chunks
     from auto_editor.utils.log import Log
 
@@ -53,6 +64,51 @@ def clipify(chunks: Chunks, src: FileInfo, start: int = 0) -> list[VirClip]:
     return clips
 
 
+def make_clips(
+    arr: NDArray[np.uint],
+    src_index: NDArray[np.int32],
+    sources: list[FileInfo],
+    speed_map: list[float],
+) -> list[VirClip]:
+    """Turn the speed index of every frame into clips."""
+    # A chunk ends wherever the speed or the source changes. Its start and end
+    # are relative to the first frame of its source.
+    firsts = run_starts(arr.astype(np.int64) * len(sources) + src_index)
+    src_first = np.searchsorted(src_index, src_index[firsts])
+    chunk_starts = firsts - src_first
+    chunk_ends = np.append(firsts[1:], len(arr)) - src_first
+    chunk_ends[-1] = len(arr)  # Kept as before: the last end isn't relative.
+    speed_ids = arr[firsts]
+    speeds = np.array(speed_map, dtype=np.float64)[speed_ids]
+
+    durs = ((chunk_ends - chunk_starts) / speeds).astype(np.int64)
+    keep = np.flatnonzero((speeds != 99999) & (durs != 0))
+    durs = durs[keep]
+    offsets = np.ceil(chunk_starts[keep] / speeds[keep]).astype(np.int64)
+    starts = np.cumsum(durs) - durs
+
+    # Assert timeline is monotonic because non-monotonic timelines are incorrect
+    # here and causes back-seeking (performance issue) in video rendering.
+
+    # We don't properly check monotonicity for multiple sources, so skip those.
+    if len(sources) == 1:
+        last_is = np.round((offsets + durs - 1) * speeds[keep])
+        if (bad := np.flatnonzero(last_is[1:] < last_is[:-1])).size:
+            i = bad[0]
+            raise ValueError("not monotonic", sources, last_is[i + 1], last_is[i])
+
+    return [
+        VirClip(start, dur, offset, speed_map[speed_id], sources[src_id])
+        for start, dur, offset, speed_id, src_id in zip(
+            starts.tolist(),
+            durs.tolist(),
+            offsets.tolist(),
+            speed_ids[keep].tolist(),
+            src_index[firsts[keep]].tolist(),
+        )
+    ]
+
+
 def make_av(src: FileInfo, all_clips: list[list[VirClip]]) -> tuple[VSpace, ASpace]:
     assert type(src) is FileInfo
     vtl: VSpace = []
@@ -99,7 +155,12 @@ def parse_time(val: str, arr: NDArray, tb: Fraction) -> int:  # raises: `CoerceE
 
 
 def make_timeline(
-    sources: list[FileInfo], args: Args, sr: int, bar: Bar, log: Log
+    sources: list[FileInfo],
+    args: Args,
+    sr: int,
+    cache: Cache | None,
+    bar: Bar,
+    log: Log,
 ) -> v3:
     inp = None if not sources else sources[0]
 
@@ -138,17 +199,29 @@ def make_timeline(
             parser = Parser(Lexer("config.pal", file.read()))
             interpret(env, parser)
 
+    try:
+        parser = Parser(Lexer("`--edit`", args.edit))
+        if log.is_debug:
+            log.debug(f"edit: {parser}")
+        # Parse and compile once; the nodes are evaluated again for every source.
+        nodes = list(iter_nodes(parser))
+        compiled = [compile_node(node) for node in nodes]
+    except MyError as e:
+        log.error(e)
+
     results = []
+    all_levels = []
     for src in sources:
         try:
-            parser = Parser(Lexer("`--edit`", args.edit))
-            if log.is_debug:
-                log.debug(f"edit: {parser}")
-
             env["timebase"] = tb
-            env["@levels"] = initLevels(src, tb, bar, args.no_cache, log)
+            pcm_rate = sr if args.cache_audio else None
+            env["@levels"] = initLevels(
+                src, tb, bar, cache, log, args.analysis_workers, pcm_rate
+            )
+            all_levels.append(env["@levels"])
+            plan_levels(env["@levels"], nodes)
 
-            inter_result = interpret(env, parser)
+            inter_result = eval_nodes(env, compiled)
             if len(inter_result) == 0:
                 log.error("Expression in --edit must return a bool-array, got nothing")
 
@@ -176,7 +249,7 @@ def make_timeline(
     src_indexes = []
     for i in range(0, len(results)):
         if len(results[i]) == 0:
-            results[i] = initLevels(sources[i], tb, bar, args.no_cache, log).all()
+            results[i] = all_levels[i].all()
         src_indexes.append(np.full(len(results[i]), i, dtype=np.int32))
 
     has_loud = np.concatenate(results)
@@ -217,57 +290,7 @@ def make_timeline(
     except CoerceError as e:
         log.error(e)
 
-    def echunk(
-        arr: NDArray, src_index: NDArray[np.int32]
-    ) -> list[tuple[FileInfo, int, int, float]]:
-        arr_length = len(has_loud)
-
-        chunks = []
-        start = 0
-        doi = 0
-        for j in range(1, arr_length):
-            if (arr[j] != arr[j - 1]) or (src_index[j] != src_index[j - 1]):
-                src = sources[src_index[j - 1]]
-                chunks.append((src, start, j - doi, speed_map[arr[j - 1]]))
-                start = j - doi
-
-                if src_index[j] != src_index[j - 1]:
-                    start = 0
-                    doi = j
-
-        src = sources[src_index[j]]
-        chunks.append((src, start, arr_length, speed_map[arr[j]]))
-        return chunks
-
-    # Assert timeline is monotonic because non-monotonic timelines are incorrect
-    # here and causes back-seeking (performance issue) in video rendering.
-
-    # We don't properly check monotonicity for multiple sources, so skip those.
-
-    check_monotonic = len(sources) == 1
-    last_i = 0
-
-    clips: list[VirClip] = []
-    start = 0
-
-    for chunk in echunk(speed_index, src_index):
-        if chunk[3] != 99999:
-            dur = int((chunk[2] - chunk[1]) / chunk[3])
-            if dur == 0:
-                continue
-
-            offset = ceil(chunk[1] / chunk[3])
-
-            if check_monotonic:
-                max_end = start + dur - 1
-                this_i = round((offset + max_end - start) * chunk[3])
-                if this_i < last_i:
-                    raise ValueError("not monotonic", sources, this_i, last_i)
-                last_i = this_i
-
-            clips.append(VirClip(start, dur, offset, chunk[3], chunk[0]))
-
-            start += dur
+    clips = make_clips(speed_index, src_index, sources, speed_map)
 
     vtl: VSpace = []
     atl: ASpace = []
@@ -286,16 +309,10 @@ def make_timeline(
     # Turn long silent/loud array to formatted chunk list.
     # Example: [1, 1, 1, 2, 2], {1: 1.0, 2: 1.5} => [(0, 3, 1.0), (3, 5, 1.5)]
     def chunkify(arr: NDArray, smap: dict[int, float]) -> Chunks:
-        arr_length = len(arr)
-
-        chunks = []
-        start = 0
-        for j in range(1, arr_length):
-            if arr[j] != arr[j - 1]:
-                chunks.append((start, j, smap[arr[j - 1]]))
-                start = j
-        chunks.append((start, arr_length, smap[arr[j]]))
-        return chunks
+        starts = run_starts(arr)
+        ends = np.append(starts[1:], len(arr))
+        speeds = [smap[i] for i in arr[starts].tolist()]
+        return list(zip(starts.tolist(), ends.tolist(), speeds))
 
     if len(sources) == 1 and inp is not None:
         chunks = chunkify(speed_index, speed_hash)
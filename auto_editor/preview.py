@@ -8,6 +8,7 @@ from typing import TextIO
 from auto_editor.analyze import initLevels
 from auto_editor.timeline import v3
 from auto_editor.utils.bar import initBar
+from auto_editor.utils.cache import Cache
 from auto_editor.utils.func import to_timecode
 from auto_editor.utils.log import Log
 
@@ -49,7 +50,7 @@ def all_cuts(tl: v3, in_len: int) -> list[int]:
     return cut_lens
 
 
-def preview(tl: v3, log: Log) -> None:
+def preview(tl: v3, cache: Cache | None, log: Log) -> None:
     log.conwrite("")
     tb = tl.tb
 
@@ -57,7 +58,7 @@ def preview(tl: v3, log: Log) -> None:
     in_len = 0
     bar = initBar("none")
     for src in tl.unique_sources():
-        in_len += initLevels(src, tb, bar, False, log).media_length
+        in_len += initLevels(src, tb, bar, cache, log).media_length
 
     out_len = len(tl)
     diff = out_len - in_len
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from fractions import Fraction
-from io import BytesIO
 from pathlib import Path
 from typing import TYPE_CHECKING, cast
 
@@ -10,6 +9,7 @@ import numpy as np
 from av import AudioFrame
 from av.filter.loudnorm import stats
 
+from auto_editor.analyze import pcm_name
 from auto_editor.ffwrapper import FileInfo
 from auto_editor.json import load
 from auto_editor.lang.palet import env
@@ -24,6 +24,7 @@ if TYPE_CHECKING:
     from collections.abc import Iterator
 
     from auto_editor.__main__ import Args
+    from auto_editor.utils.cache import Cache
 
 
 norm_types = {
@@ -154,72 +155,103 @@ def apply_audio_normalization(
         output_file.close()
 
 
-def process_audio_clip(clip: Clip, data: np.ndarray, sr: int, log: Log) -> np.ndarray:
-    to_s16 = av.AudioResampler(format="s16", layout="stereo", rate=sr)
-    input_buffer = BytesIO()
+# Samples per frame pushed into a clip's filter graph. atempo can abort on
+# frames much larger than its window.
+CLIP_FRAME_SIZE = 4096
 
-    with av.open(input_buffer, "w", format="wav") as container:
-        output_stream = container.add_stream(
-            "pcm_s16le", sample_rate=sr, format="s16", layout="stereo"
-        )
-
-        frame = AudioFrame.from_ndarray(data, format="s16p", layout="stereo")
-        frame.rate = sr
-
-        for reframe in to_s16.resample(frame):
-            container.mux(output_stream.encode(reframe))
-        container.mux(output_stream.encode(None))
-
-    input_buffer.seek(0)
-
-    input_file = av.open(input_buffer, "r")
-    input_stream = input_file.streams.audio[0]
 
+def make_clip_graph(speed: float, volume: float, sr: int) -> av.filter.Graph:
     graph = av.filter.Graph()
-    args = [graph.add_abuffer(template=input_stream)]
+    args = [
+        graph.add_abuffer(
+            sample_rate=sr, format="s16p", layout="stereo", time_base=Fraction(1, sr)
+        )
+    ]
 
-    if clip.speed != 1:
-        if clip.speed > 10_000:
+    if speed != 1:
+        if speed > 10_000:
             for _ in range(3):
-                args.append(graph.add("atempo", f"{clip.speed ** (1 / 3)}"))
-        elif clip.speed > 100:
+                args.append(graph.add("atempo", f"{speed ** (1 / 3)}"))
+        elif speed > 100:
             for _ in range(2):
-                args.append(graph.add("atempo", f"{clip.speed**0.5}"))
-        elif clip.speed >= 0.5:
-            args.append(graph.add("atempo", f"{clip.speed}"))
+                args.append(graph.add("atempo", f"{speed**0.5}"))
+        elif speed >= 0.5:
+            args.append(graph.add("atempo", f"{speed}"))
         else:
-            start = 0.5
-            while start * 0.5 > clip.speed:
-                start *= 0.5
+            tempo = speed
+            while tempo < 0.5:
+                tempo *= 2
                 args.append(graph.add("atempo", "0.5"))
-            args.append(graph.add("atempo", f"{clip.speed / start}"))
+            args.append(graph.add("atempo", f"{tempo}"))
 
-    if clip.volume != 1:
-        args.append(graph.add("volume", f"{clip.volume}"))
+    if volume != 1:
+        args.append(graph.add("volume", f"{volume}"))
 
+    args.append(graph.add("aformat", "sample_fmts=s16p:channel_layouts=stereo"))
     args.append(graph.add("abuffersink"))
     graph.link_nodes(*args).configure()
+    return graph
+
+
+def fit_length(arr: np.ndarray, length: int) -> np.ndarray:
+    if arr.shape[1] >= length:
+        return arr[:, :length]
+    return np.pad(arr, ((0, 0), (0, length - arr.shape[1])))
+
+
+def process_audio_clip(
+    clip: Clip,
+    data: np.ndarray,
+    sr: int,
+    log: Log,
+    graphs: dict[tuple[float, int], av.filter.Graph] | None = None,
+) -> np.ndarray:
+    """
+    Change the speed and volume of a clip's samples. The output is always
+    `round(len / speed)` samples long.
+
+    A graph that only changes the volume holds nothing between frames, so it is
+    kept in `graphs` and used again for later clips. atempo keeps samples back
+    and shifts them, so a graph that changes the speed serves one clip and is
+    flushed at its end.
+    """
+    length = round(data.shape[1] / clip.speed)
+    if length == 0:
+        # atempo fails on a first frame of a few samples, and there is nothing to make.
+        return np.zeros((2, 0), dtype=np.int16)
+
+    if clip.speed == 1 and graphs is not None:
+        if (graph := graphs.get((clip.volume, sr))) is None:
+            graph = graphs[(clip.volume, sr)] = make_clip_graph(1, clip.volume, sr)
+    else:
+        graph = make_clip_graph(clip.speed, clip.volume, sr)
 
     all_frames = []
-    resampler = av.AudioResampler(format="s16p", layout="stereo", rate=sr)
 
-    for frame in input_file.decode(input_stream):
-        graph.push(frame)
+    def pull() -> None:
         while True:
             try:
                 aframe = graph.pull()
-                assert isinstance(aframe, AudioFrame)
-
-                for resampled_frame in resampler.resample(aframe):
-                    all_frames.append(resampled_frame.to_ndarray())
-
             except (av.BlockingIOError, av.EOFError):
                 break
+            assert isinstance(aframe, AudioFrame)
+            all_frames.append(aframe.to_ndarray())
+
+    for i in range(0, data.shape[1], CLIP_FRAME_SIZE):
+        chunk = np.ascontiguousarray(data[:, i : i + CLIP_FRAME_SIZE])
+        frame = AudioFrame.from_ndarray(chunk, format="s16p", layout="stereo")
+        frame.sample_rate = sr
+        graph.push(frame)
+        pull()
+
+    if clip.speed != 1:
+        graph.push(None)
+        pull()
 
     if not all_frames:
         log.debug(f"No audio frames at {clip=}")
-        return np.zeros_like(data)
-    return np.concatenate(all_frames, axis=1)
+        return np.zeros((2, length), dtype=np.int16)
+    return fit_length(np.concatenate(all_frames, axis=1), length)
 
 
 def mix_audio_files(sr: int, audio_paths: list[str], output_path: str) -> None:
@@ -338,12 +370,13 @@ def make_new_audio(
     audio_format: av.AudioFormat,
     tl: v3,
     args: Args,
+    cache: Cache | None,
     log: Log,
 ) -> tuple[list[av.AudioStream], list[Iterator[AudioFrame]]]:
     audio_inputs = []
     audio_gen_frames = []
     audio_streams: list[av.AudioStream] = []
-    audio_paths = _make_new_audio(tl, audio_format, args, log)
+    audio_paths = _make_new_audio(tl, audio_format, args, cache, log)
 
     for i, audio_path in enumerate(audio_paths):
         audio_stream = output.add_stream(
@@ -377,68 +410,160 @@ def make_new_audio(
     return audio_streams, audio_gen_frames
 
 
+# Seconds of decoded audio a Getter keeps, and how far ahead of what it has
+# decoded a read can start before seeking is faster than decoding up to it.
+BUFFER_SECONDS = 10
+SEEK_SECONDS = 0.25
+
+
 class Getter:
-    __slots__ = ("container", "stream", "rate")
+    """
+    Read samples from an audio stream, resampled to 16-bit stereo at `rate`.
+    Sample n is the one n / rate seconds into the file.
+
+    Clips mostly ask for audio in order and close together, so decoding carries
+    on from the end of the last read, and recent samples are kept in a ring
+    buffer for reads that go back a little. Only reads far away seek.
+
+    With `pcm`, samples already decoded during analysis, reads are slices of it
+    and nothing is decoded.
+    """
+
+    __slots__ = (
+        "pcm",
+        "container",
+        "stream",
+        "rate",
+        "decoder",
+        "resampler",
+        "buffer",
+        "head",
+        "tail",
+    )
+
+    def __init__(
+        self, path: Path, stream: int, rate: int, pcm: np.ndarray | None = None
+    ):
+        self.pcm = pcm
+        if pcm is not None:
+            return
 
-    def __init__(self, path: Path, stream: int, rate: int):
         self.container = av.open(path)
         self.stream = self.container.streams.audio[stream]
         self.rate = rate
+        self.buffer = np.zeros((2, rate * BUFFER_SECONDS), dtype=np.int16)
+        self.restart(None)
+
+    def restart(self, pts: int | None) -> None:
+        if pts is not None:
+            self.container.seek(pts, stream=self.stream)
+        self.decoder: Iterator[AudioFrame] | None = self.container.decode(self.stream)
+        self.resampler = av.AudioResampler(
+            format="s16p", layout="stereo", rate=self.rate
+        )
+        # The samples held are those from `head` up to `tail`. Where they are is
+        # only known once a frame has been decoded.
+        self.head: int | None = None
+        self.tail: int | None = None
+
+    def decode(self) -> None:
+        assert self.decoder is not None
+        frame = next(self.decoder, None)
+        if frame is None:
+            self.decoder = None
+            if self.tail is not None:
+                for resampled in self.resampler.resample(None):
+                    self.write(resampled.to_ndarray())
+            return
+
+        if self.tail is None:
+            self.head = self.tail = round((frame.time or 0) * self.rate)
+        for resampled in self.resampler.resample(frame):
+            self.write(resampled.to_ndarray())
+
+    def write(self, data: np.ndarray) -> None:
+        assert self.head is not None and self.tail is not None
+        size = self.buffer.shape[1]
+        if data.shape[1] > size:
+            self.tail += data.shape[1] - size
+            data = data[:, -size:]
+
+        i = self.tail % size
+        n = min(data.shape[1], size - i)
+        self.buffer[:, i : i + n] = data[:, :n]
+        self.buffer[:, : data.shape[1] - n] = data[:, n:]
+        self.tail += data.shape[1]
+        self.head = max(self.head, self.tail - size)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        size = self.buffer.shape[1]
+        i, j = start % size, end % size
+        if i < j or end == start:
+            return self.buffer[:, i:j]
+        return np.concatenate((self.buffer[:, i:], self.buffer[:, :j]), axis=1)
+
+    def grow(self, size: int) -> None:
+        buffer = np.zeros((2, size), dtype=np.int16)
+        if self.head is not None and self.tail is not None and self.head < self.tail:
+            data = self.read(self.head, self.tail)
+            i = self.head % size
+            n = min(data.shape[1], size - i)
+            buffer[:, i : i + n] = data[:, :n]
+            buffer[:, : data.shape[1] - n] = data[:, n:]
+        self.buffer = buffer
 
     def get(self, start: int, end: int) -> np.ndarray:
         # start/end is in samples
 
-        container = self.container
-        stream = self.stream
-        resampler = av.AudioResampler(format="s16p", layout="stereo", rate=self.rate)
-
-        time_base = stream.time_base
-        assert time_base is not None
-        start_pts = int(start / self.rate / time_base)
-
-        # Seek to the approximate position
-        container.seek(start_pts, stream=stream)
-
-        all_frames = []
-        total_samples = 0
-        target_samples = end - start
-
-        # Decode frames until we have enough samples
-        for frame in container.decode(stream):
-            for resampled_frame in resampler.resample(frame):
-                frame_array = resampled_frame.to_ndarray()
-                all_frames.append(frame_array)
-                total_samples += frame_array.shape[1]
-
-                if total_samples >= target_samples:
-                    break
-
-            if total_samples >= target_samples:
-                break
-
-        result = np.concatenate(all_frames, axis=1)
-
-        # Trim to exact size
-        if result.shape[1] > target_samples:
-            result = result[:, :target_samples]
-        elif result.shape[1] < target_samples:
-            # Pad with zeros if we don't have enough samples
-            padding = np.zeros(
-                (result.shape[0], target_samples - result.shape[1]), dtype=result.dtype
-            )
-            result = np.concatenate([result, padding], axis=1)
-
-        assert result.shape[1] == end - start
-        return result  # Return NumPy array with shape (channels, samples)
+        if (pcm := self.pcm) is not None:
+            if end <= pcm.shape[1]:
+                return pcm[:, start:end]
+            result = np.zeros((2, end - start), dtype=np.int16)
+            if start < pcm.shape[1]:
+                result[:, : pcm.shape[1] - start] = pcm[:, start:]
+            return result
+
+        # Leave room for a frame's worth of samples past the end.
+        if end - start + self.rate > self.buffer.shape[1]:
+            self.grow(end - start + self.rate)
+
+        while self.tail is None and self.decoder is not None:
+            self.decode()
+        if (
+            self.head is not None
+            and self.tail is not None
+            and (start < self.head or start > self.tail + self.rate * SEEK_SECONDS)
+        ):
+            # Decoders need a few frames before their output is right again.
+            preroll = max(start - self.rate // 20, 0)
+            time_base = self.stream.time_base
+            assert time_base is not None
+            self.restart(int(preroll / self.rate / time_base))
+            while self.tail is None and self.decoder is not None:
+                self.decode()
+            if self.head is not None and preroll > 0:
+                self.head = max(self.head, start)
+
+        while self.tail is not None and self.tail < end and self.decoder is not None:
+            self.decode()
+
+        # Pad with zeros where there's no audio.
+        result = np.zeros((2, end - start), dtype=np.int16)
+        if self.head is not None and self.tail is not None:
+            lo, hi = max(start, self.head), min(end, self.tail)
+            if lo < hi:
+                result[:, lo - start : hi - start] = self.read(lo, hi)
+        return result
 
 
 def _make_new_audio(
-    tl: v3, fmt: av.AudioFormat, args: Args, log: Log
+    tl: v3, fmt: av.AudioFormat, args: Args, cache: Cache | None, log: Log
 ) -> list[str | Iterator[AudioFrame]]:
     sr = tl.sr
     tb = tl.tb
     output: list[str | Iterator[AudioFrame]] = []
     samples: dict[tuple[FileInfo, int], Getter] = {}
+    graphs: dict[tuple[float, int], av.filter.Graph] = {}
 
     norm = parse_norm(args.audio_normalize, log)
 
@@ -457,8 +582,15 @@ def _make_new_audio(
 
         for clip in layer:
             if (clip.src, clip.stream) not in samples:
+                pcm = None
+                if args.cache_audio and cache is not None:
+                    source = cache.source_key(clip.src.path)
+                    pcm = cache.get(pcm_name(source, clip.stream, sr))
+                    if pcm is not None and (pcm.ndim != 2 or pcm.shape[0] != 2):
+                        pcm = None
+                    log.debug(f"Cached audio for {clip.src.path}: {pcm is not None}")
                 samples[(clip.src, clip.stream)] = Getter(
-                    clip.src.path, clip.stream, sr
+                    clip.src.path, clip.stream, sr, pcm
                 )
 
             log.conwrite("Creating audio")
@@ -474,7 +606,7 @@ def _make_new_audio(
 
             if clip.speed != 1 or clip.volume != 1:
                 clip_arr = process_audio_clip(
-                    clip, getter.get(samp_start, samp_end), sr, log
+                    clip, getter.get(samp_start, samp_end), sr, log, graphs
                 )
             else:
                 clip_arr = getter.get(samp_start, samp_end)
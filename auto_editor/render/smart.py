@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+from fractions import Fraction
+from typing import TYPE_CHECKING, cast
+
+import av
+from av import Codec
+
+from auto_editor.render.video import find_keyframes
+from auto_editor.timeline import Clip
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from auto_editor.__main__ import Args
+    from auto_editor.ffwrapper import FileInfo
+    from auto_editor.timeline import v3
+    from auto_editor.utils.cache import Cache
+    from auto_editor.utils.log import Log
+
+# Quality of the frames re-encoded around cuts, high enough that they don't stand
+# out next to the copied ones. --smart-render's help mentions it.
+CUT_CRF = 16
+
+
+def copyable_clips(tl: v3, args: Args) -> list[Clip] | None:
+    """
+    Return the clips of a timeline whose video can be copied instead of rendered:
+    back to back clips at normal speed from one H.264 source, with nothing drawn
+    over them and no change of size or frame rate.
+    """
+    layers = [layer for layer in tl.v if layer]
+    if len(layers) != 1 or not all(isinstance(clip, Clip) for clip in layers[0]):
+        return None
+    clips: list[Clip] = layers[0]  # type: ignore
+
+    src = clips[0].src
+    if not src.videos or src.videos[0].codec != "h264":
+        return None
+    if src.videos[0].fps != tl.tb or src.get_res() != tl.res or args.scale != 1:
+        return None
+    if args.video_bitrate != "auto" or args.vprofile is not None:
+        return None
+    try:
+        if Codec(args.video_codec, "w").canonical_name != "h264":
+            return None
+    except av.FFmpegError:
+        return None
+
+    end = 0
+    for clip in clips:
+        if clip.src != src or clip.speed != 1 or clip.start != end or clip.offset < 0:
+            return None
+        end += clip.dur
+    if end != tl.end:
+        return None
+
+    return clips
+
+
+def parameter_sets(extradata: bytes) -> tuple[bytes, int]:
+    """
+    Read an avcC record. Return its SPS and PPS NAL units, each prefixed by its
+    length, and how many bytes those lengths take.
+    """
+    size = (extradata[4] & 3) + 1
+    nals = []
+    pos = 5
+    for mask in (0x1F, 0xFF):
+        count = extradata[pos] & mask
+        pos += 1
+        for _ in range(count):
+            length = int.from_bytes(extradata[pos : pos + 2], "big")
+            nals.append(extradata[pos + 2 : pos + 2 + length])
+            pos += 2 + length
+
+    return b"".join(len(nal).to_bytes(size, "big") + nal for nal in nals), size
+
+
+def to_length_prefixed(data: bytes, size: int) -> bytes:
+    """Convert NAL units separated by start codes to the layout avcC streams use."""
+    nals = (part.rstrip(b"\x00") for part in data.split(b"\x00\x00\x01")[1:])
+    return b"".join(len(nal).to_bytes(size, "big") + nal for nal in nals if nal)
+
+
+def plan_pieces(
+    keyframes: list[int], start: int, end: int
+) -> list[tuple[bool, int, int]]:
+    """
+    Split the source frames from `start` to `end` into pieces to re-encode and,
+    in the middle, whole GOPs to copy. Return (copy, start, end) for each piece.
+    """
+    gops = [(a, b) for a, b in zip(keyframes, keyframes[1:]) if a >= start and b <= end]
+    if not gops:
+        return [(False, start, end)]
+
+    pieces = [(True, gops[0][0], gops[-1][1])]
+    if start < gops[0][0]:
+        pieces.insert(0, (False, start, gops[0][0]))
+    if gops[-1][1] < end:
+        pieces.append((False, gops[-1][1], end))
+    return pieces
+
+
+def smart_render(
+    output: av.container.OutputContainer,
+    tl: v3,
+    clips: list[Clip],
+    args: Args,
+    cache: Cache | None,
+    log: Log,
+) -> Iterator[tuple[int, av.Packet]]:
+    """
+    Copy the packets of every GOP that a clip keeps whole, and re-encode only the
+    frames around cuts. This relies on closed GOPs, which x264 and most screen
+    and camera recorders write.
+
+    Re-encoded frames carry their own SPS and PPS, so the source's are repeated
+    at the start of every copied run. They use no B-frames, and their decode
+    times lag by as much as the source's do, so decode times keep increasing.
+    """
+    src: FileInfo = clips[0].src
+    key_pts, key_indexes = find_keyframes(src, tl.tb, cache)
+    keyframes = [int(i) for i in key_indexes]
+    pts_at = dict(zip(keyframes, (int(pts) for pts in key_pts)))
+
+    cn = av.open(src.path)
+    stream = cn.streams.video[0]
+    cc = stream.codec_context
+    assert stream.time_base is not None and cc.extradata is not None
+    tb = stream.time_base
+    params, size = parameter_sets(cc.extradata)
+
+    delay = 0
+    for packet in cn.demux(stream):
+        if packet.is_keyframe and packet.pts is not None and packet.dts is not None:
+            delay = packet.pts - packet.dts
+            break
+
+    output_stream = output.add_stream_from_template(stream)
+    output_stream.time_base = tb
+    if src.videos[0].lang is not None:
+        output_stream.metadata["language"] = src.videos[0].lang
+    yield output_stream  # type: ignore
+
+    to_index = tb * tl.tb
+    frame_dur = round(1 / to_index)
+    copied = 0
+
+    def make_packet(data: bytes, pts: int, dts: int, key: bool) -> av.Packet:
+        packet = av.Packet(data)
+        packet.pts, packet.dts, packet.time_base = pts, dts, tb
+        packet.duration = frame_dur
+        packet.is_keyframe = key
+        packet.stream = output_stream
+        return packet
+
+    for clip in clips:
+        shift = round(Fraction(clip.start - clip.offset) / tl.tb / tb)
+        for copy, start, end in plan_pieces(
+            keyframes, clip.offset, clip.offset + clip.dur
+        ):
+            log.debug(f"{'Copy' if copy else 'Encode'}: {start} -> {end}")
+            first_kf = max(k for k in keyframes if k <= start) if keyframes else None
+            if first_kf is None:
+                cn.seek(0)
+            else:
+                cn.seek(pts_at[first_kf], stream=stream)
+
+            if copy:
+                copied += end - start
+                end_pts = pts_at[end]
+                first = True
+                for packet in cn.demux(stream):
+                    if packet.dts is None or packet.pts is None:
+                        continue
+                    if packet.is_keyframe and packet.pts >= end_pts:
+                        break
+                    data = bytes(packet)
+                    if first:
+                        data = params + data
+                        first = False
+                    pts, dts = packet.pts + shift, packet.dts + shift
+                    yield (
+                        round(dts * to_index),
+                        make_packet(data, pts, dts, packet.is_keyframe),
+                    )
+                continue
+
+            encoder = cast(
+                av.VideoCodecContext, av.CodecContext.create(args.video_codec, "w")
+            )
+            encoder.width, encoder.height = cc.width, cc.height
+            encoder.pix_fmt = cc.pix_fmt
+            encoder.time_base, encoder.framerate = tb, tl.tb
+            encoder.max_b_frames = 0
+            encoder.color_range = cc.color_range
+            encoder.colorspace = cc.colorspace
+            encoder.color_primaries = cc.color_primaries
+            encoder.color_trc = cc.color_trc
+            if cc.profile is not None and cc.profile in encoder.profiles:
+                encoder.profile = cc.profile
+            encoder.options = {"crf": f"{CUT_CRF}"}
+
+            def encode(frame: av.VideoFrame | None) -> Iterator[tuple[int, av.Packet]]:
+                for packet in encoder.encode(frame):
+                    assert packet.pts is not None
+                    data = to_length_prefixed(bytes(packet), size)
+                    dts = packet.pts - delay
+                    yield (
+                        round(dts * to_index),
+                        make_packet(data, packet.pts, dts, packet.is_keyframe),
+                    )
+
+            for frame in cn.decode(stream):
+                assert frame.pts is not None
+                index = round(frame.pts * to_index)
+                if index < start:
+                    continue
+                if index >= end:
+                    break
+                frame.pts += shift
+                frame.time_base = tb
+                frame.pict_type = av.video.frame.PictureType.NONE
+                yield from encode(frame)
+            yield from encode(None)
+
+    cn.close()
+    log.debug(f"Copied {copied} of {tl.end} frames")
@@ -1,21 +1,34 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import TYPE_CHECKING
+import os
+import threading
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from fractions import Fraction
+from hashlib import sha1
+from math import ceil
+from queue import Empty, Queue
+from typing import TYPE_CHECKING, Literal
 
 import av
 import numpy as np
 
 from auto_editor.timeline import Clip, TlImage, TlRect
 from auto_editor.utils.func import parse_bitrate
+from auto_editor.utils.log import Log
 
 if TYPE_CHECKING:
     from collections.abc import Iterator
 
+    from numpy.typing import NDArray
+
     from auto_editor.__main__ import Args
     from auto_editor.ffwrapper import FileInfo
-    from auto_editor.timeline import v3
-    from auto_editor.utils.log import Log
+    from auto_editor.timeline import VSpace, v3
+    from auto_editor.utils.cache import Cache
+
+    Keyframes = tuple[NDArray[np.int64], NDArray[np.int64]]
 
 
 @dataclass(slots=True)
@@ -56,15 +69,472 @@ def make_image_cache(tl: v3) -> dict[tuple[FileInfo, int], np.ndarray]:
     return img_cache
 
 
+# 8-bit planar YUV formats that overlays are drawn on directly, with how far
+# their chroma planes are shifted down in width and height.
+PLANAR_YUV = {
+    "yuv420p": (1, 1),
+    "yuvj420p": (1, 1),
+    "yuv422p": (1, 0),
+    "yuvj422p": (1, 0),
+    "yuv440p": (0, 1),
+    "yuvj440p": (0, 1),
+    "yuv444p": (0, 0),
+    "yuvj444p": (0, 0),
+}
+
+
+def plane_arrays(frame: av.VideoFrame) -> list[np.ndarray]:
+    """View each plane of `frame` as a 2D array, without the row padding."""
+    return [
+        np.frombuffer(memoryview(plane), np.uint8).reshape(-1, plane.line_size)[
+            : plane.height, : plane.width
+        ]
+        for plane in frame.planes
+    ]
+
+
+def copy_frame(frame: av.VideoFrame) -> av.VideoFrame:
+    """
+    Copy a frame into a new buffer that is safe to draw on. Decoded frames may
+    still be referenced by the decoder, and solid frames are shared.
+    """
+    out = av.VideoFrame(frame.width, frame.height, frame.format.name)
+    out.pict_type = frame.pict_type
+    for dst, src in zip(plane_arrays(out), plane_arrays(frame)):
+        dst[...] = src
+    return out
+
+
+def clip_span(start: int, size: int, limit: int) -> tuple[slice, slice]:
+    """Clip `size` pixels from `start` to a plane `limit` pixels wide."""
+    lo = min(max(start, 0), limit)
+    hi = max(min(start + size, limit), lo)
+    return slice(lo, hi), slice(lo - start, hi - start)
+
+
+@dataclass(slots=True)
+class Blend:
+    """
+    What to draw on each plane of a frame with a fixed size and format.
+
+    With `alpha` at 256, `over` is copied in as is. Otherwise it holds the
+    overlay premultiplied by `alpha` in 8.8 fixed-point, with the rounding term
+    already added, and each pixel becomes `(dst * (256 - alpha) + over) >> 8`.
+    """
+
+    regions: list[tuple[slice, slice]]
+    over: list[np.ndarray | int]
+    alpha: int
+    scratch: list[np.ndarray]
+
+    def apply(self, frame: av.VideoFrame) -> None:
+        inv_alpha = np.uint16(256 - self.alpha)
+        for i, (plane, region, over) in enumerate(
+            zip(plane_arrays(frame), self.regions, self.over)
+        ):
+            dst = plane[region]
+            if self.alpha == 256:
+                dst[...] = over
+            else:
+                scratch = self.scratch[i]
+                np.multiply(dst, inv_alpha, out=scratch)
+                scratch += over
+                scratch >>= 8
+                dst[...] = scratch
+
+
+def image_blend(img: np.ndarray, obj: TlImage, frame: av.VideoFrame) -> Blend:
+    fmt = frame.format.name
+    shift_x, shift_y = PLANAR_YUV[fmt]
+    alpha = round(obj.opacity * 256)
+
+    over_frame = av.VideoFrame.from_ndarray(img, format="rgb24").reformat(format=fmt)
+    regions = []
+    overs: list[np.ndarray | int] = []
+    scratch = []
+    for i, (plane, over) in enumerate(
+        zip(plane_arrays(frame), plane_arrays(over_frame))
+    ):
+        sx, sy = (shift_x, shift_y) if i > 0 else (0, 0)
+        rows, over_rows = clip_span(obj.y >> sy, over.shape[0], plane.shape[0])
+        cols, over_cols = clip_span(obj.x >> sx, over.shape[1], plane.shape[1])
+        over = over[over_rows, over_cols]
+
+        regions.append((rows, cols))
+        if alpha == 256:
+            overs.append(over.copy())
+        else:
+            overs.append(over.astype(np.uint16) * np.uint16(alpha) + np.uint16(128))
+        scratch.append(np.empty(over.shape, dtype=np.uint16))
+
+    return Blend(regions, overs, alpha, scratch)
+
+
+def drawbox_color(fill: str) -> list[int]:
+    """
+    Convert a "#rrggbb" color to limited range BT.601 YUV, rounded the same
+    way drawbox does for every YUV format.
+    """
+    r, g, b = (int(fill[i : i + 2], 16) for i in (1, 3, 5))
+
+    def fix(x: float) -> int:
+        return int(x * 1024 + 0.5)
+
+    y = fix(0.299 * 219 / 255) * r + fix(0.587 * 219 / 255) * g
+    y += fix(0.114 * 219 / 255) * b + 512 + (16 << 10)
+    u = fix(0.5 * 224 / 255) * b - fix(0.16874 * 224 / 255) * r
+    u -= fix(0.33126 * 224 / 255) * g
+    v = fix(0.5 * 224 / 255) * r - fix(0.41869 * 224 / 255) * g
+    v -= fix(0.08131 * 224 / 255) * b
+    return [y >> 10, ((u + 511) >> 10) + 128, ((v + 511) >> 10) + 128]
+
+
+def rect_blend(obj: TlRect, frame: av.VideoFrame) -> Blend:
+    shift_x, shift_y = PLANAR_YUV[frame.format.name]
+    color: list[np.ndarray | int] = list(drawbox_color(obj.fill))
+    regions = []
+    for i, plane in enumerate(plane_arrays(frame)):
+        sx, sy = (shift_x, shift_y) if i > 0 else (0, 0)
+        # Chroma samples touched by any pixel of the rectangle are filled.
+        top, left = obj.y >> sy, obj.x >> sx
+        bottom = (obj.y + obj.height - 1) >> sy
+        right = (obj.x + obj.width - 1) >> sx
+        rows, _ = clip_span(top, bottom - top + 1, plane.shape[0])
+        cols, _ = clip_span(left, right - left + 1, plane.shape[1])
+        regions.append((rows, cols))
+
+    return Blend(regions, color, 256, [])
+
+
+def make_graph(
+    stream: av.VideoStream, frame: av.VideoFrame, *filters: tuple[str, str]
+) -> av.filter.Graph:
+    """Make a graph that takes frames shaped like `frame` through `filters`."""
+    graph = av.filter.Graph()
+    graph.link_nodes(
+        graph.add_buffer(
+            template=stream,
+            width=frame.width,
+            height=frame.height,
+            format=frame.format,
+        ),
+        *(graph.add(name, args) for name, args in filters),
+        graph.add("buffersink"),
+    )
+    return graph
+
+
+def iter_objects(
+    layers: VSpace, end: int, start: int = 0
+) -> Iterator[list[VideoFrame | TlRect | TlImage]]:
+    """
+    Yield the objects to draw at each frame index from `start` to `end`, in layer
+    order.
+    Objects are kept in a list of active ones that only changes when one starts
+    or ends, so each frame costs as much as the objects on it.
+    """
+    objs = [lobj for layer in layers for lobj in layer]
+    starts = sorted(
+        (i for i, lobj in enumerate(objs) if lobj.dur > 0),
+        key=lambda i: objs[i].start,
+    )
+    active: list[int] = []
+    next_start = 0
+    next_end = end
+
+    for index in range(start, end):
+        if index >= next_end:
+            active = [i for i in active if index < objs[i].start + objs[i].dur]
+            next_end = min((objs[i].start + objs[i].dur for i in active), default=end)
+
+        while next_start < len(starts) and objs[starts[next_start]].start <= index:
+            i = starts[next_start]
+            if index < objs[i].start + objs[i].dur:
+                insort(active, i)
+                next_end = min(next_end, objs[i].start + objs[i].dur)
+            next_start += 1
+
+        obj_list: list[VideoFrame | TlRect | TlImage] = []
+        for i in active:
+            lobj = objs[i]
+            if isinstance(lobj, Clip):
+                _i = round((lobj.offset + index - lobj.start) * lobj.speed)
+                obj_list.append(VideoFrame(_i, lobj.src))
+            else:
+                obj_list.append(lobj)
+        yield obj_list
+
+
+def find_keyframes(src: FileInfo, tb: Fraction, cache: Cache | None) -> Keyframes:
+    """
+    Find the keyframes of the first video stream by reading its packets without
+    decoding them. Return their pts, and the timeline index each one falls on.
+    """
+    cached: NDArray[np.int64] | None = None
+    if cache is not None:
+        key = f"{cache.source_key(src.path)}:0"
+        name = f"{sha1(key.encode()).hexdigest()[:16]}keyframes"
+        cached = cache.get(name)
+
+    with av.open(src.path) as cn:
+        stream = cn.streams.video[0]
+        if cached is None:
+            pts = {
+                packet.pts
+                for packet in cn.demux(stream)
+                if packet.is_keyframe and packet.pts is not None
+            }
+            arr = np.array(sorted(pts), dtype=np.int64)
+            if cache is not None:
+                cache.put(name, arr)
+        else:
+            arr = cached
+
+        assert stream.time_base is not None
+        to_index = float(stream.time_base) * float(tb)
+
+    return arr, np.round(arr * to_index).astype(np.int64)
+
+
+def plan_seek(keyframes: Keyframes, position: int, target: int) -> int | None:
+    """
+    Decide how to get a decoder that last returned frame `position` to `target`.
+    Return the keyframe to seek to, -1 to seek to the start, or None to just keep
+    decoding. Seeking pays off whenever a keyframe lies past the next frame.
+    """
+    indexes = keyframes[1]
+    i = int(np.searchsorted(indexes, target, side="right")) - 1
+    if target < position:
+        return i
+    if i >= 0 and indexes[i] > position + 1:
+        return i
+    return None
+
+
+def needed_frames(tl: v3, start: int, end: int) -> dict[FileInfo, NDArray[np.int64]]:
+    """Return the frame indexes that rendering `start` to `end` takes from each source."""
+    parts: dict[FileInfo, list[NDArray[np.int64]]] = {}
+    for layer in tl.v:
+        for lobj in layer:
+            if isinstance(lobj, Clip):
+                lo, hi = max(lobj.start, start), min(lobj.start + lobj.dur, end)
+                if lo < hi:
+                    offsets = lobj.offset + np.arange(lo, hi) - lobj.start
+                    indexes = np.round(offsets * lobj.speed).astype(np.int64)
+                    parts.setdefault(lobj.src, []).append(indexes)
+
+    return {src: np.unique(np.concatenate(p)) for src, p in parts.items()}
+
+
+@dataclass(slots=True)
+class SkipPlan:
+    """
+    Tell the decoder which frames of a source can go undecoded. Frames nothing
+    uses are skipped if no other frame refers to them, and every frame but
+    keyframes is skipped up to a keyframe that comes before the next one used.
+    """
+
+    needed: NDArray[np.int64]
+    keyframes: NDArray[np.int64] | None
+    # How far apart in timeline indexes the source's frames are.
+    step: int
+    time_base: Fraction
+    tb: Fraction
+
+    def mode(self, pts: int) -> Literal["DEFAULT", "NONREF", "NONKEY"]:
+        index = round(
+            pts * self.time_base.numerator / self.time_base.denominator * self.tb
+        )
+        # A frame is used for every index it covers. Allow one more for jitter.
+        i = int(np.searchsorted(self.needed, index - self.step - 1, side="right"))
+        if i < len(self.needed) and self.needed[i] <= index:
+            return "DEFAULT"
+
+        if self.keyframes is not None:
+            k = int(np.searchsorted(self.keyframes, index, side="right"))
+            if k < len(self.keyframes) and (
+                i == len(self.needed) or self.needed[i] > self.keyframes[k]
+            ):
+                return "NONKEY"
+        return "NONREF"
+
+
+class Prefetcher:
+    """
+    Decode a video stream on its own thread, keeping up to `size` frames ready.
+    libav releases the GIL while it decodes, so this overlaps with drawing and
+    encoding on the thread that reads the frames.
+
+    The thread starts on the first frame or seek asked for, so sources that are
+    never read don't cost one. Only the decoding thread touches the container
+    once it starts. Seeks are sent to it, and every frame is tagged with the seek
+    it came after so that frames decoded before one can be dropped.
+
+    The thread stops at the first error. The error is raised by the next call
+    to `__next__` or `seek`, and by every call after it.
+    """
+
+    __slots__ = (
+        "cn",
+        "stream",
+        "skip",
+        "frames",
+        "commands",
+        "generation",
+        "done",
+        "error",
+        "thread",
+    )
+
+    def __init__(
+        self,
+        cn: av.container.InputContainer,
+        stream: av.VideoStream,
+        skip: SkipPlan | None = None,
+        size: int = 8,
+    ):
+        self.cn = cn
+        self.stream = stream
+        self.skip = skip
+        self.frames: Queue[tuple[int, av.VideoFrame | BaseException | None]] = Queue(
+            size
+        )
+        self.commands: Queue[tuple[int, int | None] | None] = Queue()
+        self.generation = 0
+        self.done = False
+        self.error: BaseException | None = None
+        self.thread: threading.Thread | None = None
+
+    def start(self) -> threading.Thread:
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self.thread
+
+    def decode(self) -> Iterator[av.VideoFrame]:
+        cc = self.stream.codec_context
+        for packet in self.cn.demux(self.stream):
+            if self.skip is not None and packet.pts is not None:
+                cc.skip_frame = self.skip.mode(packet.pts)
+            yield from self.stream.decode(packet)
+
+    def run(self) -> None:
+        generation = 0
+        decoder = self.decode()
+        command: tuple[int, int | None] | None
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except Empty:
+                pass
+            else:
+                if command is None:
+                    return
+                generation, pts = command
+                try:
+                    if pts is None:
+                        self.cn.seek(0)
+                    else:
+                        self.cn.seek(pts, stream=self.stream)
+                except BaseException as e:
+                    self.fail(generation, e)
+                    return
+                # The old decoder may have already run out of frames.
+                decoder = self.decode()
+
+            try:
+                frame = next(decoder, None)
+            except BaseException as e:
+                self.fail(generation, e)
+                return
+
+            self.frames.put((generation, frame))
+            if frame is None:
+                # Wait for a seek, or to be stopped.
+                command = self.commands.get()
+                if command is None:
+                    return
+                self.commands.put(command)
+
+    def fail(self, generation: int, error: BaseException) -> None:
+        # Set before the error is queued, so that a seek that drains it still
+        # sees it.
+        self.error = error
+        self.frames.put((generation, error))
+
+    def seek(self, pts: int | None) -> None:
+        """Seek to the keyframe at `pts`, or to the start if it's None."""
+        self.start()
+        # Every frame waiting now is from before the seek.
+        self.drain()
+        if self.error is not None:
+            raise self.error
+        self.generation += 1
+        self.done = False
+        self.commands.put((self.generation, pts))
+
+    def drain(self) -> None:
+        # This also makes room if the decoding thread is waiting to add a frame.
+        try:
+            while True:
+                self.frames.get_nowait()
+        except Empty:
+            pass
+
+    def __iter__(self) -> Prefetcher:
+        return self
+
+    def __next__(self) -> av.VideoFrame:
+        thread = self.start()
+        if self.done and self.error is not None:
+            raise self.error
+        while not self.done:
+            try:
+                generation, item = self.frames.get(timeout=1)
+            except Empty:
+                if thread.is_alive():
+                    continue
+                # Its error was drained by a seek, or it died some other way.
+                self.done = True
+                raise self.error or RuntimeError("Video decoding thread stopped")
+            if isinstance(item, BaseException):
+                # Nothing comes after an error, whichever seek it followed.
+                self.done = True
+                raise item
+            if generation != self.generation:
+                continue
+            if item is None:
+                self.done = True
+                break
+            return item
+        raise StopIteration
+
+    def close(self) -> None:
+        if self.thread is None:
+            return
+        self.commands.put(None)
+        self.drain()
+        self.thread.join()
+
+
 def render_av(
-    output: av.container.OutputContainer, tl: v3, args: Args, log: Log
+    output: av.container.OutputContainer,
+    tl: v3,
+    args: Args,
+    cache: Cache | None,
+    log: Log,
+    start: int = 0,
+    end: int | None = None,
 ) -> Iterator[tuple[int, av.VideoFrame]]:
     from_ndarray = av.VideoFrame.from_ndarray
 
     cns: dict[FileInfo, av.container.InputContainer] = {}
-    decoders: dict[FileInfo, Iterator[av.VideoFrame]] = {}
-    seek_cost: dict[FileInfo, int] = {}
-    tous: dict[FileInfo, int] = {}
+    decoders: dict[FileInfo, Prefetcher] = {}
+    # Each decoder's last frame and the timeline index it falls on.
+    positions: dict[FileInfo, int] = {}
+    last_frames: dict[FileInfo, av.VideoFrame] = {}
+    keyframes: dict[FileInfo, Keyframes] = {}
+    no_keyframes: Keyframes = (np.zeros(0, np.int64), np.zeros(0, np.int64))
 
     pix_fmt = "yuv420p"  # Reasonable default
     target_fps = tl.tb  # Always constant
@@ -78,27 +548,31 @@ def render_av(
         if src not in cns:
             cns[src] = av.open(f"{src.path}")
 
+    end = tl.end if end is None else end
+    needed = needed_frames(tl, start, end)
     for src, cn in cns.items():
         if len(cn.streams.video) > 0:
             stream = cn.streams.video[0]
             stream.thread_type = "AUTO"
-
-            if args.no_seek or stream.average_rate is None or stream.time_base is None:
-                sc_val = 4294967295  # 2 ** 32 - 1
-                tou = 0
-            else:
-                # Keyframes are usually spread out every 5 seconds or less.
-                sc_val = int(stream.average_rate * 5)
-                tou = int(stream.time_base.denominator / stream.average_rate)
-
-            seek_cost[src] = sc_val
-            tous[src] = tou
-            decoders[src] = cn.decode(stream)
+            skip = None
+            used = needed.get(src, no_keyframes[1])
+            step = max(ceil(tl.tb / src.get_fps()), 1)
+            # Only sources that the render passes over parts of are worth it.
+            gaps = np.diff(used, prepend=-1)
+            if len(used) == 0 or gaps.max() > step + 1:
+                kf_indexes = None
+                if not args.no_seek:
+                    keyframes[src] = find_keyframes(src, tl.tb, cache)
+                    kf_indexes = keyframes[src][1]
+                    log.debug(f"Keyframes in {src.path}: {len(kf_indexes)}")
+                assert stream.time_base is not None
+                skip = SkipPlan(used, kf_indexes, step, stream.time_base, tl.tb)
+            decoders[src] = Prefetcher(cn, stream, skip)
+            positions[src] = -1
 
             if src == first_src and stream.pix_fmt is not None:
                 pix_fmt = stream.pix_fmt
 
-    log.debug(f"Tous: {tous}")
     log.debug(f"Clips: {tl.v}")
 
     codec = av.Codec(args.video_codec, "w")
@@ -181,26 +655,19 @@ def render_av(
     if src is not None and src.videos and (sar := src.videos[0].sar) is not None:
         output_stream.sample_aspect_ratio = sar
 
-    # First few frames can have an abnormal keyframe count, so never seek there.
-    seek = 10
-    seek_frame = None
+    seeks = 0
     frames_saved = 0
 
     bg = args.background
     null_frame = make_solid(target_width, target_height, pix_fmt, bg)
-    frame_index = -1
-
-    for index in range(tl.end):
-        obj_list: list[VideoFrame | TlRect | TlImage] = []
-        for layer in tl.v:
-            for lobj in layer:
-                if isinstance(lobj, Clip):
-                    if index >= lobj.start and index < (lobj.start + lobj.dur):
-                        _i = round((lobj.offset + index - lobj.start) * lobj.speed)
-                        obj_list.append(VideoFrame(_i, lobj.src))
-                elif index >= lobj.start and index < lobj.start + lobj.dur:
-                    obj_list.append(lobj)
-
+    # Resize and rectangle graphs, reused for every frame with the same input.
+    graphs: dict[tuple[object, ...], av.filter.Graph] = {}
+    # Images and rectangles, ready to draw on frames of the same size and format.
+    blends: dict[tuple[object, ...], Blend] = {}
+
+    for index, obj_list in enumerate(iter_objects(tl.v, end, start), start):
+        # The copy of this index's frame that is being drawn on, if any.
+        drawn: av.VideoFrame | None = None
         if tl.v1 is not None:
             # When there can be valid gaps in the timeline.
             frame = null_frame
@@ -208,69 +675,124 @@ def render_av(
 
         for obj in obj_list:
             if isinstance(obj, VideoFrame):
-                my_stream = cns[obj.src].streams.video[0]
-                if frame_index > obj.index:
-                    log.debug(f"Seek: {frame_index} -> 0")
-                    cns[obj.src].seek(0)
-                    try:
-                        frame = next(decoders[obj.src])
-                        frame_index = round(frame.time * tl.tb)
-                    except StopIteration:
-                        pass
+                src = obj.src
+                my_stream = cns[src].streams.video[0]
+                frame_index = positions[src]
+
+                if obj.index not in (frame_index, frame_index + 1):
+                    if src not in keyframes:
+                        keyframes[src] = (
+                            no_keyframes
+                            if args.no_seek
+                            else find_keyframes(src, tl.tb, cache)
+                        )
+                        log.debug(f"Keyframes in {src.path}: {len(keyframes[src][0])}")
+
+                    kf = plan_seek(keyframes[src], frame_index, obj.index)
+                    if kf is not None:
+                        if kf < 0:
+                            log.debug(f"Seek: {frame_index} -> 0")
+                            decoders[src].seek(None)
+                        else:
+                            kf_index = int(keyframes[src][1][kf])
+                            log.debug(f"Seek: {frame_index} -> {kf_index}")
+                            decoders[src].seek(int(keyframes[src][0][kf]))
+                            if kf_index > frame_index:
+                                frames_saved += kf_index - frame_index - 1
+                            else:
+                                frames_saved += kf_index
+                        seeks += 1
+                        frame_index = -1
 
                 while frame_index < obj.index:
-                    # Check if skipping ahead is worth it.
-                    if (
-                        obj.index - frame_index > seek_cost[obj.src]
-                        and frame_index > seek
-                    ):
-                        seek = frame_index + (seek_cost[obj.src] // 2)
-                        seek_frame = frame_index
-                        log.debug(f"Seek: {frame_index} -> {obj.index}")
-                        cns[obj.src].seek(obj.index * tous[obj.src], stream=my_stream)
-
                     try:
-                        frame = next(decoders[obj.src])
-                        frame_index = round(frame.time * tl.tb)
+                        last_frames[src] = next(decoders[src])
+                        frame_index = round(last_frames[src].time * tl.tb)
                     except StopIteration:
                         log.debug(f"No source frame at {index=}. Using null frame")
-                        frame = null_frame
+                        last_frames[src] = null_frame
                         break
 
-                    if seek_frame is not None:
-                        log.debug(f"Skipped {frame_index - seek_frame} frame indexes")
-                        frames_saved += frame_index - seek_frame
-                        seek_frame = None
-                    if frame.key_frame:
-                        log.debug(f"Keyframe {frame_index} {frame.pts}")
+                positions[src] = frame_index
+                frame = last_frames[src]
 
                 if (frame.width, frame.height) != tl.res:
                     width, height = tl.res
-                    graph = av.filter.Graph()
-                    graph.link_nodes(
-                        graph.add_buffer(template=my_stream),
-                        graph.add(
-                            "scale",
-                            f"{width}:{height}:force_original_aspect_ratio=decrease:eval=frame",
-                        ),
-                        graph.add("pad", f"{width}:{height}:-1:-1:color={bg}"),
-                        graph.add("buffersink"),
-                    ).vpush(frame)
+                    size_key: tuple[FileInfo, int, int, str] = (
+                        obj.src,
+                        frame.width,
+                        frame.height,
+                        frame.format.name,
+                    )
+                    if (graph := graphs.get(size_key)) is None:
+                        graph = graphs[size_key] = make_graph(
+                            my_stream,
+                            frame,
+                            (
+                                "scale",
+                                f"{width}:{height}:force_original_aspect_ratio=decrease:eval=frame",
+                            ),
+                            ("pad", f"{width}:{height}:-1:-1:color={bg}"),
+                        )
+                    graph.vpush(frame)
                     frame = graph.vpull()
             elif isinstance(obj, TlRect):
-                graph = av.filter.Graph()
+                fmt = frame.format.name
+                if fmt in PLANAR_YUV and obj.width > 0 and obj.height > 0:
+                    rect_key: tuple[int, int, int, int, str, int, int, str] = (
+                        obj.x,
+                        obj.y,
+                        obj.width,
+                        obj.height,
+                        obj.fill,
+                        frame.width,
+                        frame.height,
+                        fmt,
+                    )
+                    if (blend := blends.get(rect_key)) is None:
+                        blend = blends[rect_key] = rect_blend(obj, frame)
+                    if frame is not drawn:
+                        frame = drawn = copy_frame(frame)
+                    blend.apply(frame)
+                    continue
+
                 x, y = obj.x, obj.y
-                graph.link_nodes(
-                    graph.add_buffer(template=my_stream),
-                    graph.add(
-                        "drawbox",
-                        f"x={x}:y={y}:w={obj.width}:h={obj.height}:color={obj.fill}:t=fill",
-                    ),
-                    graph.add("buffersink"),
-                ).vpush(frame)
+                box = (
+                    f"x={x}:y={y}:w={obj.width}:h={obj.height}:color={obj.fill}:t=fill"
+                )
+                box_key: tuple[str, int, int, str] = (
+                    box,
+                    frame.width,
+                    frame.height,
+                    fmt,
+                )
+                if (graph := graphs.get(box_key)) is None:
+                    graph = graphs[box_key] = make_graph(
+                        my_stream, frame, ("drawbox", box)
+                    )
+                graph.vpush(frame)
                 frame = graph.vpull()
             elif isinstance(obj, TlImage):
                 img = img_cache[(obj.src, obj.width)]
+                fmt = frame.format.name
+                if fmt in PLANAR_YUV:
+                    image_key: tuple[FileInfo, int, int, int, float, int, int, str] = (
+                        obj.src,
+                        obj.width,
+                        obj.x,
+                        obj.y,
+                        obj.opacity,
+                        frame.width,
+                        frame.height,
+                        fmt,
+                    )
+                    if (blend := blends.get(image_key)) is None:
+                        blend = blends[image_key] = image_blend(img, obj, frame)
+                    if frame is not drawn:
+                        frame = drawn = copy_frame(frame)
+                    blend.apply(frame)
+                    continue
+
                 array = frame.to_ndarray(format="rgb24")
 
                 overlay_h, overlay_w, _ = img.shape
@@ -309,4 +831,144 @@ def render_av(
         frame.time_base = 0  # type: ignore
         yield (index, frame)
 
-    log.debug(f"Total frames saved seeking: {frames_saved}")
+    for decoder in decoders.values():
+        decoder.close()
+    if seeks:
+        log.stat("Seeks", seeks)
+        log.stat("Frames skipped by seeking", frames_saved)
+
+
+def split_timeline(tl: v3, count: int, min_len: int) -> list[tuple[int, int]]:
+    """
+    Split the timeline into at most `count` ranges of about the same length and
+    at least `min_len` long. Ranges begin where a clip does if one is close,
+    since then no frames before the range have to be decoded.
+    """
+    cuts = sorted({lobj.start for layer in tl.v for lobj in layer if lobj.dur > 0})
+    count = min(count, max(tl.end // max(min_len, 1), 1))
+    reach = tl.end // count // 4
+
+    bounds = [0]
+    for i in range(1, count):
+        target = tl.end * i // count
+        j = bisect_left(cuts, target)
+        near = [cuts[k] for k in (j - 1, j) if 0 <= k < len(cuts)]
+        cut = min(near, key=lambda c: abs(c - target), default=target)
+        if abs(cut - target) > reach:
+            cut = target
+        if cut - bounds[-1] >= min_len and tl.end - cut >= min_len:
+            bounds.append(cut)
+    bounds.append(tl.end)
+
+    return list(zip(bounds, bounds[1:]))
+
+
+def render_segment(
+    path: str,
+    tl: v3,
+    args: Args,
+    cache: Cache | None,
+    start: int,
+    end: int,
+    threads: int,
+) -> dict[str, int]:
+    log = Log(quiet=True)
+    if cache is not None:
+        cache = replace(cache, log=log)
+
+    with av.open(path, "w") as output:
+        frames = render_av(output, tl, args, cache, log, start, end)
+        output_stream: av.VideoStream = next(frames)  # type: ignore
+        output_stream.codec_context.thread_count = threads
+        for _, frame in frames:
+            output.mux(output_stream.encode(frame))
+        output.mux(output_stream.encode(None))
+    return log.stats
+
+
+def copy_stream_params(stream: av.VideoStream, template: av.VideoStream) -> None:
+    """
+    Describe `stream` like `template`, whose packets it will carry. Without the
+    global header flag, opening the encoder keeps the template's extradata.
+    """
+    cc, tc = stream.codec_context, template.codec_context
+    cc.flags = tc.flags
+    cc.extradata = tc.extradata
+    stream.width = tc.width
+    stream.height = tc.height
+    stream.pix_fmt = tc.pix_fmt
+    stream.bit_rate = tc.bit_rate
+    cc.color_range = tc.color_range
+    cc.colorspace = tc.colorspace
+    cc.color_primaries = tc.color_primaries
+    cc.color_trc = tc.color_trc
+    if tc.profile is not None:
+        cc.profile = tc.profile
+    if template.sample_aspect_ratio is not None:
+        stream.sample_aspect_ratio = template.sample_aspect_ratio
+    if (lang := template.metadata.get("language")) is not None:
+        stream.metadata["language"] = lang
+
+
+def render_parallel(
+    output: av.container.OutputContainer,
+    tl: v3,
+    args: Args,
+    cache: Cache | None,
+    log: Log,
+) -> Iterator[tuple[int, av.VideoFrame | av.Packet]]:
+    """
+    Render ranges of the timeline in `args.render_workers` processes, then yield
+    the encoded packets of each range in order, shifted to where it starts.
+    """
+    # Ranges shorter than this aren't worth starting a process for.
+    ranges = split_timeline(tl, args.render_workers, int(tl.tb * 10))
+    if len(ranges) < 2:
+        yield from render_av(output, tl, args, cache, log)
+        return
+
+    log.debug(f"Render ranges: {ranges}")
+    ext = os.path.splitext(output.name)[1]
+    paths = [os.path.join(log.temp, f"range{i}{ext}") for i in range(len(ranges))]
+    threads = max((os.cpu_count() or 1) // len(ranges), 1)
+
+    # The stream is needed before any range is done, so that audio can be set up
+    # meanwhile. It takes the parameters of the first range before anything is
+    # muxed.
+    output_stream = output.add_stream(args.video_codec, rate=tl.tb)
+    if not isinstance(output_stream, av.VideoStream):
+        log.error(f"Not a known video codec: {args.video_codec}")
+
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [
+            pool.submit(render_segment, path, tl, args, cache, start, end, threads)
+            for path, (start, end) in zip(paths, ranges)
+        ]
+        yield output_stream  # type: ignore
+
+        for i, (path, (start, _), future) in enumerate(zip(paths, ranges, futures)):
+            try:
+                for name, value in future.result().items():
+                    log.stat(name, value)
+            except SystemExit:
+                log.error("Render worker failed")  # It has already said why.
+            except Exception as e:
+                log.error(f"Render worker failed: {e}")
+
+            with av.open(path) as cn:
+                stream = cn.streams.video[0]
+                if i == 0:
+                    copy_stream_params(output_stream, stream)
+
+                assert stream.time_base is not None
+                offset = round(Fraction(start) / tl.tb / stream.time_base)
+                to_index = stream.time_base * tl.tb
+                for packet in cn.demux(stream):
+                    if packet.dts is None:
+                        continue
+                    packet.dts += offset
+                    if packet.pts is not None:
+                        packet.pts += offset
+                    packet.stream = output_stream
+                    yield (round(packet.dts * to_index), packet)
+            os.remove(path)
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import os
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from hashlib import sha1
+from shutil import rmtree
+from tempfile import NamedTemporaryFile, gettempdir
+from time import time
+from typing import TYPE_CHECKING, cast
+
+import numpy as np
+
+from auto_editor import __version__
+from auto_editor.json import dump, load
+from auto_editor.lib.err import MyError
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+    from typing import IO
+
+    from numpy.typing import NDArray
+
+    from auto_editor.utils.log import Log
+
+    Index = dict[str, dict[str, float]]
+
+
+DEFAULT_SIZE = 1 << 30
+# Bytes read from each end of a file when keying on its contents.
+SAMPLE_SIZE = 1 << 20
+# A hit only records its access time once the recorded one is this many seconds
+# old, like `relatime`. Ordering entries used minutes apart barely changes what
+# gets evicted, and every record costs a locked rewrite of the index.
+ATIME_RESOLUTION = 600
+
+
+def default_dir() -> str:
+    return os.path.join(gettempdir(), f"ae-{__version__}")
+
+
+@dataclass(slots=True)
+class Cache:
+    """
+    Analysis results stored on disk, evicted least recently used first once
+    their total size goes over `budget` bytes.
+
+    Entries are plain `.npy` files that are memory-mapped when read. Sizes and
+    access times live in an index file so that nothing has to scan the directory.
+
+    Several processes can share one cache: files are written under a temporary
+    name and renamed into place, and the index is only changed under a lock.
+
+    Entries this object has read or written are never evicted by it, so a run
+    doesn't throw out what it has just made. An entry bigger than the whole
+    budget isn't stored.
+    """
+
+    root: str
+    budget: int
+    content_keys: bool
+    log: Log
+    used: set[str] = field(default_factory=set)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, "index.json")
+
+    def entry_path(self, name: str, ext: str = ".npy") -> str:
+        return os.path.join(self.root, f"{name}{ext}")
+
+    def source_key(self, path: Path) -> str:
+        """
+        Identify a source by its name, size and modification time. With
+        `content_keys`, hash its size and both ends of it instead, so copies
+        and renamed files share entries.
+        """
+        stat = path.stat()
+        if not self.content_keys:
+            return f"{path.name}:{stat.st_size:x}:{int(stat.st_mtime):x}"
+
+        hasher = sha1(f"{stat.st_size}".encode())
+        with open(path, "rb") as f:
+            hasher.update(f.read(SAMPLE_SIZE))
+            if stat.st_size > SAMPLE_SIZE:
+                f.seek(max(stat.st_size - SAMPLE_SIZE, SAMPLE_SIZE))
+                hasher.update(f.read())
+        return hasher.hexdigest()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, "index.lock"), "a+b") as f:
+            if sys.platform == "win32":
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def write_temp(self, mode: str, write: Callable[[IO], None]) -> str:
+        """
+        Write a file that other processes won't look at. Renaming it into place
+        afterwards means they see either nothing or all of it.
+        """
+        with NamedTemporaryFile(mode, dir=self.root, suffix=".tmp", delete=False) as f:
+            try:
+                write(f)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        # Temporary files are only readable by their owner.
+        os.chmod(f.name, 0o644)
+        return f.name
+
+    def read_index(self) -> Index:
+        try:
+            with open(self.index_path) as f:
+                data = load(self.index_path, f)
+            assert isinstance(data, dict)
+            return cast("Index", data)
+        except FileNotFoundError:
+            pass
+        except (OSError, MyError, AssertionError) as e:
+            self.log.debug(f"Rebuilding cache index: {e}")
+
+        # Only a missing or damaged index makes us look at the directory.
+        index: Index = {}
+        if os.path.isdir(self.root):
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    name, ext = os.path.splitext(entry.name)
+                    # Older versions left `.npz` files, which can only be evicted.
+                    if ext in {".npy", ".npz"}:
+                        stat = entry.stat()
+                        index[name] = {
+                            "size": stat.st_size,
+                            "atime": stat.st_mtime,
+                        }
+        return index
+
+    def write_index(self, index: Index) -> None:
+        try:
+            os.replace(self.write_temp("w", lambda f: dump(index, f)), self.index_path)
+        except OSError as e:
+            self.log.warning(f"Cache index write failed: {e}")
+
+    def get(self, name: str) -> NDArray | None:
+        path = self.entry_path(name)
+        try:
+            arr = np.load(path, mmap_mode="r", allow_pickle=False)
+        except Exception as e:
+            self.log.debug(e)
+            return None
+
+        self.used.add(name)
+        # The index is replaced whole, so it can be read without the lock.
+        entry = self.read_index().get(name)
+        if entry is not None and time() - entry["atime"] < ATIME_RESOLUTION:
+            return arr
+
+        try:
+            with self.locked():
+                index = self.read_index()
+                index[name] = {"size": os.path.getsize(path), "atime": time()}
+                self.write_index(index)
+        except OSError as e:
+            self.log.debug(e)
+        return arr
+
+    def put(self, name: str, arr: NDArray) -> None:
+        self.put_file(name, lambda f: np.save(f, arr, allow_pickle=False))
+
+    def put_file(self, name: str, write: Callable[[IO], None]) -> None:
+        """Add an entry whose `.npy` file is made by `write`."""
+        path = self.entry_path(name)
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            temp = self.write_temp("wb", write)
+            if (size := os.path.getsize(temp)) > self.budget:
+                os.remove(temp)
+                self.log.warning(
+                    f"Not caching {name}: {size} bytes is over the cache size"
+                )
+                return
+            with self.locked():
+                os.replace(temp, path)
+                self.used.add(name)
+                index = self.read_index()
+                index[name] = {"size": size, "atime": time()}
+                self.evict(index)
+                self.write_index(index)
+        except Exception as e:
+            self.log.warning(f"Cache write failed: {e}")
+
+    def evict(self, index: Index) -> None:
+        total = sum(entry["size"] for entry in index.values())
+        for name in sorted(index, key=lambda name: index[name]["atime"]):
+            if total <= self.budget:
+                break
+            if name in self.used:
+                continue
+
+            try:
+                for ext in (".npy", ".npz"):
+                    if os.path.exists(path := self.entry_path(name, ext)):
+                        os.remove(path)
+            except OSError as e:
+                self.log.debug(e)
+                continue
+            total -= index.pop(name)["size"]
+
+    def clear(self) -> None:
+        rmtree(self.root, ignore_errors=True)
@@ -56,32 +56,33 @@ def to_timecode(secs: float | Fraction, fmt: str) -> str:
     raise ValueError("to_timecode: Unreachable")
 
 
+def cover(length: int, starts: NDArray[np.intp], ends: NDArray[np.intp]) -> BoolList:
+    """Mark every index inside any of the half-open ranges [starts, ends)."""
+    marks = np.bincount(starts, minlength=length + 1) - np.bincount(
+        ends, minlength=length + 1
+    )
+    return np.cumsum(marks[:length]) > 0
+
+
 def mut_margin(arr: BoolList, start_m: int, end_m: int) -> None:
     # Find start and end indexes
-    start_index = []
-    end_index = []
     arrlen = len(arr)
-    for j in range(1, arrlen):
-        if arr[j] != arr[j - 1]:
-            if arr[j]:
-                start_index.append(j)
-            else:
-                end_index.append(j)
+    edges = np.flatnonzero(arr[1:] != arr[:-1]) + 1
+    rising = arr[edges].astype(np.bool_)
+    start_index, end_index = edges[rising], edges[~rising]
 
     # Apply margin
     if start_m > 0:
-        for i in start_index:
-            arr[max(i - start_m, 0) : i] = True
+        arr[cover(arrlen, np.maximum(start_index - start_m, 0), start_index)] = True
     if start_m < 0:
-        for i in start_index:
-            arr[i : min(i - start_m, arrlen)] = False
+        arr[cover(arrlen, start_index, np.minimum(start_index - start_m, arrlen))] = (
+            False
+        )
 
     if end_m > 0:
-        for i in end_index:
-            arr[i : min(i + end_m, arrlen)] = True
+        arr[cover(arrlen, end_index, np.minimum(end_index + end_m, arrlen))] = True
     if end_m < 0:
-        for i in end_index:
-            arr[max(i + end_m, 0) : i] = False
+        arr[cover(arrlen, np.maximum(end_index + end_m, 0), end_index)] = False
 
 
 def get_stdout(cmd: list[str]) -> str:
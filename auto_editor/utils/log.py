@@ -7,7 +7,16 @@ from typing import NoReturn
 
 
 class Log:
-    __slots__ = ("is_debug", "quiet", "machine", "no_color", "_temp", "_ut", "_s")
+    __slots__ = (
+        "is_debug",
+        "quiet",
+        "machine",
+        "no_color",
+        "stats",
+        "_temp",
+        "_ut",
+        "_s",
+    )
 
     def __init__(
         self,
@@ -21,6 +30,8 @@ class Log:
         self.quiet = quiet
         self.machine = machine
         self.no_color = no_color
+        # Totals shown when the timer stops.
+        self.stats: dict[str, int] = {}
         self._temp: str | None = None
         self._ut = temp_dir
         self._s = 0 if self.quiet or self.machine else perf_counter()
@@ -88,8 +99,13 @@ class Log:
             self.conwrite("")
             sys.stderr.write(f"Warning! {message}\n")
 
+    def stat(self, name: str, value: int) -> None:
+        self.stats[name] = self.stats.get(name, 0) + value
+
     def stop_timer(self) -> None:
         if not self.quiet and not self.machine:
+            for name, value in self.stats.items():
+                sys.stdout.write(f"{name}: {value}\n")
             second_len = round(perf_counter() - self._s, 2)
             minute_len = timedelta(seconds=round(second_len))
 
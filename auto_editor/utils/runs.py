@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+
+def run_starts(arr: NDArray) -> NDArray[np.intp]:
+    """Return the index where each run of equal values begins."""
+    if len(arr) == 0:
+        return np.array([], dtype=np.intp)
+
+    edges = np.flatnonzero(arr[1:] != arr[:-1]) + 1
+    return np.concatenate((np.zeros(1, dtype=np.intp), edges))
+
+
+def run_lengths(arr: NDArray, starts: NDArray[np.intp]) -> NDArray[np.intp]:
+    return np.diff(starts, append=len(arr))
+
+
+def mut_fill_runs(
+    arr: NDArray, lengths: NDArray[np.intp], mask: NDArray[np.bool_], with_: int
+) -> None:
+    """Set every element of each run selected by `mask` to `with_`."""
+    if mask.any():
+        arr[np.repeat(mask, lengths)] = with_